@@ -1,32 +1,239 @@
 import os
-import google.generativeai as genai
-from flask import Flask, request, jsonify
+import numpy as np
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import time
 import json
 import traceback # 导入 traceback 用于打印详细错误信息
-
-# --- 在这里粘贴您从Google获取的API密钥 ---
-GEMINI_API_KEY = "Gemini密钥"
-
-### --- 代理配置 (根据您的Clash配置) ---
-os.environ['HTTP_PROXY'] = '自己代理地址'
-os.environ['HTTPS_PROXY'] = '自己代理地址'
-### --- 代理配置结束 ---
-
-
-# 配置AI模型
+from session_store import DEFAULT_SESSION_STORE_PATH, JsonLinesSessionStore, open_session_store
+from trajectory_ingest import decode_point_batch, validate_session_data
+from trajectory_simplify import (MAX_DISPLACEMENT_M, PATH_TOLERANCE_M, STATIONARY_RADIUS_M, simplify_session,
+                                 strip_client_weights)
+from write_queue import WriteBehindQueue, fsync_policy_from_env
+from density_tiles import DEFAULT_TILE_DIR, DensityTileStore, tile_in_range
+from ai_cache import DEFAULT_CACHE_DB, ResponseCache, make_cache_key
+from llm_gateway import GatewayBusyError, GatewayTimeoutError, LLMGateway
+from conversation_store import ConversationStore, truncate_text, validate_messages
+from single_flight import SingleFlight
+from llm_backends import GEMINI_MODEL_NAME, create_backend_from_env
+from metrics import PROMETHEUS_CONTENT_TYPE, FlaskMetrics, MetricsRegistry
+from hotspot_model import DEFAULT_MODEL_DIR, FEATURE_NAMES, HotspotModelService
+
+# 配置AI模型：API密钥与代理配置见 llm_backends.py；
+# 设置环境变量 AI_BACKEND=mock 可改用本地模拟后端 (无需密钥和代理，用于压测和离线开发)
 try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    print("AI模型初始化成功。")
+    model = create_backend_from_env()
+    print(f"AI模型初始化成功 (后端: {model.model_name})。")
 except Exception as e:
     print(f"API密钥配置或模型初始化失败，请检查您的密钥是否正确或网络是否畅通: {e}")
     model = None
 
+# 缓存键中包含模型名称，模拟后端的回复不会与 Gemini 的回复混用
+MODEL_NAME = model.model_name if model else GEMINI_MODEL_NAME
+
+# 会话存储 (追加写入，替代每次整体重写 user_sessions_data.json)
+# 可通过环境变量切换为 SQLite，例如 SESSION_STORE_PATH=user_sessions.sqlite3
+SESSION_STORE_PATH = os.environ.get('SESSION_STORE_PATH', DEFAULT_SESSION_STORE_PATH)
+session_store = open_session_store(SESSION_STORE_PATH, writable=True)
+# 用户行为日志同样改为分段 JSON Lines 追加写入 (原 user_behavior_log.json 每次整体重写)
+BEHAVIOR_LOG_PATH = os.environ.get('BEHAVIOR_LOG_PATH', 'user_behavior_log')
+behavior_log_store = JsonLinesSessionStore(BEHAVIOR_LOG_PATH)
+
+# 运行指标 (Prometheus 文本格式，由 /metrics 接口输出)
+metrics_registry = MetricsRegistry()
+write_commit_seconds = metrics_registry.histogram(
+    'write_queue_commit_duration_seconds', 'Time spent in one group commit of the write-behind queue.', ('fsync',))
+write_commit_records = metrics_registry.histogram(
+    'write_queue_commit_records', 'Records written per group commit.',
+    buckets=(1, 5, 10, 50, 100, 250, 500, 1000))
+llm_upstream_seconds = metrics_registry.histogram(
+    'llm_upstream_duration_seconds', 'Duration of upstream model calls run by the gateway.', ('mode', 'outcome'))
+trajectory_points = metrics_registry.counter(
+    'trajectory_points_total', 'Cursor samples received and stored after ingest-time simplification.', ('stage',))
+llm_first_token_seconds = metrics_registry.histogram(
+    'llm_time_to_first_token_seconds', 'Time until the first streamed text chunk arrives from the model.',
+    ('label',))
+
+
+def _observe_write_commit(records, seconds, fsync):
+    write_commit_seconds.observe(seconds, fsync=str(fsync).lower())
+    write_commit_records.observe(records)
+
+
+def _observe_llm_upstream(mode, seconds, failed):
+    llm_upstream_seconds.observe(seconds, mode=mode, outcome='error' if failed else 'ok')
+
+
+# 后台单写线程：请求处理函数只入队，由写线程组提交到上面两个存储
+# fsync 策略可通过环境变量 WRITE_FSYNC_POLICY=always/interval/never 配置
+write_queue = WriteBehindQueue(
+    {'session': session_store, 'behavior': behavior_log_store},
+    maxsize=int(os.environ.get('WRITE_QUEUE_MAXSIZE', 10000)),
+    fsync_policy=fsync_policy_from_env(),
+    on_commit=_observe_write_commit,
+)
+
+# AI讲解响应缓存：讲解内容完全由 (地点名称, 年份) 决定，命中时无需再调用 Gemini
+ai_response_cache = ResponseCache(
+    os.environ.get('AI_CACHE_DB', DEFAULT_CACHE_DB),
+    ttl_s=float(os.environ.get('AI_CACHE_TTL_S', 30 * 24 * 3600)),
+)
+
+# 大模型调用网关：在独立线程池中执行 Gemini 调用，限制并发数与排队数，并为每次调用设置超时
+llm_gateway = LLMGateway(
+    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 4)),
+    max_queue=int(os.environ.get('LLM_MAX_QUEUE', 16)),
+    timeout_s=float(os.environ.get('LLM_TIMEOUT_S', 60)),
+    on_upstream=_observe_llm_upstream,
+)
+
+# 单飞请求合并：同一时刻相同的讲解请求 (如一个旅行团同时点开同一标记) 只调用一次 Gemini
+description_flights = SingleFlight()
+
+# 服务端对话会话：客户端只发送会话ID和新的一轮消息，发送给模型前按 token 预算截断历史
+conversation_store = ConversationStore(
+    max_conversations=int(os.environ.get('CHAT_MAX_CONVERSATIONS', 1000)),
+    idle_ttl_s=float(os.environ.get('CHAT_IDLE_TTL_S', 3600)),
+    token_budget=int(os.environ.get('CHAT_TOKEN_BUDGET', 4000)),
+)
+
+# 入库前的轨迹简化：合并光标悬停产生的驻留点 (保留驻留时长)，并在米级容差内做路径简化，
+# 每个保存的点带 weight (代表的原始采样数)，分析脚本按权重计分。设置 TRAJECTORY_SIMPLIFY=0 可关闭
+TRAJECTORY_SIMPLIFY = os.environ.get('TRAJECTORY_SIMPLIFY', '1') != '0'
+TRAJECTORY_STATIONARY_RADIUS_M = float(os.environ.get('TRAJECTORY_STATIONARY_RADIUS_M', STATIONARY_RADIUS_M))
+TRAJECTORY_TOLERANCE_M = float(os.environ.get('TRAJECTORY_TOLERANCE_M', PATH_TOLERANCE_M))
+TRAJECTORY_MAX_DISPLACEMENT_M = float(os.environ.get('TRAJECTORY_MAX_DISPLACEMENT_M', MAX_DISPLACEMENT_M))
+
+
+# 简化会话轨迹并累计压缩统计，返回 (原始点数, 保存点数)；
+# 客户端上传的 weight / dwell_ms 一律丢弃 (关闭简化时同样如此)
+def _simplify_session_points(session_data):
+    strip_client_weights(session_data.get('location_history'))
+    if not TRAJECTORY_SIMPLIFY:
+        point_count = len(session_data.get('location_history') or [])
+        return point_count, point_count
+    stats = simplify_session(session_data, TRAJECTORY_STATIONARY_RADIUS_M, TRAJECTORY_TOLERANCE_M,
+                             TRAJECTORY_MAX_DISPLACEMENT_M)
+    trajectory_points.inc(stats['raw_points'], stage='received')
+    trajectory_points.inc(stats['stored_points'], stage='stored')
+    print(f"轨迹简化: {stats['raw_points']} 个采样点 -> {stats['stored_points']} 个 "
+          f"(驻留合并后 {stats['collapsed_points']} 个，压缩比 {stats['compression_ratio']:.1f}x)")
+    return stats['raw_points'], stats['stored_points']
+
+
+# 景点热点 SVR 模型 (由 session_analyzer.py 训练并按版本保存)，第一次预测请求时加载
+hotspot_model_service = HotspotModelService(os.environ.get('HOTSPOT_MODEL_DIR', DEFAULT_MODEL_DIR))
+# 单次批量预测允许的最大坐标数
+MAX_HOTSPOT_BATCH = int(os.environ.get('MAX_HOTSPOT_BATCH', 10000))
+
+# 用户活动密度瓦片 (由 session_analyzer.py --tiles 生成)
+density_tile_store = DensityTileStore(os.environ.get('DENSITY_TILE_DIR', DEFAULT_TILE_DIR))
+
 # 创建Flask后端应用
 app = Flask(__name__)
 CORS(app)
+FlaskMetrics(app, metrics_registry)
+
+# 队列深度等瞬时值与各组件自行累计的计数在抓取 /metrics 时读取
+def _llm_gateway_queue_metrics():
+    stats = llm_gateway.stats()
+    return {('in_flight',): stats['in_flight'], ('queued',): stats['queued']}
+
+
+def _llm_gateway_rejection_metrics():
+    stats = llm_gateway.stats()
+    return {('busy',): stats['rejected'], ('timeout',): stats['timeouts']}
+
+
+metrics_registry.gauge_callback(
+    'write_queue_depth', 'Records waiting in the write-behind queue.', lambda: write_queue.stats()['queue_depth'])
+metrics_registry.counter_callback(
+    'write_queue_rejected_total', 'Writes rejected because the queue was full.',
+    lambda: write_queue.stats()['rejected'])
+metrics_registry.gauge_callback(
+    'llm_gateway_requests', 'Model calls currently running or waiting in the gateway.',
+    _llm_gateway_queue_metrics, ('state',))
+metrics_registry.counter_callback(
+    'llm_gateway_rejected_total', 'Model calls rejected or timed out by the gateway.',
+    _llm_gateway_rejection_metrics, ('reason',))
+metrics_registry.gauge_callback(
+    'ai_cache_hit_ratio', 'Hit ratio of the AI description cache.', lambda: ai_response_cache.stats()['hit_ratio'])
+metrics_registry.gauge_callback(
+    'single_flight_collapse_ratio', 'Share of AI description requests served by another in-flight call.',
+    lambda: description_flights.stats()['collapse_ratio'])
+metrics_registry.gauge_callback(
+    'chat_active_conversations', 'Conversations held in server memory.',
+    lambda: conversation_store.stats()['active_conversations'])
+
+
+# Prometheus 抓取接口
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+# 网关拒绝 (繁忙) 返回 503，超时返回 504
+def _gateway_error_response(error):
+    print(f"AI网关: {error}")
+    status = 503 if isinstance(error, GatewayBusyError) else 504
+    response = jsonify({"error": str(error)})
+    if status == 503:
+        response.headers['Retry-After'] = '2'
+    return response, status
+
+
+# AI网关状态接口 (进行中/排队中的调用数、拒绝与超时次数)
+@app.route('/api/llm_gateway_stats', methods=['GET'])
+def llm_gateway_stats():
+    return jsonify(llm_gateway.stats())
+
+
+# 模型回复为空 (数据块全部被安全策略拦截等) 时的错误信息；空回复不写入缓存，也不记入对话历史
+EMPTY_REPLY_MESSAGE = "模型没有返回任何文本 (可能被安全策略拦截)"
+
+
+def build_description_prompt(name, year):
+    return f"请你扮演一位博学的历史导游，用生动、引人入胜的语言，为游客详细介绍一下与“{name}”相关的、在{year}年前后发生的历史事件、背景和意义。语言要流畅，内容要有深度，大约200字左右。"
+
+
+def description_cache_key(name, year):
+    return make_cache_key('ai-description', MODEL_NAME, name, str(year))
+
+
+# 单飞合并使用的键：由规范化后的提示词 (去除首尾及多余空白) 决定
+def description_flight_key(prompt):
+    return make_cache_key('ai-description-flight', MODEL_NAME, ' '.join(prompt.split()))
+
+
+# 生成 (或从缓存读取) 某地点的AI讲解，返回 (格式化文本, 是否命中缓存)；
+# 缓存未命中时，并发的相同请求合并为一次上游调用
+def generate_description(name, year):
+    cache_key = description_cache_key(name, year)
+    cached_text = ai_response_cache.get(cache_key)
+    if cached_text is not None:
+        print(f"“{name}”的AI讲解命中缓存。")
+        return cached_text, True
+
+    prompt = build_description_prompt(name, year)
+
+    def call_model():
+        print(f"正在为“{name}”生成AI讲解...")
+        start_time = time.time()
+        response = llm_gateway.call(model.generate_content, prompt)
+        end_time = time.time()
+        print(f"Gemini API 讲解调用耗时: {end_time - start_time:.2f} 秒")
+
+        formatted_text = response.text.replace('\n', '<br>')
+        if not formatted_text.strip():
+            raise ValueError(EMPTY_REPLY_MESSAGE)
+        ai_response_cache.set(cache_key, formatted_text)
+        return formatted_text
+
+    formatted_text, shared = description_flights.do(description_flight_key(prompt), call_model,
+                                                    timeout_s=llm_gateway.timeout_s)
+    if shared:
+        print(f"“{name}”的AI讲解与进行中的相同请求合并。")
+    return formatted_text, False
 
 
 # 定义一个API接口，路径为 /api/get-ai-description (用于地图讲解)
@@ -42,52 +249,310 @@ def get_ai_description():
     if not name or not year:
         return jsonify({"error": "请求中缺少地点名称或年份信息"}), 400
 
-    prompt = f"请你扮演一位博学的历史导游，用生动、引人入胜的语言，为游客详细介绍一下与“{name}”相关的、在{year}年前后发生的历史事件、背景和意义。语言要流畅，内容要有深度，大约200字左右。"
-
-    print(f"正在为“{name}”生成AI讲解...")
-
     try:
-        start_time = time.time()
-        response = model.generate_content(prompt)
-        end_time = time.time()
-        print(f"Gemini API 讲解调用耗时: {end_time - start_time:.2f} 秒")
-
-        formatted_text = response.text.replace('\n', '<br>')
+        formatted_text, cached = generate_description(name, year)
         print("AI讲解生成成功！")
-        return jsonify({"text": formatted_text})
+        return jsonify({"text": formatted_text, "cached": cached})
+    except (GatewayBusyError, GatewayTimeoutError) as e:
+        return _gateway_error_response(e)
     except Exception as e:
         print(f"AI讲解内容生成失败: {e}")
         return jsonify({"error": f"AI讲解内容生成失败: {str(e)}。请检查网络连接和API密钥。"}), 500
 
 
+# 单飞请求合并状态接口 (总请求数、实际上游调用数、被合并的请求数与合并比例)
+@app.route('/api/single_flight_stats', methods=['GET'])
+def single_flight_stats():
+    return jsonify(description_flights.stats())
+
+
+# AI讲解缓存状态接口 (命中/未命中次数、条目数、磁盘占用)
+@app.route('/api/ai_cache_stats', methods=['GET'])
+def ai_cache_stats():
+    return jsonify(ai_response_cache.stats())
+
+
+# 预热缓存：为所有地图标记提前生成AI讲解。地点取自 map.py 生成标记所用的 map_markers.py，
+# 年份与弹窗一样转为字符串，预热的缓存键与弹窗发出的请求完全一致
+def prewarm_description_cache():
+    from map_markers import all_markers_data
+
+    if not model:
+        print("AI模型未能成功初始化，无法预热缓存。")
+        return
+    locations = [marker for marker in all_markers_data if marker.get('name') and marker.get('year')]
+    generated = 0
+    for loc in locations:
+        try:
+            _, cached = generate_description(loc['name'], str(loc['year']))
+            generated += 0 if cached else 1
+        except Exception as e:
+            print(f"预热“{loc['name']}”的AI讲解失败: {e}")
+    print(f"缓存预热完成: 共 {len(locations)} 个地点，新生成 {generated} 条讲解。")
+
+
+# 解析对话请求，返回 (会话ID, 新的用户消息, 发送给模型的上下文)。
+# 新格式: {"conversation_id": ..., "message": "...", "initial_message": "..."}，历史保存在服务端；
+# 会话ID缺失或已被淘汰时新建会话 (以 initial_message 作为固定保留的开头消息)。
+# 旧格式 {"messages": [...]} 仍然兼容，此时不保存会话，仅做 token 预算截断。
+# 请求体格式不对时抛出 ValueError (由调用方返回 400)
+def _resolve_chat_request(data):
+    if not isinstance(data, dict):
+        raise ValueError("请求体应为 JSON 对象")
+    messages = data.get('messages')
+    if messages:
+        validate_messages(messages)
+        return None, None, conversation_store.truncate(messages)
+
+    text = data.get('message') or ''
+    initial_message = data.get('initial_message') or ''
+    conversation_id = data.get('conversation_id')
+    if not isinstance(text, str) or not isinstance(initial_message, str):
+        raise ValueError("message 与 initial_message 应为字符串")
+    if conversation_id is not None and not isinstance(conversation_id, str):
+        raise ValueError("conversation_id 应为字符串")
+    text = text.strip()
+    if not text:
+        return None, None, None
+    # 客户端提供的开头消息会固定保留在每次请求的上下文中，按 MAX_PINNED_TOKENS 截断
+    initial_message = truncate_text(initial_message)
+    initial_messages = [{'role': 'model', 'parts': [{'text': initial_message}]}] if initial_message else []
+    user_message = {'role': 'user', 'parts': [{'text': text}]}
+    conversation_id, context = conversation_store.get_or_create(conversation_id, initial_messages, user_message)
+    return conversation_id, user_message, context
+
+
+def _record_chat_turn(conversation_id, user_message, ai_reply):
+    if conversation_id is not None:
+        conversation_store.append_turn(conversation_id, user_message, {'role': 'model', 'parts': [{'text': ai_reply}]})
+
+
+# 对话会话状态接口 (活跃会话数、淘汰次数、被截断的请求数等)
+@app.route('/api/chat_stats', methods=['GET'])
+def chat_stats():
+    return jsonify(conversation_store.stats())
+
+
 # 对话API接口，路径为 /api/chat
 @app.route('/api/chat', methods=['POST'])
 def chat_with_ai():
     if not model:
         return jsonify({"error": "AI模型未能成功初始化，请检查服务器端的API密钥或网络连接。"}), 500
 
-    data = request.json
-    messages = data.get('messages')
+    try:
+        conversation_id, user_message, contents = _resolve_chat_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": f"请求格式错误: {e}"}), 400
 
-    if not messages:
-        return jsonify({"error": "请求中缺少对话消息历史"}), 400
+    if not contents:
+        return jsonify({"error": "请求中缺少对话消息"}), 400
 
-    print(f"正在进行AI对话，当前消息数: {len(messages)}...")
+    print(f"正在进行AI对话，发送给模型的消息数: {len(contents)}...")
 
     try:
         start_time = time.time()
-        response = model.generate_content(messages)
+        response = llm_gateway.call(model.generate_content, contents)
         end_time = time.time()
         print(f"Gemini API 对话调用耗时: {end_time - start_time:.2f} 秒")
 
         ai_reply = response.text
+        if not ai_reply.strip():
+            raise ValueError(EMPTY_REPLY_MESSAGE)
+        _record_chat_turn(conversation_id, user_message, ai_reply)
         print("AI对话回复生成成功！")
-        return jsonify({"text": ai_reply})
+        return jsonify({"text": ai_reply, "conversation_id": conversation_id})
+    except (GatewayBusyError, GatewayTimeoutError) as e:
+        return _gateway_error_response(e)
     except Exception as e:
         print(f"AI对话回复生成失败: {e}")
         return jsonify({"error": f"AI对话回复生成失败: {str(e)}。请检查网络连接和API密钥。"}), 500
 
 
+# 把一条消息编码为 Server-Sent Events 格式
+def _sse_event(data, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return prefix + f'data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+def _sse_response(generator):
+    response = Response(stream_with_context(generator), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 禁止反向代理缓冲，保证逐块送达
+    return response
+
+
+# 逐块产出模型流中的文本，同时记录首字节耗时 (TTFB) 与总耗时；没有任何文本时抛出 ValueError
+def _stream_model_text(chunks, label, start_time):
+    first_chunk_time = None
+    for chunk in chunks:
+        try:
+            text = chunk.text
+        except ValueError:
+            # 被安全策略拦截等情况下的数据块不含文本
+            continue
+        if not text:
+            continue
+        if first_chunk_time is None:
+            first_chunk_time = time.time()
+            llm_first_token_seconds.observe(first_chunk_time - start_time, label=label)
+            print(f"Gemini API {label}首字节耗时: {first_chunk_time - start_time:.2f} 秒")
+        yield text
+    print(f"Gemini API {label}调用耗时: {time.time() - start_time:.2f} 秒")
+    if first_chunk_time is None:
+        # 全部数据块都被拦截或为空：按失败处理，调用方不会缓存或记录空回复
+        raise ValueError(EMPTY_REPLY_MESSAGE)
+
+
+# 打开模型流并等到第一段文本，返回产出全部文本的生成器。网关繁忙 (GatewayBusyError) 或
+# 首段文本超时 (GatewayTimeoutError) 在这里直接抛出，调用方可以在发送 SSE 响应头之前返回 503/504
+def _open_model_stream(contents, label):
+    start_time = time.time()
+    chunks = llm_gateway.stream(lambda: model.generate_content(contents, stream=True))
+    texts = _stream_model_text(chunks, label, start_time)
+    try:
+        first_text = next(texts)
+    except BaseException:
+        chunks.close()
+        raise
+
+    def generate():
+        yield first_text
+        yield from texts
+
+    return generate()
+
+
+# 在发送响应头之前就已失败 (非网关错误) 的流式请求：以单个 error 事件返回，与流式过程中的失败一致
+def _sse_error_response(message):
+    return _sse_response(iter([_sse_event({"error": message}, event='error')]))
+
+
+# 流式AI讲解接口：以 SSE 逐块返回讲解文本，命中缓存时一次性返回完整文本
+@app.route('/api/get-ai-description/stream', methods=['POST'])
+def get_ai_description_stream():
+    if not model:
+        return jsonify({"error": "AI模型未能成功初始化，请检查服务器端的API密钥或网络连接。"}), 500
+
+    data = request.json
+    name = data.get('name')
+    year = data.get('year')
+
+    if not name or not year:
+        return jsonify({"error": "请求中缺少地点名称或年份信息"}), 400
+
+    cache_key = description_cache_key(name, year)
+    cached_text = ai_response_cache.get(cache_key)
+    if cached_text is not None:
+        print(f"“{name}”的AI讲解命中缓存。")
+        return _sse_response(iter([_sse_event({"text": cached_text}), _sse_event({"cached": True}, event='done')]))
+
+    prompt = build_description_prompt(name, year)
+    flight_key = description_flight_key(prompt)
+    flight, is_leader = description_flights.begin(flight_key)
+    if not is_leader:
+        # 已有相同的请求正在生成，等待其完整结果后一次性返回
+        print(f"“{name}”的AI讲解与进行中的相同请求合并。")
+
+        def wait_shared():
+            try:
+                text = description_flights.wait(flight, llm_gateway.timeout_s)
+                yield _sse_event({"text": text})
+                yield _sse_event({"cached": False, "shared": True}, event='done')
+            except Exception as e:
+                print(f"AI讲解内容生成失败: {e}")
+                yield _sse_event({"error": f"AI讲解内容生成失败: {str(e)}。请检查网络连接和API密钥。"}, event='error')
+
+        return _sse_response(wait_shared())
+
+    print(f"正在为“{name}”流式生成AI讲解...")
+    try:
+        texts = _open_model_stream(prompt, '讲解')
+    except Exception as e:
+        description_flights.finish(flight_key, flight, error=e)
+        if isinstance(e, (GatewayBusyError, GatewayTimeoutError)):
+            return _gateway_error_response(e)
+        print(f"AI讲解内容生成失败: {e}")
+        return _sse_error_response(f"AI讲解内容生成失败: {str(e)}。请检查网络连接和API密钥。")
+
+    def generate():
+        parts = []
+        error = None
+        try:
+            for text in texts:
+                formatted_text = text.replace('\n', '<br>')
+                parts.append(formatted_text)
+                yield _sse_event({"text": formatted_text})
+            ai_response_cache.set(cache_key, ''.join(parts))
+            print("AI讲解生成成功！")
+            yield _sse_event({"cached": False}, event='done')
+        except GeneratorExit:
+            # 客户端中途断开，等待中的相同请求改为收到错误
+            error = ConnectionAbortedError("生成相同讲解的请求已中断")
+            raise
+        except Exception as e:
+            error = e
+            print(f"AI讲解内容生成失败: {e}")
+            yield _sse_event({"error": f"AI讲解内容生成失败: {str(e)}。请检查网络连接和API密钥。"}, event='error')
+        finally:
+            description_flights.finish(flight_key, flight, result=''.join(parts), error=error)
+
+    return _sse_response(generate())
+
+
+# 流式对话接口：以 SSE 逐块返回AI回复，结束事件中带回会话ID
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_with_ai_stream():
+    if not model:
+        return jsonify({"error": "AI模型未能成功初始化，请检查服务器端的API密钥或网络连接。"}), 500
+
+    try:
+        conversation_id, user_message, contents = _resolve_chat_request(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": f"请求格式错误: {e}"}), 400
+
+    if not contents:
+        return jsonify({"error": "请求中缺少对话消息"}), 400
+
+    print(f"正在进行流式AI对话，发送给模型的消息数: {len(contents)}...")
+
+    try:
+        texts = _open_model_stream(contents, '对话')
+    except (GatewayBusyError, GatewayTimeoutError) as e:
+        return _gateway_error_response(e)
+    except Exception as e:
+        print(f"AI对话回复生成失败: {e}")
+        return _sse_error_response(f"AI对话回复生成失败: {str(e)}。请检查网络连接和API密钥。")
+
+    def generate():
+        parts = []
+        try:
+            for text in texts:
+                parts.append(text)
+                yield _sse_event({"text": text})
+            _record_chat_turn(conversation_id, user_message, ''.join(parts))
+            print("AI对话回复生成成功！")
+            yield _sse_event({"conversation_id": conversation_id}, event='done')
+        except Exception as e:
+            print(f"AI对话回复生成失败: {e}")
+            yield _sse_event({"error": f"AI对话回复生成失败: {str(e)}。请检查网络连接和API密钥。"}, event='error')
+
+    return _sse_response(generate())
+
+
+# 写入队列已满时的背压响应，客户端稍后重试 (光标追踪脚本会把该批次放回重试缓冲区)
+def _write_queue_full_response():
+    print("警告: 后台写入队列已满，拒绝本次写入请求。")
+    response = jsonify({"status": "error", "message": "服务器写入繁忙，请稍后重试"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+# 写入队列状态接口 (队列深度、拒绝次数、组提交批次大小与耗时等背压指标)
+@app.route('/api/write_queue_stats', methods=['GET'])
+def write_queue_stats():
+    return jsonify(write_queue.stats())
+
+
 # 用户行为日志接口 (用于记录离散事件，如AI讲解点击、聊天消息发送)
 @app.route('/api/log_behavior', methods=['POST'])
 def log_behavior():
@@ -95,24 +560,10 @@ def log_behavior():
         behavior_data = request.json
         behavior_data['timestamp'] = time.time()  # 添加服务器时间戳
 
-        log_file_path = 'user_behavior_log.json'
-
-        if not os.path.exists(log_file_path) or os.path.getsize(log_file_path) == 0:
-            with open(log_file_path, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
+        if not write_queue.submit('behavior', behavior_data):
+            return _write_queue_full_response()
 
-        with open(log_file_path, 'r+', encoding='utf-8') as f:
-            f.seek(0)
-            try:
-                logs = json.load(f)
-            except json.JSONDecodeError:
-                logs = []
-            logs.append(behavior_data)
-            f.seek(0)
-            f.truncate()
-            json.dump(logs, f, ensure_ascii=False, indent=4)
-
-        print(f"用户行为已记录: {behavior_data['event']}")
+        print(f"用户行为已加入写入队列: {behavior_data.get('event')}")
         return jsonify({"status": "success", "message": "行为已记录"}), 200
     except Exception as e:
         print(f"记录用户行为失败: {e}")
@@ -123,7 +574,11 @@ def log_behavior():
 @app.route('/api/save_session_data', methods=['POST'])
 def save_session_data():
     try:
-        session_data = request.json
+        session_data = request.get_json(silent=True)
+        try:
+            validate_session_data(session_data)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         # 打印收到的数据，用于调试
         print(f"\n--- 收到前端发送的会话数据 ---")
         # 核心改动：这里现在期望接收 'location_history' 键
@@ -134,26 +589,12 @@ def save_session_data():
         if 'session_id' not in session_data:
             session_data['session_id'] = str(time.time())
         session_data['end_timestamp'] = time.time()  # 记录会话结束时间
+        _simplify_session_points(session_data)
 
-        session_file_path = 'user_sessions_data.json'
+        if not write_queue.submit('session', session_data):
+            return _write_queue_full_response()
 
-        if not os.path.exists(session_file_path) or os.path.getsize(session_file_path) == 0:
-            with open(session_file_path, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
-
-        with open(session_file_path, 'r+', encoding='utf-8') as f:
-            f.seek(0)
-            try:
-                sessions = json.load(f)
-            except json.JSONDecodeError:
-                print(f"警告: user_sessions_data.json 文件为空或格式错误，将重新初始化。")
-                sessions = []
-            sessions.append(session_data)
-            f.seek(0)
-            f.truncate()
-            json.dump(sessions, f, ensure_ascii=False, indent=4)
-
-        print(f"会话数据已保存到 '{session_file_path}'，ID: {session_data['session_id']}")
+        print(f"会话数据已加入写入队列，ID: {session_data['session_id']}")
         return jsonify({"status": "success", "message": "会话数据已保存"}), 200
     except Exception as e:
         print(f"保存会话数据失败: {e}")
@@ -162,9 +603,120 @@ def save_session_data():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# 批量保存光标轨迹接口 (一次请求携带同一会话的多个采样点，列式/差分编码)
+@app.route('/api/save_session_batch', methods=['POST'])
+def save_session_batch():
+    try:
+        # navigator.sendBeacon 发送的请求 Content-Type 可能不是 application/json，这里强制解析
+        payload = request.get_json(force=True, silent=True)
+        if payload is None:
+            return jsonify({"status": "error", "message": "请求体不是合法的JSON"}), 400
+
+        try:
+            session_data = decode_point_batch(payload)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        point_count = len(session_data['location_history'])
+        if point_count == 0:
+            return jsonify({"status": "success", "message": "空批次，已忽略", "points": 0}), 200
+
+        session_data['end_timestamp'] = time.time()
+        point_count, stored_count = _simplify_session_points(session_data)
+        if not write_queue.submit('session', session_data):
+            return _write_queue_full_response()
+
+        print(f"批量会话数据已加入写入队列，ID: {session_data['session_id']}，点数: {point_count}")
+        return jsonify({"status": "success", "message": "批量数据已保存", "points": point_count,
+                        "stored_points": stored_count}), 200
+    except Exception as e:
+        print(f"保存批量会话数据失败: {e}")
+        traceback.print_exc()
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+# If-None-Match 是否命中：'*' 或逗号分隔的 ETag 列表中有一项与 etag 完全相同 (弱校验，忽略 W/ 前缀)
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+# 用户活动密度瓦片接口：按 z/x/y 返回单个瓦片的聚合格子，支持 ETag 协商缓存
+@app.route('/api/density_tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_density_tile(z, x, y):
+    if not tile_in_range(z, x, y):
+        return jsonify({"error": "瓦片坐标超出该缩放级别的范围"}), 404
+    # 清单只读取一次，ETag 与响应体来自同一个构建版本
+    manifest, cells, counts = density_tile_store.get_tile(z, x, y)
+    if cells is None:
+        return jsonify({"error": "该缩放级别没有密度瓦片，请先运行 session_analyzer.py --tiles"}), 404
+
+    etag = density_tile_store.etag(manifest, z, x, y)
+    if _etag_matches(request.headers.get('If-None-Match'), etag):
+        response = app.response_class(status=304)
+        response.headers['ETag'] = etag
+        return response
+
+    response = jsonify(density_tile_store.tile_payload(manifest, z, x, y, cells, counts))
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
+
+
+# 热点分数批量预测接口：请求体 {"features": [[纬度, 经度, 年份], ...]}，
+# 一次向量化 predict 返回每个坐标的原始预测值和与热力图同一刻度的 0~1 分数 (超出训练范围的截断到 0~1)
+@app.route('/api/predict_hotspots', methods=['POST'])
+def predict_hotspots():
+    payload = request.get_json(silent=True) or {}
+    features = payload.get('features')
+    if not isinstance(features, list) or not features:
+        return jsonify({"status": "error", "message": "features 应为非空的 [纬度, 经度, 年份] 数组"}), 400
+    if len(features) > MAX_HOTSPOT_BATCH:
+        return jsonify({"status": "error", "message": f"单次最多预测 {MAX_HOTSPOT_BATCH} 个坐标"}), 400
+    try:
+        feature_array = np.array(features, dtype=np.float64)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "features 中包含非数值"}), 400
+    if feature_array.shape != (len(features), len(FEATURE_NAMES)) or not np.all(np.isfinite(feature_array)):
+        return jsonify({"status": "error", "message": "每个坐标应为 [纬度, 经度, 年份] 三个有限数值"}), 400
+
+    hotspot_model = hotspot_model_service.get()
+    if hotspot_model is None:
+        return jsonify({"status": "error", "message": "尚未训练热点模型，请先运行 session_analyzer.py"}), 503
+    raw_scores, scores = hotspot_model.predict(feature_array)
+    return jsonify({
+        "status": "success",
+        "model_version": hotspot_model.version,
+        "scores": scores.tolist(),
+        "raw_scores": raw_scores.tolist(),
+    })
+
+
+# 当前热点模型的版本信息
+@app.route('/api/hotspot_model', methods=['GET'])
+def hotspot_model_info():
+    hotspot_model = hotspot_model_service.get()
+    if hotspot_model is None:
+        return jsonify({"status": "error", "message": "尚未训练热点模型"}), 404
+    return jsonify(hotspot_model.info())
+
+
 # 启动这个后端服务
 if __name__ == '__main__':
+    import sys
+
+    if '--prewarm' in sys.argv:
+        prewarm_description_cache()
+        sys.exit(0)
+
+    # 启动时预先加载已保存的热点模型 (不存在时首次预测请求再尝试)，避免第一个预测请求承担反序列化开销
+    hotspot_model_service.get()
     print("--- AI讲解后端服务已启动 ---")
     print("服务运行在 http://localhost:5000")
     print("请保持此窗口运行，要停止请按 Ctrl+C")
-    app.run(port=5000)
+    # 每个请求一个线程：遥测写入只入队即返回，大模型调用在网关线程池中执行，两类请求互不阻塞
+    app.run(port=5000, threaded=True)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DB = 'ai_response_cache.sqlite3'
+# 默认 30 天过期：讲解内容由地点名称和年份完全决定，短期内无需重新生成
+DEFAULT_TTL_S = 30 * 24 * 3600
+DEFAULT_MEMORY_MAX_ENTRIES = 512
+DEFAULT_DISK_MAX_BYTES = 64 * 1024 * 1024
+# 内存命中时磁盘条目的 last_access 批量更新：攒够一定数量或距上次写入超过一定时间再写一次，
+# 磁盘淘汰前也会先写入，保证热点条目不会被当作冷数据淘汰
+TOUCH_FLUSH_MAX_KEYS = 256
+TOUCH_FLUSH_INTERVAL_S = 60
+
+
+# 由任意可 JSON 序列化的参数生成稳定的缓存键
+def make_cache_key(*parts):
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+# 两级响应缓存：内存 LRU 在前，SQLite 持久化存储在后；
+# 两级都带 TTL，内存按条目数淘汰，磁盘按总字节数淘汰最久未访问的条目
+class ResponseCache:
+    def __init__(self, db_path=DEFAULT_CACHE_DB, ttl_s=DEFAULT_TTL_S, memory_max_entries=DEFAULT_MEMORY_MAX_ENTRIES,
+                 disk_max_bytes=DEFAULT_DISK_MAX_BYTES):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_bytes = disk_max_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, expires_at)
+        self._pending_touches = {}  # key -> 最近一次内存命中的时间，尚未写入磁盘
+        self._last_touch_flush = time.time()
+        self._stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'sets': 0, 'expired': 0,
+                       'memory_evictions': 0, 'disk_evictions': 0}
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)')
+        self._conn.commit()
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self._stats['memory_evictions'] += 1
+
+    def _flush_touches_locked(self, now):
+        if self._pending_touches:
+            self._conn.executemany('UPDATE responses SET last_access = MAX(last_access, ?) WHERE key = ?',
+                                   [(accessed_at, key) for key, accessed_at in self._pending_touches.items()])
+            self._pending_touches.clear()
+        self._last_touch_flush = now
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    self._pending_touches[key] = now
+                    if (len(self._pending_touches) >= TOUCH_FLUSH_MAX_KEYS
+                            or now - self._last_touch_flush >= TOUCH_FLUSH_INTERVAL_S):
+                        self._flush_touches_locked(now)
+                        self._conn.commit()
+                    return value
+                del self._memory[key]
+
+            row = self._conn.execute('SELECT value, expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self._stats['misses'] += 1
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._conn.commit()
+                self._stats['expired'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self._remember(key, value, expires_at)
+            self._stats['disk_hits'] += 1
+            return value
+
+    def set(self, key, value, ttl_s=None):
+        now = time.time()
+        expires_at = now + (ttl_s if ttl_s is not None else self.ttl_s)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, created_at, expires_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, value, len(value.encode('utf-8')), now, expires_at, now)
+            )
+            self._pending_touches.pop(key, None)
+            self._flush_touches_locked(now)
+            self._evict_disk_locked(now)
+            self._conn.commit()
+            self._stats['sets'] += 1
+
+    # 先删除过期条目，再按最近访问时间从旧到新删除，直到总大小不超过上限
+    def _evict_disk_locked(self, now):
+        self._conn.execute('DELETE FROM responses WHERE expires_at <= ?', (now,))
+        total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_bytes <= self.disk_max_bytes:
+            return
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_access').fetchall():
+            if total_bytes <= self.disk_max_bytes:
+                break
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._memory.pop(key, None)
+            total_bytes -= size
+            self._stats['disk_evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['memory_entries'] = len(self._memory)
+            row = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        snapshot['disk_entries'], snapshot['disk_bytes'] = row
+        lookups = snapshot['memory_hits'] + snapshot['disk_hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = (snapshot['memory_hits'] + snapshot['disk_hits']) / lookups if lookups else 0.0
+        return snapshot
+
+    def close(self):
+        with self._lock:
+            self._flush_touches_locked(time.time())
+            self._conn.commit()
+            self._conn.close()
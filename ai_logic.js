@@ -91,42 +91,106 @@ aiPanel.addEventListener('click', function(event) {
 });
 
 
+// --- 读取 Server-Sent Events 流 ---
+// POST 请求无法使用 EventSource，这里通过 fetch 的 ReadableStream 手动解析 "event:" / "data:" 行
+// chat_logic.js 也使用此函数
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let eventName = 'message';
+            const dataLines = [];
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trim());
+                }
+            });
+            if (dataLines.length > 0) {
+                onEvent(eventName, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+
+// --- 以纯文本方式追加模型输出 ---
+// 模型文本不经过 innerHTML，避免注入；服务端用 <br> 表示的换行 (以及 \n) 转为 <br> 元素
+// chat_logic.js 也使用此函数
+function appendMultilineText(element, text) {
+    text.split(/<br\s*\/?>|\n/i).forEach((line, index) => {
+        if (index > 0) {
+            element.appendChild(document.createElement('br'));
+        }
+        if (line) {
+            element.appendChild(document.createTextNode(line));
+        }
+    });
+}
+
+function setMultilineText(element, text) {
+    element.textContent = '';
+    appendMultilineText(element, text);
+}
+
+// 显示错误面板：标题固定，错误信息以纯文本显示
+function showAiPanelError(title, message) {
+    aiPanelContent.innerHTML = '<h3 style="color: red;"></h3><hr><p></p>';
+    aiPanelContent.querySelector('h3').textContent = title;
+    aiPanelContent.querySelector('p').textContent = message;
+}
+
+
 // 4. “AI讲解”按钮的点击事件函数
 // 修正参数顺序和名称，使其与map.py中onclick传递的参数一致
 // map.py 传递的顺序是：索引 i, 地点名称 name, 年份 year
-function getAiIntro(index, locationName, year) { // <-- 关键修正：参数列表现在是 (index, locationName, year)
+// 使用流式接口，讲解文本边生成边显示
+async function getAiIntro(index, locationName, year) {
     // a. 滑出面板并显示加载状态
     aiPanelContent.innerHTML = '<h4>AI导游正在思考中，请稍候...</h4>';
     aiPanel.classList.add('visible');
 
-    // b. 调用后端获取AI讲解
-    fetch('http://localhost:5000/api/get-ai-description', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        // 确保这里传递给后端的是正确的地点名称 (locationName) 和年份 (year)
-        body: JSON.stringify({ name: locationName, year: year }), // <-- 关键修正：使用 locationName
-    })
-    .then(response => {
+    try {
+        // b. 调用后端流式接口获取AI讲解
+        const response = await fetch('http://localhost:5000/api/get-ai-description/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ name: locationName, year: year }),
+        });
         if (!response.ok) {
             throw new Error('服务器响应错误: ' + response.status);
         }
-        return response.json();
-    })
-    .then(data => {
-        if (data.error) {
-            aiPanelContent.innerHTML = `<h3 style="color: red;">AI讲解失败</h3><hr><p>${data.error}</p>`;
-        } else {
-            // c. 将AI返回的文本填充到面板中
-            // 显示时使用正确的地点名称 (locationName) 和年份 (year)
-            aiPanelContent.innerHTML = `
-                <h3>关于“${locationName}”(${year})</h3> <!-- <-- 关键修正：使用 locationName -->
-                <hr>
-                <p>${data.text}</p>
-            `;
-        }
-    })
-    .catch(error => {
+
+        // c. 收到第一块文本时替换加载提示，之后逐块追加
+        let textElement = null;
+        await readEventStream(response, (eventName, data) => {
+            if (eventName === 'error') {
+                showAiPanelError('AI讲解失败', data.error);
+                return;
+            }
+            if (eventName === 'done') {
+                return;
+            }
+            if (!textElement) {
+                aiPanelContent.innerHTML = '<h3></h3><hr><p></p>';
+                aiPanelContent.querySelector('h3').textContent = `关于“${locationName}”(${year})`;
+                textElement = aiPanelContent.querySelector('p');
+            }
+            appendMultilineText(textElement, data.text);
+        });
+    } catch (error) {
         console.error('Error:', error);
-        aiPanelContent.innerHTML = '<h3 style="color: red;">连接AI服务失败</h3><hr><p>请检查您的后端服务(ai.py)是否已启动，以及网络连接是否正常。</p>';
-    });
+        showAiPanelError('连接AI服务失败', '请检查您的后端服务(ai.py)是否已启动，以及网络连接是否正常。');
+    }
 }
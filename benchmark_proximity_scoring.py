@@ -0,0 +1,120 @@
+import argparse
+import time
+
+import numpy as np
+
+from session_analyzer import (AttractionGridIndex, accumulate_proximity_scores, accumulate_proximity_scores_indexed,
+                              get_all_locations_data_from_source, get_proximity_level_score, haversine_distance)
+
+
+# 原始的逐点、逐景点循环实现，作为核对向量化与网格索引结果的参考实现；
+# 参数与返回值同 accumulate_proximity_scores (int64 分数之和，weights 为每个点的权重)
+def accumulate_proximity_scores_loop(user_lats, user_lons, attraction_lats, attraction_lons, weights=None):
+    score_sums = [0] * len(attraction_lats)
+    point_weights = weights.tolist() if weights is not None else [1] * len(user_lats)
+    attractions = list(zip(attraction_lats.tolist(), attraction_lons.tolist()))
+    for user_lat, user_lon, weight in zip(user_lats.tolist(), user_lons.tolist(), point_weights):
+        for attraction_idx, (attraction_lat, attraction_lon) in enumerate(attractions):
+            distance = haversine_distance(user_lat, user_lon, attraction_lat, attraction_lon)
+            score_sums[attraction_idx] += get_proximity_level_score(distance) * weight
+    return np.array(score_sums, dtype=np.int64)
+
+
+# 把会话列表中的有效位置点提取为 float64 数组
+def extract_session_points(sessions):
+    user_lats = []
+    user_lons = []
+    for session in sessions:
+        for data_point in session.get('location_history', []):
+            user_lat = data_point.get('latitude')
+            user_lon = data_point.get('longitude')
+            if user_lat is None or user_lon is None:
+                continue
+            user_lats.append(user_lat)
+            user_lons.append(user_lon)
+    return np.array(user_lats, dtype=np.float64), np.array(user_lons, dtype=np.float64)
+
+
+# 围绕景点随机生成光标轨迹点 (固定随机种子，结果可复现)
+def generate_sessions(num_points, points_per_session=500, seed=42):
+    rng = np.random.default_rng(seed)
+    all_locations = get_all_locations_data_from_source()
+    centers = np.array([loc['location'] for loc in all_locations], dtype=np.float64)
+
+    center_idx = rng.integers(0, len(centers), size=num_points)
+    # 约 0.01 度 (~1 公里) 的散布，使点落在各个亲近等级中
+    offsets = rng.normal(scale=0.01, size=(num_points, 2))
+    points = centers[center_idx] + offsets
+
+    sessions = []
+    for start in range(0, num_points, points_per_session):
+        location_history = [
+            {'timestamp': 1700000000000 + i * 100, 'latitude': float(lat), 'longitude': float(lon)}
+            for i, (lat, lon) in enumerate(points[start:start + points_per_session])
+        ]
+        sessions.append({'session_id': f'bench_{start}', 'location_history': location_history})
+    return sessions
+
+
+# 在长沙市区范围内随机生成大量景点，用于测试数千个 POI 时的扩展性
+def generate_attractions(num_attractions, seed=7):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(28.05, 28.35, size=num_attractions)
+    lons = rng.uniform(112.80, 113.15, size=num_attractions)
+    return {f'poi_{i}': [float(lat), float(lon)] for i, (lat, lon) in enumerate(zip(lats, lons))}
+
+
+def run_benchmark(num_points, seed=42, num_attractions=None, skip_loop=False):
+    sessions = generate_sessions(num_points, seed=seed)
+    if num_attractions:
+        attraction_coords_map = generate_attractions(num_attractions)
+    else:
+        all_locations = get_all_locations_data_from_source()
+        attraction_coords_map = {loc['name']: loc['location'] for loc in all_locations}
+    attraction_names = list(attraction_coords_map.keys())
+    attraction_lats = np.array([attraction_coords_map[name][0] for name in attraction_names])
+    attraction_lons = np.array([attraction_coords_map[name][1] for name in attraction_names])
+
+    timings = {}
+    results = {}
+
+    if not skip_loop:
+        start_time = time.time()
+        user_lats, user_lons = extract_session_points(sessions)
+        loop_sums = accumulate_proximity_scores_loop(user_lats, user_lons, attraction_lats, attraction_lons)
+        timings['循环'] = time.time() - start_time
+        results['循环'] = [float(score) for score in loop_sums]
+
+    start_time = time.time()
+    user_lats, user_lons = extract_session_points(sessions)
+    vectorized_sums = accumulate_proximity_scores(user_lats, user_lons, attraction_lats, attraction_lons)
+    timings['向量化'] = time.time() - start_time
+    results['向量化'] = [float(score) for score in vectorized_sums]
+
+    start_time = time.time()
+    user_lats, user_lons = extract_session_points(sessions)
+    grid_index = AttractionGridIndex(attraction_lats, attraction_lons)
+    indexed_sums = accumulate_proximity_scores_indexed(user_lats, user_lons, grid_index)
+    timings['网格索引'] = time.time() - start_time
+    results['网格索引'] = [float(score) for score in indexed_sums]
+
+    reference_engine = next(iter(results))
+    for engine, scores in results.items():
+        mismatches = [name for name, a, b in zip(attraction_names, results[reference_engine], scores) if a != b]
+        assert not mismatches, f"{engine} 结果与{reference_engine}结果不一致: {mismatches[:5]}"
+
+    timing_text = ' | '.join(f"{engine}: {seconds:8.3f} 秒" for engine, seconds in timings.items())
+    print(f"点数: {num_points:>9} | 景点数: {len(attraction_names):>5} | {timing_text} | 结果一致")
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='对比逐点循环、向量化与网格索引三种亲近度评分实现的耗时，并校验结果一致')
+    parser.add_argument('--points', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--attractions', type=int, default=None, help='使用随机生成的景点数量代替真实的 17 个景点')
+    parser.add_argument('--skip-loop', action='store_true', help='跳过最慢的逐点循环实现')
+    args = parser.parse_args()
+
+    for num_points in args.points:
+        run_benchmark(num_points, seed=args.seed, num_attractions=args.attractions, skip_loop=args.skip_loop)
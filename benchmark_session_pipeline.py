@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+try:
+    import resource  # 仅 Unix 可用；Windows 上不记录峰值内存
+except ImportError:
+    resource = None
+
+from session_analyzer import get_all_locations_data_from_source
+
+METERS_PER_DEGREE = 111320.0
+SAMPLE_INTERVAL_MS = 100
+DEFAULT_POINTS = [10000, 100000, 1000000]
+DEFAULT_RESULTS_DIR = 'benchmark_results'
+# 生成数据时每次追加到会话存储的会话数
+APPEND_BATCH_SESSIONS = 200
+
+# 各阶段在独立子进程中运行，峰值 RSS 互不影响；阶段之间通过工作目录中的 JSON 文件传递结果
+STAGES = ['interest_scores', 'svr_training', 'attraction_heatmap', 'density_heatmap']
+ARCHIVE_STAGES = ['compact_archive', 'interest_scores_archive', 'density_heatmap_archive']
+
+
+# 合成会话生成器 (固定随机种子，结果可复现)，逐个产出会话，不会一次性占用全部内存
+# distribution:
+#   'gaussian' : 每个会话围绕一个景点，点按 spread_m 米的正态分布散布
+#   'uniform'  : 在景点外包框 (外扩 2 公里) 内均匀分布
+#   'mixed'    : 一半会话为 gaussian，一半为 uniform
+# hotspot_skew > 0 时景点按 Zipf 分布被选中 (少数热门景点占大部分会话)，0 为等概率
+def generate_synthetic_sessions(num_sessions, points_per_session, distribution='gaussian', spread_m=800.0,
+                                hotspot_skew=1.0, seed=42):
+    rng = np.random.default_rng(seed)
+    centers = np.array([loc['location'] for loc in get_all_locations_data_from_source()], dtype=np.float64)
+    ranks = np.arange(1, len(centers) + 1, dtype=np.float64)
+    popularity = ranks ** -hotspot_skew if hotspot_skew > 0 else np.ones(len(centers))
+    popularity /= popularity.sum()
+    margin = 2000.0 / METERS_PER_DEGREE
+    low = centers.min(axis=0) - margin
+    high = centers.max(axis=0) + margin
+    meters_to_deg = np.array([1.0 / METERS_PER_DEGREE,
+                              1.0 / (METERS_PER_DEGREE * np.cos(np.radians(centers[:, 0].mean())))])
+
+    for session_idx in range(num_sessions):
+        session_distribution = distribution
+        if distribution == 'mixed':
+            session_distribution = 'gaussian' if session_idx % 2 == 0 else 'uniform'
+        if session_distribution == 'uniform':
+            points = rng.uniform(low, high, size=(points_per_session, 2))
+        else:
+            center = centers[rng.choice(len(centers), p=popularity)]
+            points = center + rng.normal(scale=spread_m, size=(points_per_session, 2)) * meters_to_deg
+        start_ms = 1700000000000 + session_idx * points_per_session * SAMPLE_INTERVAL_MS
+        yield {
+            'session_id': f'synthetic_{seed}_{session_idx}',
+            'start_time': start_ms,
+            'location_history': [
+                {'timestamp': start_ms + i * SAMPLE_INTERVAL_MS, 'latitude': lat, 'longitude': lon}
+                for i, (lat, lon) in enumerate(points.tolist())
+            ],
+        }
+
+
+# 把合成会话写入工作目录中的分段 JSON Lines 会话存储
+def write_synthetic_store(store_path, num_points, points_per_session, distribution, spread_m, hotspot_skew, seed):
+    from session_store import open_session_store
+
+    store = open_session_store(store_path, writable=True)
+    num_sessions = max(1, num_points // points_per_session)
+    batch = []
+    for session in generate_synthetic_sessions(num_sessions, points_per_session, distribution, spread_m,
+                                               hotspot_skew, seed):
+        batch.append(session)
+        if len(batch) >= APPEND_BATCH_SESSIONS:
+            store.append_many(batch)
+            batch = []
+    if batch:
+        store.append_many(batch)
+    store.sync()
+    store.close()
+    return num_sessions
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+# 在子进程中运行单个阶段 (工作目录为当前目录)，返回耗时 (秒)；分析函数的输出日志被丢弃
+def run_stage(stage):
+    import session_analyzer as sa
+    from point_archive import compact_session_store
+
+    store_path = 'sessions'
+    archive_path = 'point_archive'
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start_time = time.perf_counter()
+        if stage in ('interest_scores', 'interest_scores_archive'):
+            scores = sa.calculate_actual_interest_scores(
+                session_file=store_path, archive_dir=archive_path if stage.endswith('_archive') else None)
+            _write_json('actual_scores.json', {name: float(score) for name, score in scores.items()})
+        elif stage == 'svr_training':
+            # model_dir=None: 不读取也不保存模型，每次都完整训练
+            predicted = sa.train_and_predict_interest_with_svm(_read_json('actual_scores.json'), model_dir=None)
+            _write_json('predicted_scores.json', {name: float(score) for name, score in predicted.items()})
+        elif stage == 'attraction_heatmap':
+            sa.generate_attraction_interest_heatmap_html(_read_json('predicted_scores.json'),
+                                                         'attraction_interest_heatmap.html')
+        elif stage in ('density_heatmap', 'density_heatmap_archive'):
+            sa.generate_user_activity_density_heatmap_html(
+                session_file=store_path, output_filename='user_activity_density_heatmap.html',
+                archive_dir=archive_path if stage.endswith('_archive') else None)
+        elif stage == 'compact_archive':
+            compact_session_store(store_path, archive_path)
+        else:
+            raise ValueError(f"未知的阶段: {stage}")
+        return time.perf_counter() - start_time
+
+
+# 在独立子进程中运行阶段并读取其结果 (子进程最后一行输出为 JSON)
+def run_stage_subprocess(stage, workdir):
+    script = os.path.abspath(__file__)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.path.dirname(script),
+                                                                     os.environ.get('PYTHONPATH')])))
+    completed = subprocess.run([sys.executable, script, '--run-stage', stage], cwd=workdir, env=env,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"阶段 {stage} 运行失败:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _library_versions():
+    import sklearn
+    import folium
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'sklearn': sklearn.__version__,
+            'folium': folium.__version__}
+
+
+def run_benchmark(points_list, points_per_session=1000, distribution='gaussian', spread_m=800.0, hotspot_skew=1.0,
+                  seed=42, with_archive=False, keep_workdir=False):
+    stages = STAGES + (ARCHIVE_STAGES if with_archive else [])
+    results = []
+    for num_points in points_list:
+        workdir = tempfile.mkdtemp(prefix=f'session_bench_{num_points}_')
+        try:
+            start_time = time.perf_counter()
+            num_sessions = write_synthetic_store(os.path.join(workdir, 'sessions'), num_points, points_per_session,
+                                                 distribution, spread_m, hotspot_skew, seed)
+            generate_seconds = time.perf_counter() - start_time
+            store_bytes = sum(os.path.getsize(os.path.join(root, name))
+                              for root, _, names in os.walk(os.path.join(workdir, 'sessions')) for name in names)
+
+            stage_results = {stage: run_stage_subprocess(stage, workdir) for stage in stages}
+            actual_points = num_sessions * points_per_session
+            results.append({
+                'points': actual_points,
+                'sessions': num_sessions,
+                'store_mb': store_bytes / (1024 * 1024),
+                'generate_seconds': generate_seconds,
+                'stages': stage_results,
+            })
+            stage_text = ' | '.join(
+                f"{stage}: {r['seconds']:.3f} 秒" + (f" / {r['peak_rss_mb']:.0f} MB" if r['peak_rss_mb'] else '')
+                for stage, r in stage_results.items())
+            print(f"点数: {actual_points:>9} | 会话数: {num_sessions:>6} | {stage_text}")
+        finally:
+            if keep_workdir:
+                print(f"工作目录已保留: {workdir}")
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'benchmark': 'session_pipeline',
+        'commit': _git_commit(),
+        'created_at': time.time(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'versions': _library_versions(),
+        'config': {
+            'points_per_session': points_per_session,
+            'distribution': distribution,
+            'spread_m': spread_m,
+            'hotspot_skew': hotspot_skew,
+            'seed': seed,
+            'with_archive': with_archive,
+        },
+        'results': results,
+    }
+
+
+# 与之前保存的结果对比：按相同点数和阶段输出耗时与峰值内存的比值 (>1 表示变慢/变大)
+def compare_results(current, baseline):
+    baseline_by_points = {entry['points']: entry for entry in baseline['results']}
+    print(f"\n与基线 {baseline.get('commit') or '(未知提交)'} 对比 (当前 / 基线):")
+    for entry in current['results']:
+        base_entry = baseline_by_points.get(entry['points'])
+        if base_entry is None:
+            continue
+        ratios = []
+        for stage, result in entry['stages'].items():
+            base_result = base_entry['stages'].get(stage)
+            if not base_result or not base_result['seconds']:
+                continue
+            text = f"{stage}: {result['seconds'] / base_result['seconds']:.2f}x"
+            if result['peak_rss_mb'] and base_result.get('peak_rss_mb'):
+                text += f" / 内存 {result['peak_rss_mb'] / base_result['peak_rss_mb']:.2f}x"
+            ratios.append(text)
+        print(f"点数: {entry['points']:>9} | " + ' | '.join(ratios))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='会话分析流程的合成负载基准测试：记录各阶段耗时与峰值内存并输出 JSON 结果')
+    parser.add_argument('--points', type=int, nargs='+', default=DEFAULT_POINTS,
+                        help='总点数，可指定多个 (如 10000 100000 1000000 10000000)')
+    parser.add_argument('--points-per-session', type=int, default=1000)
+    parser.add_argument('--distribution', choices=['gaussian', 'uniform', 'mixed'], default='gaussian')
+    parser.add_argument('--spread-m', type=float, default=800.0, help='gaussian 分布时点到景点的散布 (米)')
+    parser.add_argument('--hotspot-skew', type=float, default=1.0, help='景点热度的 Zipf 指数，0 为等概率')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--with-archive', action='store_true', help='额外测试列式点归档的压实与扫描')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留生成的会话存储和 HTML')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径 (默认写入 benchmark_results/ 目录)')
+    parser.add_argument('--compare', default=None, help='与之前的结果 JSON 对比')
+    parser.add_argument('--run-stage', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        seconds = run_stage(args.run_stage)
+        print(json.dumps({'seconds': seconds, 'peak_rss_mb': peak_rss_mb()}))
+        sys.exit(0)
+
+    report = run_benchmark(args.points, args.points_per_session, args.distribution, args.spread_m,
+                           args.hotspot_skew, args.seed, args.with_archive, args.keep_workdir)
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"session_pipeline_{report['commit'] or 'nogit'}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 '{output}'")
+
+    if args.compare:
+        compare_results(report, _read_json(args.compare))
@@ -0,0 +1,163 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from session_analyzer import (PROXIMITY_CHUNK_ELEMENTS, PROXIMITY_LEVELS, compute_raw_interest_scores,
+                              get_all_locations_data_from_source, haversine_distance_matrix,
+                              proximity_scores_from_distances)
+from trajectory_simplify import MAX_DISPLACEMENT_M, PATH_TOLERANCE_M, STATIONARY_RADIUS_M, simplify_location_history
+
+SAMPLE_INTERVAL_MS = 100
+METERS_PER_DEGREE = 111320.0
+# 简化在平面投影 (米) 中计算距离，计分使用 Haversine 距离；两者在会话范围内的差异远小于 1%，
+# 位移上限乘以该系数再加 1 米作为余量
+PROJECTION_SLACK = 1.01
+# 计分核的分段边界两侧取样的偏移 (米)，小于相邻两个等级之间的间隙 (1 米)
+EDGE_PROBE_M = 0.25
+
+
+# 每个原始采样在计分时的最大位移：驻留合并把采样移到半径 stationary_radius_m 内的首点，
+# 路径简化再把首点的权重并入距离不超过 max_displacement_m 的保留点
+def scoring_displacement_m(stationary_radius_m=STATIONARY_RADIUS_M, max_displacement_m=MAX_DISPLACEMENT_M):
+    return (stationary_radius_m + max_displacement_m) * PROJECTION_SLACK + 1.0
+
+
+# 距离在 [d - displacement_m, d + displacement_m] 内变化时，分段计分核的分数与 d 处分数之差的最大值 (逐元素)。
+# 分段常数函数在区间上的取值只可能出现在区间端点或各分段边界两侧，逐一取样即可
+def max_kernel_deviation(distances, displacement_m):
+    distances = np.asarray(distances, dtype=np.float64)
+    base = proximity_scores_from_distances(distances)
+    low = np.maximum(distances - displacement_m, 0.0)
+    high = distances + displacement_m
+    edges = sorted({level['min'] for level in PROXIMITY_LEVELS} |
+                   {level['max'] for level in PROXIMITY_LEVELS if level['max'] != float('inf')})
+    probes = [low, high] + [np.full_like(distances, edge + offset) for edge in edges
+                            for offset in (-EDGE_PROBE_M, EDGE_PROBE_M)]
+    deviation = np.zeros(distances.shape, dtype=np.int64)
+    for probe in probes:
+        scores = proximity_scores_from_distances(np.clip(probe, low, high))
+        deviation = np.maximum(deviation, np.abs(scores - base))
+    return deviation
+
+
+# 简化后各景点原始兴趣分数的绝对误差上限：每个原始采样最多移动 displacement_m，
+# 它对某景点分数的影响不超过该采样距离处的 max_kernel_deviation，逐个采样求和
+def proximity_error_bound(lats, lons, attraction_lats, attraction_lons, displacement_m):
+    bound = np.zeros(len(attraction_lats), dtype=np.int64)
+    chunk_size = max(1, PROXIMITY_CHUNK_ELEMENTS // max(1, len(attraction_lats)))
+    for start in range(0, len(lats), chunk_size):
+        distances = haversine_distance_matrix(lats[start:start + chunk_size], lons[start:start + chunk_size],
+                                              attraction_lats, attraction_lons)
+        bound += max_kernel_deviation(distances, displacement_m).sum(axis=0)
+    return bound
+
+
+# 模拟光标轨迹 (固定随机种子，结果可复现)：在景点附近悬停 (约 1 米的抖动) 与在地图上平滑移动交替出现
+def generate_cursor_sessions(num_sessions, points_per_session=3000, hover_share=0.7, seed=42):
+    rng = np.random.default_rng(seed)
+    centers = np.array([loc['location'] for loc in get_all_locations_data_from_source()], dtype=np.float64)
+    meters_to_deg = np.array([1.0 / METERS_PER_DEGREE, 1.0 / (METERS_PER_DEGREE * np.cos(np.radians(28.2)))])
+
+    sessions = []
+    for session_idx in range(num_sessions):
+        position = centers[rng.integers(len(centers))] + rng.normal(scale=0.005, size=2)
+        points = []
+        while len(points) < points_per_session:
+            if rng.random() < hover_share:
+                # 悬停：位置基本不动，只有一两个像素的抖动
+                for _ in range(int(rng.integers(20, 200))):
+                    points.append(position + rng.normal(scale=1.0, size=2) * meters_to_deg)
+            else:
+                # 移动：朝随机目标平滑移动，每个采样前进 5~40 米
+                target = centers[rng.integers(len(centers))] + rng.normal(scale=0.01, size=2)
+                steps = int(rng.integers(10, 80))
+                for step in range(1, steps + 1):
+                    wobble = rng.normal(scale=3.0, size=2) * meters_to_deg
+                    points.append(position + (target - position) * step / steps + wobble)
+                position = points[-1]
+        location_history = [
+            {'timestamp': 1700000000000 + i * SAMPLE_INTERVAL_MS, 'latitude': float(lat), 'longitude': float(lon)}
+            for i, (lat, lon) in enumerate(points[:points_per_session])
+        ]
+        sessions.append({'session_id': f'bench_{session_idx}', 'location_history': location_history})
+    return sessions
+
+
+def _session_chunk(sessions, weighted):
+    lats, lons, weights = [], [], []
+    for session in sessions:
+        for point in session['location_history']:
+            lats.append(point['latitude'])
+            lons.append(point['longitude'])
+            weights.append(point.get('weight', 1))
+    chunk = (np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64))
+    return chunk + (np.array(weights, dtype=np.int64),) if weighted else chunk
+
+
+# 返回是否通过：每个景点简化前后原始兴趣分数之差都不超过 proximity_error_bound 推导出的上限
+def run_benchmark(num_sessions, points_per_session, seed, stationary_radius_m, tolerance_m, max_displacement_m):
+    sessions = generate_cursor_sessions(num_sessions, points_per_session, seed=seed)
+    attraction_coords_map = {loc['name']: loc['location'] for loc in get_all_locations_data_from_source()}
+
+    start_time = time.time()
+    simplified_sessions = []
+    total_dwell_ms = 0
+    for session in sessions:
+        simplified, _ = simplify_location_history(session['location_history'], stationary_radius_m, tolerance_m,
+                                                  max_displacement_m)
+        total_dwell_ms += sum(point.get('dwell_ms', 0) for point in simplified)
+        simplified_sessions.append({'session_id': session['session_id'], 'location_history': simplified})
+    simplify_seconds = time.time() - start_time
+
+    raw_points = sum(len(s['location_history']) for s in sessions)
+    stored_points = sum(len(s['location_history']) for s in simplified_sessions)
+
+    raw_chunk = _session_chunk(sessions, weighted=False)
+    raw_scores, raw_total = compute_raw_interest_scores([raw_chunk], attraction_coords_map)
+    # 全部权重为 1 时，带权重的计算必须与不带权重完全一致
+    unit_scores, _ = compute_raw_interest_scores([_session_chunk(sessions, weighted=True)], attraction_coords_map,
+                                                 engine='vectorized')
+    assert unit_scores == raw_scores, "单位权重的计分结果与原始计分不一致"
+
+    simplified_chunk = _session_chunk(simplified_sessions, weighted=True)
+    results = {}
+    for engine in ('indexed', 'vectorized'):
+        results[engine] = compute_raw_interest_scores([simplified_chunk], attraction_coords_map, engine=engine)
+    assert results['indexed'] == results['vectorized'], "带权重时网格索引与向量化结果不一致"
+    simplified_scores, simplified_total = results['indexed']
+    assert simplified_total == raw_total, f"简化前后总权重不一致: {simplified_total} != {raw_total}"
+
+    names = list(attraction_coords_map)
+    coords = np.array([attraction_coords_map[name] for name in names], dtype=np.float64)
+    displacement_m = scoring_displacement_m(stationary_radius_m, max_displacement_m)
+    bounds = dict(zip(names, proximity_error_bound(raw_chunk[0], raw_chunk[1], coords[:, 0], coords[:, 1],
+                                                   displacement_m).tolist()))
+    errors = {name: abs(simplified_scores[name] - raw_scores[name]) for name in names}
+    violations = [name for name in names if errors[name] > bounds[name]]
+    worst_name = max(names, key=lambda name: errors[name] / raw_scores[name])
+
+    print(f"会话数: {num_sessions} | 原始点数: {raw_points} | 保存点数: {stored_points} | "
+          f"压缩比: {raw_points / stored_points:.1f}x | 简化耗时: {simplify_seconds:.3f} 秒 | "
+          f"驻留时长合计: {total_dwell_ms / 1000:.0f} 秒")
+    print(f"兴趣分数最大相对误差: {errors[worst_name] / raw_scores[worst_name]:.4%} ({worst_name}，"
+          f"误差 {errors[worst_name]:g}，上限 {bounds[worst_name]}，每个采样最大位移 {displacement_m:.1f} 米)")
+    for name in violations:
+        print(f"超出误差上限: {name} 误差 {errors[name]:g} > 上限 {bounds[name]}")
+    return not violations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='入库轨迹简化的压缩比与兴趣分数误差检查 (误差超过推导出的上限时以非零状态退出)')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--points-per-session', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--stationary-radius', type=float, default=STATIONARY_RADIUS_M)
+    parser.add_argument('--tolerance', type=float, default=PATH_TOLERANCE_M)
+    parser.add_argument('--max-displacement', type=float, default=MAX_DISPLACEMENT_M)
+    args = parser.parse_args()
+
+    passed = run_benchmark(args.sessions, args.points_per_session, args.seed, args.stationary_radius, args.tolerance,
+                           args.max_displacement)
+    sys.exit(0 if passed else 1)
@@ -179,15 +179,14 @@ if (typeof allMarkersData !== 'undefined' && allMarkersData.length > 0) {
     mapLocationsList = allMarkersData.map(marker => `${marker.name} (${marker.year})`).join('；');
 }
 
-// --- 对话历史 (存储在前端) ---
+// --- 对话状态 ---
+// 对话历史保存在服务端 (ai.py conversation_store)，前端只保留会话ID，每次只发送新的一轮消息
 // 初始系统消息，用于引导AI，并限制其知识范围到地图地点
 // *** 关键修改：更严格的系统提示，强调客观性和范围限制 ***
 const initialAiMessage = `您好！我是您的智能地图助手。我将为您提供本张地图上标记的地点（包括：${mapLocationsList}）及其相关的历史事件信息。请注意，我只会基于客观的历史事实进行介绍，不提供任何个人观点或政治评论。请您提出与这些地点直接相关的问题。如果问题超出我的职责范围或涉及敏感内容，我将无法回答，并会礼貌地提醒您。`;
 
-let chatHistory = [{
-    role: 'model',
-    parts: [{ text: initialAiMessage }]
-}];
+// 第一次发送消息时由服务端分配；服务端会话被淘汰后会分配新的ID
+let conversationId = null;
 
 
 // --- 辅助函数：显示消息 (保持不变) ---
@@ -196,10 +195,11 @@ function displayMessage(role, text) {
     messageDiv.classList.add('chat-message', role);
     const bubbleDiv = document.createElement('div');
     bubbleDiv.classList.add('chat-bubble', role);
-    bubbleDiv.innerHTML = text.replace(/\n/g, '<br>');
+    setMultilineText(bubbleDiv, text);  // 定义在 ai_logic.js 中，以纯文本显示
     messageDiv.appendChild(bubbleDiv);
     chatMessagesDiv.appendChild(messageDiv);
     chatMessagesDiv.scrollTop = chatMessagesDiv.scrollHeight;
+    return bubbleDiv;
 }
 
 // --- 辅助函数：显示AI正在输入提示 (保持不变) ---
@@ -221,22 +221,25 @@ function hideTypingIndicator() {
     }
 }
 
-// --- 发送消息函数 (保持不变) ---
+// --- 发送消息函数 (流式接收AI回复，逐块显示) ---
 async function sendMessage() {
     const userMessage = chatInput.value.trim();
     if (userMessage === '') return;
 
     displayMessage('user', userMessage);
-    chatHistory.push({ role: 'user', parts: [{ text: userMessage }] });
     chatInput.value = '';
     chatSendBtn.disabled = true;
     showTypingIndicator();
 
     try {
-        const response = await fetch('http://localhost:5000/api/chat', {
+        const response = await fetch('http://localhost:5000/api/chat/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ messages: chatHistory }),
+            body: JSON.stringify({
+                conversation_id: conversationId,
+                message: userMessage,
+                initial_message: initialAiMessage
+            }),
         });
 
         if (!response.ok) {
@@ -244,17 +247,33 @@ async function sendMessage() {
             throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
         }
 
-        const data = await response.json();
-        const aiReply = data.text;
+        let aiReply = '';
+        let replyBubble = null;
+        // readEventStream 定义在 ai_logic.js 中
+        await readEventStream(response, (eventName, data) => {
+            if (eventName === 'error') {
+                throw new Error(data.error);
+            }
+            if (eventName === 'done') {
+                conversationId = data.conversation_id;
+                return;
+            }
+            aiReply += data.text;
+            if (!replyBubble) {
+                hideTypingIndicator();
+                replyBubble = displayMessage('ai', aiReply);
+            } else {
+                appendMultilineText(replyBubble, data.text);
+                chatMessagesDiv.scrollTop = chatMessagesDiv.scrollHeight;
+            }
+        });
 
         hideTypingIndicator();
-        displayMessage('ai', aiReply);
-        chatHistory.push({ role: 'model', parts: [{ text: aiReply }] });
 
     } catch (error) {
         console.error('Error during AI chat:', error);
         hideTypingIndicator();
-        displayMessage('ai', `<span style="color: red;">AI回复失败: ${error.message}</span>`);
+        displayMessage('ai', `AI回复失败: ${error.message}`).style.color = 'red';
     } finally {
         chatSendBtn.disabled = false;
         chatInput.focus();
@@ -267,8 +286,8 @@ chatCloseBtn.addEventListener('click', function() {
 });
 
 chatNewBtn.addEventListener('click', function() {
-    // 重置对话历史为初始系统消息
-    chatHistory = [{ role: 'model', parts: [{ text: initialAiMessage }] }];
+    // 丢弃当前会话ID，下一条消息会在服务端开启新的会话
+    conversationId = null;
     chatMessagesDiv.innerHTML = ''; // 清空显示
     displayMessage('ai', initialAiMessage); // 显示欢迎消息
 });
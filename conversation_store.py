@@ -0,0 +1,162 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# 发送给模型的上下文的估算 token 上限
+DEFAULT_TOKEN_BUDGET = 4000
+DEFAULT_MAX_CONVERSATIONS = 1000
+# 会话闲置超过 1 小时后淘汰
+DEFAULT_IDLE_TTL_S = 3600
+# 固定保留的开头消息 (客户端提供的欢迎语) 的估算 token 上限，超出部分截掉
+MAX_PINNED_TOKENS = 500
+MESSAGE_ROLES = ('user', 'model')
+
+
+# 粗略估算 token 数：中日韩字符约 1 个 token，其余字符约 4 个一个 token
+def estimate_tokens(text):
+    cjk_chars = sum(1 for ch in text if '⺀' <= ch <= '鿿' or '가' <= ch <= '힯')
+    other_chars = len(text) - cjk_chars
+    return cjk_chars + (other_chars + 3) // 4
+
+
+def message_text(message):
+    return ''.join(part.get('text', '') for part in message.get('parts', []))
+
+
+# 截取文本开头，使估算 token 数不超过 max_tokens
+def truncate_text(text, max_tokens=MAX_PINNED_TOKENS):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+# 校验客户端提交的消息列表 (旧接口格式)：每条消息为 {"role": "user"|"model", "parts": [{"text": "..."}]}，
+# 格式不对时抛出 ValueError
+def validate_messages(messages):
+    if not isinstance(messages, list):
+        raise ValueError("messages 应为数组")
+    for index, message in enumerate(messages):
+        if not isinstance(message, dict) or message.get('role') not in MESSAGE_ROLES:
+            raise ValueError(f"messages[{index}] 应为带有 role (user 或 model) 的对象")
+        parts = message.get('parts')
+        if not isinstance(parts, list) or not all(isinstance(part, dict) and isinstance(part.get('text', ''), str)
+                                                  for part in parts):
+            raise ValueError(f"messages[{index}].parts 应为 {{\"text\": 字符串}} 对象的数组")
+
+
+# 按 token 预算截断历史：固定保留开头 pinned 条消息 (欢迎语/系统提示)，
+# 其余从最新的消息往前保留，直到超出预算；截断后第一条非固定消息必须是用户消息，保证问答成对
+def truncate_history(messages, token_budget=DEFAULT_TOKEN_BUDGET, pinned=1):
+    pinned_messages = messages[:pinned]
+    used = sum(estimate_tokens(message_text(message)) for message in pinned_messages)
+    kept = []
+    for message in reversed(messages[pinned:]):
+        cost = estimate_tokens(message_text(message))
+        if kept and used + cost > token_budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    while len(kept) > 1 and kept[0].get('role') != 'user':
+        kept.pop(0)
+    return pinned_messages + kept
+
+
+# 服务端对话会话存储：客户端只需发送会话ID和新的一轮消息，
+# 历史保存在服务端，按闲置时间和会话总数 (LRU) 淘汰
+class ConversationStore:
+    def __init__(self, max_conversations=DEFAULT_MAX_CONVERSATIONS, idle_ttl_s=DEFAULT_IDLE_TTL_S,
+                 token_budget=DEFAULT_TOKEN_BUDGET):
+        self.max_conversations = max_conversations
+        self.idle_ttl_s = idle_ttl_s
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._conversations = OrderedDict()  # conversation_id -> {'messages': [...], 'pinned': n, 'last_access': t}
+        self._stats = {'created': 0, 'evicted': 0, 'expired': 0, 'truncated_requests': 0}
+
+    def _evict_locked(self, now):
+        expired = [cid for cid, conv in self._conversations.items() if now - conv['last_access'] > self.idle_ttl_s]
+        for cid in expired:
+            del self._conversations[cid]
+        self._stats['expired'] += len(expired)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self._stats['evicted'] += 1
+
+    def _create_locked(self, initial_messages, now):
+        conversation_id = uuid.uuid4().hex
+        initial_messages = list(initial_messages or [])
+        self._conversations[conversation_id] = {
+            'messages': initial_messages,
+            'pinned': len(initial_messages),
+            'last_access': now,
+        }
+        self._stats['created'] += 1
+        return conversation_id
+
+    # 新建会话，initial_messages 作为固定保留的开头消息
+    def create(self, initial_messages=None):
+        now = time.time()
+        with self._lock:
+            conversation_id = self._create_locked(initial_messages, now)
+            self._evict_locked(now)
+        return conversation_id
+
+    # 取出会话并构造发送给模型的上下文 (历史 + 新的用户消息，再按 token 预算截断)，返回 (会话ID, 上下文)；
+    # 会话ID缺失或已被淘汰时在同一把锁内新建会话，不会在检查与读取之间被淘汰
+    def get_or_create(self, conversation_id, initial_messages, new_message):
+        now = time.time()
+        with self._lock:
+            self._evict_locked(now)
+            conversation = self._conversations.get(conversation_id) if conversation_id else None
+            if conversation is None:
+                conversation_id = self._create_locked(initial_messages, now)
+                self._evict_locked(now)
+                conversation = self._conversations[conversation_id]
+            conversation['last_access'] = now
+            self._conversations.move_to_end(conversation_id)
+            messages = conversation['messages'] + [new_message]
+            pinned = conversation['pinned']
+        context = truncate_history(messages, self.token_budget, pinned=pinned)
+        if len(context) < len(messages):
+            with self._lock:
+                self._stats['truncated_requests'] += 1
+        return conversation_id, context
+
+    # 对客户端自带的完整历史 (旧接口格式) 做同样的截断，开头的模型欢迎语固定保留 (长度按 MAX_PINNED_TOKENS 截断)
+    def truncate(self, messages):
+        pinned = 1 if messages and messages[0].get('role') == 'model' else 0
+        if pinned:
+            messages = [{'role': 'model', 'parts': [{'text': truncate_text(message_text(messages[0]))}]}] + messages[1:]
+        context = truncate_history(messages, self.token_budget, pinned=pinned)
+        if len(context) < len(messages):
+            with self._lock:
+                self._stats['truncated_requests'] += 1
+        return context
+
+    # 模型成功回复后才把这一轮 (用户消息 + 模型回复) 写入历史，失败的请求不会留下半轮对话。
+    # 保存的历史同样按 token 预算截断 (保留固定的开头消息)：超出预算的旧消息不会再发送给模型，无需保留
+    def append_turn(self, conversation_id, user_message, model_message):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return
+            messages = conversation['messages'] + [user_message, model_message]
+            conversation['messages'] = truncate_history(messages, self.token_budget, pinned=conversation['pinned'])
+            conversation['last_access'] = time.time()
+            self._conversations.move_to_end(conversation_id)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['active_conversations'] = len(self._conversations)
+        snapshot['token_budget'] = self.token_budget
+        return snapshot
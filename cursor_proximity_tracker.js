@@ -33,7 +33,19 @@ document.body.appendChild(currentFocusDisplay);
 // --- 全局变量和配置 ---
 // 存储发送失败的数据点，作为重试缓冲区
 let failedProximityDataBuffer = [];
+// 存储尚未发送的新采样点，按批量大小或时间间隔一次性发送
+let pendingProximityDataBuffer = [];
+let isFlushInProgress = false;
+let batchSequence = 0;
 const SAMPLE_INTERVAL_MS = 100; // 0.1秒采样间隔
+const BATCH_ENDPOINT_URL = 'http://localhost:5000/api/save_session_batch';
+const BATCH_MAX_POINTS = 200; // 缓冲区达到200个点时立即发送
+const BATCH_FLUSH_INTERVAL_MS = 5000; // 最长每5秒发送一次
+const MAX_POINTS_PER_REQUEST = 5000; // 单个请求最多发送的点数，低于后端 trajectory_ingest.MAX_POINTS_PER_BATCH (20000)
+const MAX_RETRY_BUFFER_POINTS = 10000; // 重试缓冲区上限，防止后端长时间不可用时内存无限增长
+const UNLOAD_BEACON_MAX_POINTS = 1000; // 页面卸载时每个 sendBeacon 请求的点数
+const UNLOAD_MAX_PAYLOAD_CHARS = 60000; // 卸载时所有 beacon/keepalive 请求体合计不超过约 64KB 的浏览器上限
+const COORD_SCALE = 1000000; // 经纬度取整缩放系数，需与后端 trajectory_ingest.COORD_SCALE 一致
 
 // 定义亲近等级及其对应的分数贡献值 (这些等级现在主要用于前端UI显示，后端不依赖它们)
 const PROXIMITY_LEVELS = [
@@ -95,66 +107,135 @@ function getProximityLevelScore(distance_m) {
     return 1;
 }
 
-// --- 异步函数：发送单个原始数据点到后端 ---
-async function sendSingleRawDataPoint(dataPoint) {
-    // 这里的 payload 结构现在更简单，只包含原始经纬度、时间戳和会话信息
+// --- 批量发送：将采样点编码为紧凑的列式/差分整数负载 ---
+// 时间戳以 t0 为基准做差分，经纬度乘以 COORD_SCALE 取整后做差分，
+// 相邻采样点的差值通常只有几位数字，JSON 体积远小于逐点发送的对象数组
+function encodePointBatch(dataPoints, isFinal) {
+    const sorted = dataPoints.slice().sort((a, b) => a.timestamp - b.timestamp);
+    const timestamps = [];
+    const latitudes = [];
+    const longitudes = [];
+    let prevT = sorted.length > 0 ? sorted[0].timestamp : 0;
+    let prevLat = 0;
+    let prevLon = 0;
+    sorted.forEach((point, index) => {
+        const lat = Math.round(point.latitude * COORD_SCALE);
+        const lon = Math.round(point.longitude * COORD_SCALE);
+        timestamps.push(index === 0 ? 0 : point.timestamp - prevT);
+        latitudes.push(index === 0 ? lat : lat - prevLat);
+        longitudes.push(index === 0 ? lon : lon - prevLon);
+        prevT = point.timestamp;
+        prevLat = lat;
+        prevLon = lon;
+    });
+
     const payload = {
         session_id: sessionId,
-        start_time: new Date(currentSessionStartTime).toISOString(), // 会话开始时间
-        // 注意：这里 location_history 仍然是一个数组，但只包含一个数据点
-        location_history: [{
-            timestamp: dataPoint.timestamp,
-            latitude: dataPoint.latitude,
-            longitude: dataPoint.longitude
-        }]
+        start_time: new Date(currentSessionStartTime).toISOString(),
+        batch_seq: batchSequence++,
+        encoding: 'delta-int',
+        scale: COORD_SCALE,
+        t0: sorted.length > 0 ? sorted[0].timestamp : 0,
+        timestamps: timestamps,
+        latitudes: latitudes,
+        longitudes: longitudes
     };
+    if (isFinal) {
+        payload.end_time = new Date(Date.now()).toISOString();
+    }
+    return payload;
+}
 
-    const jsonString = JSON.stringify(payload);
+// --- 把采样点放入待发送缓冲区，达到批量大小时立即发送 ---
+function bufferRawDataPoint(dataPoint) {
+    pendingProximityDataBuffer.push(dataPoint);
+    if (pendingProximityDataBuffer.length >= BATCH_MAX_POINTS) {
+        flushProximityDataBuffer();
+    }
+}
 
-    // console.log(`Attempting to send single raw data point via fetch.`);
-    // console.log("Single point payload size (chars):", jsonString.length);
+// --- 取出待发送的点 (最多 maxPoints 个)：先取上次失败的点，再取新采样点，剩余的点留在缓冲区 ---
+function takeBatchForSending(maxPoints) {
+    const fromFailed = failedProximityDataBuffer.slice(0, maxPoints);
+    failedProximityDataBuffer = failedProximityDataBuffer.slice(fromFailed.length);
+    const fromPending = pendingProximityDataBuffer.slice(0, maxPoints - fromFailed.length);
+    pendingProximityDataBuffer = pendingProximityDataBuffer.slice(fromPending.length);
+    return fromFailed.concat(fromPending);
+}
 
+// 4xx 表示请求本身有问题，重试也不会成功；408/429 (超时/限流) 以及 5xx 仍然重试
+function isRetryableStatus(status) {
+    return status >= 500 || status === 408 || status === 429;
+}
+
+// --- 发送失败时，把整批数据放回重试缓冲区 (超出上限时丢弃最旧的点) ---
+function requeueFailedBatch(batch) {
+    failedProximityDataBuffer = batch.concat(failedProximityDataBuffer);
+    if (failedProximityDataBuffer.length > MAX_RETRY_BUFFER_POINTS) {
+        failedProximityDataBuffer = failedProximityDataBuffer.slice(-MAX_RETRY_BUFFER_POINTS);
+    }
+    console.log(`Batch added back to retry buffer. Buffer size: ${failedProximityDataBuffer.length}`);
+}
+
+// --- 发送一个批次，返回是否应继续发送缓冲区中剩余的点 (失败并放回重试缓冲区时返回 false) ---
+async function sendPointBatch(batch) {
+    const jsonString = JSON.stringify(encodePointBatch(batch, false));
     try {
         const controller = new AbortController();
-        // 缩短超时时间，因为是实时发送，希望快速响应
-        const id = setTimeout(() => controller.abort(), 2000); // 2秒超时
+        const id = setTimeout(() => controller.abort(), 5000); // 5秒超时
 
-        const responsePromise = fetch('http://localhost:5000/api/save_session_data', {
+        const response = await fetch(BATCH_ENDPOINT_URL, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: jsonString,
-            keepalive: true, // 尝试使用 keepalive，以增加在页面卸载时发送成功的可能性
+            keepalive: jsonString.length < 60000, // keepalive 请求体有 64KB 上限
             signal: controller.signal
         });
 
-        const response = await Promise.race([
-            responsePromise,
-            new Promise((resolve, reject) => setTimeout(() => reject(new Error('Fetch timeout'))))
-        ]);
-
         clearTimeout(id); // 清除超时定时器
 
         if (!response.ok) {
             const errorText = await response.text();
-            console.error('Single raw data point send failed:', response.status, errorText);
-            // 如果发送失败，将原始数据点添加到重试缓冲区
-            failedProximityDataBuffer.push(dataPoint);
-            console.log(`Raw data point added to retry buffer. Buffer size: ${failedProximityDataBuffer.length}`);
-        } else {
-            const result = await response.json();
-            // console.log('Single raw data point sent successfully:', result);
+            console.error('Batch send failed:', response.status, errorText);
+            if (!isRetryableStatus(response.status)) {
+                console.error(`Batch rejected by server, dropping ${batch.length} points.`);
+                return true;
+            }
+            requeueFailedBatch(batch);
+            return false;
         }
+        return true;
     } catch (error) {
-        console.error('Error sending single raw data point:', error.message);
+        console.error('Error sending batch:', error.message);
         if (error.name === 'AbortError') {
             console.error('Fetch was aborted due to timeout.');
         }
-        // 如果发送失败，将原始数据点添加到重试缓冲区
-        failedProximityDataBuffer.push(dataPoint);
-        console.log(`Raw data point added to retry buffer. Buffer size: ${failedProximityDataBuffer.length}`);
+        requeueFailedBatch(batch);
+        return false;
     }
 }
 
+// --- 异步函数：按大小或时间触发，将缓冲区中的数据点分批 (每批不超过 MAX_POINTS_PER_REQUEST) 发送到后端 ---
+async function flushProximityDataBuffer() {
+    if (isFlushInProgress) {
+        return; // 上一个批次尚未完成，新点会留在缓冲区中等待下一次发送
+    }
+    isFlushInProgress = true;
+    try {
+        while (true) {
+            const batch = takeBatchForSending(MAX_POINTS_PER_REQUEST);
+            if (batch.length === 0 || !(await sendPointBatch(batch))) {
+                break;
+            }
+        }
+    } finally {
+        isFlushInProgress = false;
+    }
+}
+
+// 定时发送，保证低频移动时数据也不会在缓冲区里停留太久
+setInterval(flushProximityDataBuffer, BATCH_FLUSH_INTERVAL_MS);
+
 
 // --- 核心：等待地图实例可用并直接附加事件监听器 ---
 let mapInstanceCheckInterval = null;
@@ -202,7 +283,7 @@ function initializeCursorTracker() {
                     console.warn("mapLocations is empty, cannot determine closest location for UI.");
                 }
 
-                // --- 核心逻辑：创建原始数据点并立即尝试发送 ---
+                // --- 核心逻辑：创建原始数据点并放入批量发送缓冲区 ---
                 const currentRawDataPoint = {
                     timestamp: currentTimestamp,
                     latitude: currentLat,
@@ -210,7 +291,7 @@ function initializeCursorTracker() {
                     // 注意：这里不再包含 proximity_scores_at_this_point
                 };
 
-                sendSingleRawDataPoint(currentRawDataPoint); // 立即发送此原始数据点
+                bufferRawDataPoint(currentRawDataPoint); // 放入缓冲区，按批量大小或时间间隔发送
 
                 // --- 更新实时显示 UI ---
                 let displayMessage = `当前关注: ${closestLocationName} (${minDistanceOverall.toFixed(0)}m)`;
@@ -227,59 +308,40 @@ mapInstanceCheckInterval = setInterval(initializeCursorTracker, MAP_CHECK_INTERV
 
 
 // --- 页面卸载时发送剩余数据 (作为最后保障) ---
-window.addEventListener('beforeunload', async function(e) {
-    console.log("beforeunload event triggered. Attempting to send remaining data from buffer.");
-
-    if (failedProximityDataBuffer.length === 0) {
-        console.warn("failedProximityDataBuffer is empty, no remaining data to send on unload.");
-        return; // 没有数据可发送
-    }
-
-    // 格式化数据以匹配 Python 后端期望的 JSON 结构
-    // 这里的 location_history 包含所有发送失败的原始数据点
-    const sessionData = {
-        session_id: sessionId, // 使用会话开始时生成的唯一ID
-        start_time: new Date(currentSessionStartTime).toISOString(),
-        end_time: new Date(Date.now()).toISOString(),
-        location_history: failedProximityDataBuffer // 发送所有剩余的原始数据
-    };
-
-    const jsonString = JSON.stringify(sessionData);
-
-    console.log("Attempting to send remaining session data on unload via blocking fetch.");
-    console.log("Remaining payload size (chars):", jsonString.length);
-
-    try {
-        // 卸载时的超时可以稍微长一点，但仍需谨慎
-        const controller = new AbortController();
-        const id = setTimeout(() => controller.abort(), 5000); // 5秒超时
-
-        const responsePromise = fetch('http://localhost:5000/api/save_session_data', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: jsonString,
-            keepalive: true, // 仍然使用 keepalive
-            signal: controller.signal
-        });
-
-        const response = await Promise.race([
-            responsePromise,
-            new Promise((resolve, reject) => setTimeout(() => reject(new Error('Fetch timeout'))))
-        ]);
-
-        clearTimeout(id); // 清除超时定时器
+// 卸载阶段异步 fetch 可能被浏览器取消，优先使用 navigator.sendBeacon
+// (使用 text/plain 避免跨域预检，后端以 force=True 解析 JSON)。
+// beacon 与 keepalive 请求体合计约有 64KB 上限，因此按 UNLOAD_BEACON_MAX_POINTS 分块发送，
+// 总大小超过 UNLOAD_MAX_PAYLOAD_CHARS 后剩余的点只能放弃
+window.addEventListener('beforeunload', function(e) {
+    let sentChars = 0;
+    let sentPoints = 0;
+    while (true) {
+        const batch = takeBatchForSending(UNLOAD_BEACON_MAX_POINTS);
+        if (batch.length === 0) {
+            break;
+        }
+        const isLast = failedProximityDataBuffer.length === 0 && pendingProximityDataBuffer.length === 0;
+        const jsonString = JSON.stringify(encodePointBatch(batch, isLast));
+        if (sentChars + jsonString.length > UNLOAD_MAX_PAYLOAD_CHARS) {
+            console.warn("beforeunload: unload payload limit reached, dropping remaining points:",
+                batch.length + failedProximityDataBuffer.length + pendingProximityDataBuffer.length);
+            break;
+        }
 
-        if (!response.ok) {
-            const errorText = await response.text();
-            console.error('Remaining data send failed on unload:', response.status, errorText);
-        } else {
-            const result = await response.json();
-            console.log('Remaining data sent successfully on unload:', result);
+        let queued = false;
+        if (navigator.sendBeacon) {
+            queued = navigator.sendBeacon(BATCH_ENDPOINT_URL, new Blob([jsonString], { type: 'text/plain;charset=UTF-8' }));
         }
-    } catch (error) {
-        console.error('Error sending remaining data on unload:', error.message);
-        if (error.name === 'AbortError') {
-            console.error('Fetch was aborted due to timeout.');
+        if (!queued) {
+            fetch(BATCH_ENDPOINT_URL, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: jsonString,
+                keepalive: true
+            }).catch(error => console.error('Error sending remaining data on unload:', error.message));
         }
+        sentChars += jsonString.length;
+        sentPoints += batch.length;
     }
+    console.log("Sent remaining session data on unload. Points:", sentPoints, "payload size (chars):", sentChars);
 });
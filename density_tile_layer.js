@@ -0,0 +1,84 @@
+// density_tile_layer.js
+
+// --- 用户活动密度瓦片图层 ---
+// 只请求当前视口内的瓦片 (由 ai.py /api/density_tiles/<z>/<x>/<y> 提供)，
+// 每个瓦片是服务端预先聚合好的格子计数，在 canvas 上直接绘制，不需要把原始点下载到浏览器。
+
+const DENSITY_TILE_URL = 'http://localhost:5000/api/density_tiles';
+// 与 session_analyzer.py 中热力图色带保持一致
+const DENSITY_COLOR_STOPS = ['#0000FF', '#00FFFF', '#00FF00', '#FFFF00', '#FF8C00', '#FF4500', '#8B0000'];
+
+// 把 '#RRGGBB' 转为 [r, g, b]
+function hexToRgb(hex) {
+    const value = parseInt(hex.slice(1), 16);
+    return [(value >> 16) & 255, (value >> 8) & 255, value & 255];
+}
+
+const DENSITY_COLOR_RGB = DENSITY_COLOR_STOPS.map(hexToRgb);
+
+// 0~1 的强度映射为色带上的颜色 (线性插值)
+function densityColor(intensity) {
+    const t = Math.min(Math.max(intensity, 0), 1) * (DENSITY_COLOR_RGB.length - 1);
+    const lower = Math.floor(t);
+    const upper = Math.min(lower + 1, DENSITY_COLOR_RGB.length - 1);
+    const frac = t - lower;
+    const rgb = DENSITY_COLOR_RGB[lower].map((c, i) => Math.round(c + (DENSITY_COLOR_RGB[upper][i] - c) * frac));
+    return `rgb(${rgb[0]}, ${rgb[1]}, ${rgb[2]})`;
+}
+
+const DensityTileLayer = L.GridLayer.extend({
+    options: {
+        opacity: 0.6,
+        minZoom: 10,
+        maxZoom: 18
+    },
+
+    createTile: function(coords, done) {
+        const tile = document.createElement('canvas');
+        const size = this.getTileSize();
+        tile.width = size.x;
+        tile.height = size.y;
+
+        fetch(`${DENSITY_TILE_URL}/${coords.z}/${coords.x}/${coords.y}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('密度瓦片请求失败: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(data => {
+                const ctx = tile.getContext('2d');
+                const cellWidth = size.x / data.bins;
+                const cellHeight = size.y / data.bins;
+                // 对数缩放，避免少数热点格子把其余格子压成同一种颜色
+                const logMax = Math.log1p(data.max_count || 1);
+                data.cells.forEach(([cell, count]) => {
+                    const row = Math.floor(cell / data.bins);
+                    const col = cell % data.bins;
+                    ctx.fillStyle = densityColor(Math.log1p(count) / logMax);
+                    ctx.fillRect(col * cellWidth, row * cellHeight, cellWidth, cellHeight);
+                });
+                done(null, tile);
+            })
+            .catch(error => {
+                console.warn(error.message);
+                done(null, tile); // 失败时显示空白瓦片，不影响其他图层
+            });
+
+        return tile;
+    }
+});
+
+// 等待 folium 地图实例就绪后，把密度图层加入图层控件 (默认不显示)
+document.addEventListener('DOMContentLoaded', function() {
+    const mapContainer = document.querySelector('.folium-map');
+    if (!mapContainer || !window[mapContainer.id]) {
+        console.warn("density_tile_layer: 未找到地图实例，密度瓦片图层未加载。");
+        return;
+    }
+    const densityMap = window[mapContainer.id];
+    densityMap.whenReady(function() {
+        const densityLayer = new DensityTileLayer();
+        L.control.layers(null, { '用户活动密度': densityLayer }, { position: 'bottomright' }).addTo(densityMap);
+    });
+});
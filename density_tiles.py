@@ -0,0 +1,286 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+# 与 map.py 中 folium.Map(min_zoom=10, max_zoom=18) 保持一致
+TILE_MIN_ZOOM = 10
+TILE_MAX_ZOOM = 18
+# 请求中允许的最大缩放级别 (Web 墨卡托瓦片坐标的常用上限)，更大的 z 直接视为不存在
+MAX_REQUEST_ZOOM = 30
+# 每个 256 像素瓦片划分为 64×64 个格子 (每格 4 像素)
+TILE_BINS = 64
+DEFAULT_TILE_DIR = 'density_tiles'
+MANIFEST_FILENAME = 'manifest.json'
+# 瓦片目录下指向当前版本的指针文件，以及各版本所在的子目录
+CURRENT_FILENAME = 'current.json'
+BUILDS_DIRNAME = 'builds'
+# 保留的版本数 (当前版本 + 上一版本)：服务端可能仍内存映射着上一版本的文件，Windows 下无法删除
+KEEP_TILE_BUILDS = 2
+# Web 墨卡托投影的纬度上限
+MAX_MERCATOR_LAT = 85.05112878
+
+
+# 经纬度 → Web 墨卡托归一化坐标 (0~1)，与 Leaflet 默认的 EPSG:3857 瓦片编号一致
+def lonlat_to_mercator_unit(lats, lons):
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = (lons + 180.0) / 360.0
+    lat_rad = np.radians(lats)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / math.pi) / 2.0
+    return x, y
+
+
+# 在给定缩放级别下，把全局格子坐标 (bin_x, bin_y) 编码为单个 int64 键
+def _encode_bins(bin_x, bin_y, zoom, bins):
+    return bin_x * (bins << zoom) + bin_y
+
+
+def _decode_bins(keys, zoom, bins):
+    return keys // (bins << zoom), keys % (bins << zoom)
+
+
+# 稀疏累加：合并相同键的计数
+def _reduce_counts(keys, counts):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=counts, minlength=len(unique_keys)).astype(np.int64)
+
+
+# 构建多级密度瓦片金字塔：先在最高缩放级别分箱，再逐级把 2×2 格子合并到上一级，结果精确一致。
+# 每次构建写入 builds/<构建版本>/ 子目录，写完后原子替换 current.json 指向新版本：
+# 不重命名正在使用的目录，服务端在任何时刻都能读到一版完整的瓦片
+# 磁盘格式 (版本目录下每个缩放级别一个目录，全部为 .npy，可内存映射读取):
+#   tiles.npy   : int64 瓦片键 (x * 2^z + y)，升序
+#   offsets.npy : int64，第 i 个瓦片的格子位于 [offsets[i], offsets[i+1])
+#   cells.npy   : uint16，瓦片内格子下标 row * TILE_BINS + col
+#   counts.npy  : uint32，格子内的点数
+def build_density_tile_pyramid(point_chunks, output_dir=DEFAULT_TILE_DIR, min_zoom=TILE_MIN_ZOOM,
+                               max_zoom=TILE_MAX_ZOOM, bins=TILE_BINS):
+    print(f"--- 开始构建密度瓦片金字塔 (缩放级别 {min_zoom}-{max_zoom}) ---")
+    start_time = time.time()
+
+    keys = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+    total_points = 0
+    scale = bins << max_zoom
+    for chunk in point_chunks:
+        user_lats, user_lons = chunk[0], chunk[1]
+        if len(user_lats) == 0:
+            continue
+        # 可选的第三列为每个点代表的原始采样数 (入库简化后的轨迹点)
+        weights = chunk[2] if len(chunk) > 2 and chunk[2] is not None else np.ones(len(user_lats))
+        total_points += int(np.sum(weights))
+        x, y = lonlat_to_mercator_unit(user_lats, user_lons)
+        bin_x = np.clip(np.floor(x * scale).astype(np.int64), 0, scale - 1)
+        bin_y = np.clip(np.floor(y * scale).astype(np.int64), 0, scale - 1)
+        chunk_keys, chunk_counts = _reduce_counts(_encode_bins(bin_x, bin_y, max_zoom, bins),
+                                                  np.asarray(weights, dtype=np.float64))
+        keys, counts = _reduce_counts(np.concatenate([keys, chunk_keys]),
+                                      np.concatenate([counts, chunk_counts]).astype(np.float64))
+
+    # 构建版本由最高级别的格子计数及参数决定：数据相同则版本相同，数据变化则版本 (及 ETag) 一定变化
+    digest = hashlib.sha256(json.dumps([min_zoom, max_zoom, bins]).encode('utf-8'))
+    digest.update(np.ascontiguousarray(keys, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(counts, dtype=np.int64).tobytes())
+    build_id = digest.hexdigest()[:16]
+
+    builds_dir = os.path.join(output_dir, BUILDS_DIRNAME)
+    build_dir = os.path.join(builds_dir, build_id)
+    tmp_dir = os.path.join(builds_dir, f'{build_id}.tmp')
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+
+    zoom_summaries = {}
+    bin_x, bin_y = _decode_bins(keys, max_zoom, bins)
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        if zoom < max_zoom:
+            # 上一级的格子坐标减半即为父级格子，合并计数
+            bin_x, bin_y = bin_x >> 1, bin_y >> 1
+            zoom_keys, counts = _reduce_counts(_encode_bins(bin_x, bin_y, zoom, bins), counts.astype(np.float64))
+            bin_x, bin_y = _decode_bins(zoom_keys, zoom, bins)
+        zoom_summaries[str(zoom)] = _write_zoom_level(tmp_dir, zoom, bin_x, bin_y, counts, bins)
+
+    manifest = {
+        'build_id': build_id,
+        'built_at': time.time(),
+        'min_zoom': min_zoom,
+        'max_zoom': max_zoom,
+        'bins': bins,
+        'total_points': total_points,
+        'zooms': zoom_summaries,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(build_dir):
+        # 数据未变化，已有相同版本 (可能正被服务端读取)，直接复用
+        shutil.rmtree(tmp_dir)
+    else:
+        os.rename(tmp_dir, build_dir)
+    _write_json_atomic(os.path.join(output_dir, CURRENT_FILENAME),
+                       {'build_id': build_id, 'path': f'{BUILDS_DIRNAME}/{build_id}', 'built_at': manifest['built_at']})
+    _prune_builds(builds_dir, build_id)
+    _remove_legacy_layout(output_dir)
+
+    print(f"共 {total_points} 个点，瓦片已写入 '{build_dir}'，构建版本 {build_id}，"
+          f"耗时 {time.time() - start_time:.2f} 秒")
+    print(f"--- 密度瓦片金字塔构建结束 ---")
+    return manifest
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# 删除较旧的版本目录 (按修改时间保留最近 KEEP_TILE_BUILDS 个，当前版本始终保留)；
+# 仍被其他进程内存映射的文件在 Windows 下删除失败，留到下次构建时再清理
+def _prune_builds(builds_dir, current_build_id):
+    builds = [name for name in os.listdir(builds_dir)
+              if name != current_build_id and os.path.isdir(os.path.join(builds_dir, name))]
+    builds.sort(key=lambda name: os.path.getmtime(os.path.join(builds_dir, name)), reverse=True)
+    for name in builds[KEEP_TILE_BUILDS - 1:]:
+        try:
+            shutil.rmtree(os.path.join(builds_dir, name))
+        except OSError as e:
+            print(f"旧的密度瓦片版本 '{name}' 暂时无法删除: {e}")
+
+
+# 删除旧格式 (清单和各缩放级别目录直接位于瓦片目录下) 留下的文件，失败时忽略
+def _remove_legacy_layout(output_dir):
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        try:
+            if name == MANIFEST_FILENAME:
+                os.remove(path)
+            elif name.isdigit() and os.path.isdir(path):
+                shutil.rmtree(path)
+        except OSError as e:
+            print(f"旧格式的密度瓦片文件 '{path}' 暂时无法删除: {e}")
+
+
+def _write_zoom_level(output_dir, zoom, bin_x, bin_y, counts, bins):
+    zoom_dir = os.path.join(output_dir, str(zoom))
+    os.makedirs(zoom_dir)
+
+    tile_keys = (bin_x // bins) * (1 << zoom) + (bin_y // bins)
+    cells = ((bin_y % bins) * bins + (bin_x % bins)).astype(np.uint16)
+    order = np.lexsort((cells, tile_keys))
+    tile_keys, cells, sorted_counts = tile_keys[order], cells[order], counts[order]
+    unique_tiles, tile_starts = np.unique(tile_keys, return_index=True)
+    offsets = np.append(tile_starts, len(tile_keys)).astype(np.int64)
+
+    np.save(os.path.join(zoom_dir, 'tiles.npy'), unique_tiles.astype(np.int64))
+    np.save(os.path.join(zoom_dir, 'offsets.npy'), offsets)
+    np.save(os.path.join(zoom_dir, 'cells.npy'), cells)
+    np.save(os.path.join(zoom_dir, 'counts.npy'), np.minimum(sorted_counts, np.iinfo(np.uint32).max).astype(np.uint32))
+
+    max_count = int(sorted_counts.max()) if len(sorted_counts) else 0
+    print(f"缩放级别 {zoom}: {len(unique_tiles)} 个瓦片，{len(cells)} 个非空格子，单格最大点数 {max_count}")
+    return {'tiles': int(len(unique_tiles)), 'cells': int(len(cells)), 'max_count': max_count}
+
+
+# 瓦片读取端：按缩放级别惰性地内存映射 .npy 文件，current.json 指向新版本 (重新构建) 后自动切换
+# 瓦片坐标是否在该缩放级别的有效范围内 (超出范围的 x/y 会与其他瓦片的编号重叠)
+def tile_in_range(zoom, x, y):
+    return 0 <= zoom <= MAX_REQUEST_ZOOM and 0 <= x < (1 << zoom) and 0 <= y < (1 << zoom)
+
+
+class DensityTileStore:
+    def __init__(self, tile_dir=DEFAULT_TILE_DIR):
+        self.tile_dir = tile_dir
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._build_dir = None
+        self._pointer_mtime = None
+        self._levels = {}
+
+    # 读取 current.json 指向的版本目录；没有指针文件时兼容旧格式 (清单直接位于瓦片目录下)
+    def _current_build_dir(self):
+        pointer_path = os.path.join(self.tile_dir, CURRENT_FILENAME)
+        try:
+            with open(pointer_path, 'r', encoding='utf-8') as f:
+                return os.path.join(self.tile_dir, json.load(f)['path'])
+        except (OSError, ValueError, KeyError, TypeError):
+            if os.path.exists(os.path.join(self.tile_dir, MANIFEST_FILENAME)):
+                return self.tile_dir
+            return None
+
+    # 每次请求只 stat 一次指针文件，修改时间变化 (重新构建) 后才重新读取
+    def _refresh(self):
+        try:
+            pointer_mtime = os.stat(os.path.join(self.tile_dir, CURRENT_FILENAME)).st_mtime_ns
+        except OSError:
+            pointer_mtime = None
+        if pointer_mtime is not None and pointer_mtime == self._pointer_mtime and self._manifest is not None:
+            return
+        self._pointer_mtime = pointer_mtime
+        build_dir = self._current_build_dir()
+        if build_dir is None:
+            self._manifest, self._build_dir, self._levels = None, None, {}
+            return
+        if build_dir != self._build_dir:
+            try:
+                with open(os.path.join(build_dir, MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"警告: 无法读取密度瓦片清单 '{build_dir}': {e}")
+                return
+            self._manifest, self._build_dir, self._levels = manifest, build_dir, {}
+
+    def manifest(self):
+        with self._lock:
+            self._refresh()
+            return self._manifest
+
+    def _level(self, zoom):
+        if zoom not in self._levels:
+            zoom_dir = os.path.join(self._build_dir, str(zoom))
+            self._levels[zoom] = {
+                name: np.load(os.path.join(zoom_dir, f'{name}.npy'), mmap_mode='r')
+                for name in ('tiles', 'offsets', 'cells', 'counts')
+            }
+        return self._levels[zoom]
+
+    # 返回 (清单, 格子下标数组, 计数数组)；缩放级别不在金字塔中或 x/y 超出 0 ~ 2^zoom - 1 时返回 (清单, None, None)
+    def get_tile(self, zoom, x, y):
+        if not tile_in_range(zoom, x, y):
+            return self.manifest(), None, None
+        with self._lock:
+            self._refresh()
+            manifest = self._manifest
+            if manifest is None or str(zoom) not in manifest['zooms']:
+                return manifest, None, None
+            level = self._level(zoom)
+        tile_key = x * (1 << zoom) + y
+        position = int(np.searchsorted(level['tiles'], tile_key))
+        if position >= len(level['tiles']) or level['tiles'][position] != tile_key:
+            return manifest, np.empty(0, dtype=np.uint16), np.empty(0, dtype=np.uint32)
+        start, end = int(level['offsets'][position]), int(level['offsets'][position + 1])
+        return manifest, np.asarray(level['cells'][start:end]), np.asarray(level['counts'][start:end])
+
+    # ETag 与响应体都由 get_tile 返回的同一份清单生成，请求期间发布新版本也不会错配
+    @staticmethod
+    def etag(manifest, zoom, x, y):
+        build_id = manifest['build_id'] if manifest else 'empty'
+        return f'"{build_id}-{zoom}-{x}-{y}"'
+
+    # 转为前端使用的紧凑 JSON：cells 为 [格子下标, 点数] 列表，max_count 用于前端配色
+    @staticmethod
+    def tile_payload(manifest, zoom, x, y, cells, counts):
+        return {
+            'z': zoom,
+            'x': x,
+            'y': y,
+            'bins': manifest['bins'],
+            'max_count': manifest['zooms'][str(zoom)]['max_count'],
+            'cells': [[int(cell), int(count)] for cell, count in zip(cells.tolist(), counts.tolist())],
+        }
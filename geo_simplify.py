@@ -0,0 +1,177 @@
+import json
+import math
+import os
+
+import numpy as np
+
+# Web 墨卡托在 0 级、赤道处每像素对应的米数
+METERS_PER_PIXEL_Z0 = 156543.03392
+METERS_PER_DEGREE = 111320.0
+# 默认允许的最大偏差：半个像素，描边后肉眼看不出差别
+DEFAULT_PIXEL_TOLERANCE = 0.5
+
+
+# 某缩放级别、某纬度处每像素对应的地面距离 (米)
+def meters_per_pixel(zoom, lat):
+    return METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / (2 ** zoom)
+
+
+# 在该缩放级别下偏差不超过 pixel_tolerance 像素对应的简化容差 (米)
+def tolerance_for_zoom(zoom, lat, pixel_tolerance=DEFAULT_PIXEL_TOLERANCE):
+    return meters_per_pixel(zoom, lat) * pixel_tolerance
+
+
+# 量化精度 (小数位数)：取整误差 (半个最小单位) 不超过容差
+def precision_for_tolerance(tolerance_m):
+    step_deg = 2 * tolerance_m / METERS_PER_DEGREE
+    return int(min(7, max(3, math.ceil(-math.log10(step_deg)))))
+
+
+# Douglas–Peucker 简化，返回需要保留的点的布尔掩码 (首尾两点始终保留)。
+# 经纬度先按首点纬度做等距投影换算为米，距离计算按线段整体向量化
+def douglas_peucker_mask(coords, tolerance_m):
+    points = np.asarray(coords, dtype=np.float64)[:, :2]
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if n < 3:
+        return keep
+
+    lat0 = points[0, 1]
+    xy = np.column_stack([
+        (points[:, 0] - points[0, 0]) * METERS_PER_DEGREE * math.cos(math.radians(lat0)),
+        (points[:, 1] - lat0) * METERS_PER_DEGREE,
+    ])
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        length = math.hypot(segment[0], segment[1])
+        if length == 0.0:
+            # 起止点重合 (闭合环)，退化为到该点的距离
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance_m:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify_line(coords, tolerance_m):
+    mask = douglas_peucker_mask(coords, tolerance_m)
+    return [point for point, kept in zip(coords, mask) if kept]
+
+
+# 简化闭合环；简化后不足 4 个点 (无法构成多边形) 时保留原环
+def simplify_ring(ring, tolerance_m):
+    simplified = simplify_line(ring, tolerance_m)
+    return simplified if len(simplified) >= 4 else ring
+
+
+# 坐标保留 precision 位小数，并去掉取整后相邻重复的点
+def quantize_line(coords, precision):
+    quantized = []
+    for point in coords:
+        rounded = [round(value, precision) for value in point[:2]]
+        if not quantized or rounded != quantized[-1]:
+            quantized.append(rounded)
+    return quantized
+
+
+def quantize_ring(ring, precision):
+    quantized = quantize_line(ring, precision)
+    if quantized and quantized[0] != quantized[-1]:
+        quantized.append(list(quantized[0]))
+    return quantized if len(quantized) >= 4 else [[round(v, precision) for v in p[:2]] for p in ring]
+
+
+def _process_ring(ring, tolerance_m, precision):
+    ring = simplify_ring(ring, tolerance_m) if tolerance_m else ring
+    return quantize_ring(ring, precision) if precision is not None else ring
+
+
+def _process_line(line, tolerance_m, precision):
+    line = simplify_line(line, tolerance_m) if tolerance_m else line
+    return quantize_line(line, precision) if precision is not None else line
+
+
+# 简化并量化单个几何对象 (支持 LineString / MultiLineString / Polygon / MultiPolygon，其余类型原样返回)
+def simplify_geometry(geometry, tolerance_m, precision=None):
+    if geometry is None:
+        return None
+    geometry_type = geometry['type']
+    coordinates = geometry['coordinates'] if 'coordinates' in geometry else None
+    if geometry_type == 'LineString':
+        coordinates = _process_line(coordinates, tolerance_m, precision)
+    elif geometry_type == 'MultiLineString':
+        coordinates = [_process_line(line, tolerance_m, precision) for line in coordinates]
+    elif geometry_type == 'Polygon':
+        coordinates = [_process_ring(ring, tolerance_m, precision) for ring in coordinates]
+    elif geometry_type == 'MultiPolygon':
+        coordinates = [[_process_ring(ring, tolerance_m, precision) for ring in polygon] for polygon in coordinates]
+    else:
+        return geometry
+    return {'type': geometry_type, 'coordinates': coordinates}
+
+
+def count_vertices(geometry):
+    if geometry is None or 'coordinates' not in geometry:
+        return 0
+    depth = {'Point': 0, 'MultiPoint': 1, 'LineString': 1, 'MultiLineString': 2, 'Polygon': 2, 'MultiPolygon': 3}
+    items = [geometry['coordinates']]
+    for _ in range(depth.get(geometry['type'], 0)):
+        items = [child for item in items for child in item]
+    return len(items) if depth.get(geometry['type'], 0) else 1
+
+
+# 简化整个 FeatureCollection，返回新的对象 (不修改输入)；precision 为 None 时按容差自动选择小数位数
+def simplify_feature_collection(feature_collection, tolerance_m, precision=None):
+    if precision is None:
+        precision = precision_for_tolerance(tolerance_m)
+    features = []
+    for feature in feature_collection['features']:
+        simplified = dict(feature)
+        simplified['geometry'] = simplify_geometry(feature.get('geometry'), tolerance_m, precision)
+        features.append(simplified)
+    result = {key: value for key, value in feature_collection.items() if key != 'features'}
+    result['features'] = features
+    return result
+
+
+# 为多个缩放级别生成简化程度不同的版本 (LOD)：每个版本在对应缩放级别下偏差不超过 pixel_tolerance 像素，
+# 地图应使用不超过当前缩放级别的最大 LOD 版本
+def build_lod_variants(feature_collection, zooms, reference_lat, pixel_tolerance=DEFAULT_PIXEL_TOLERANCE):
+    variants = {}
+    for zoom in sorted(zooms):
+        tolerance_m = tolerance_for_zoom(zoom, reference_lat, pixel_tolerance)
+        variants[zoom] = simplify_feature_collection(feature_collection, tolerance_m)
+    return variants
+
+
+# 把各 LOD 版本写为 {output_dir}/{prefix}_z{zoom}.json，返回 {zoom: 文件路径}
+def write_lod_variants(variants, output_dir, prefix):
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for zoom, feature_collection in variants.items():
+        path = os.path.join(output_dir, f'{prefix}_z{zoom}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(feature_collection, f, ensure_ascii=False, separators=(',', ':'))
+        paths[zoom] = path
+    return paths
+
+
+def summarize_simplification(original, simplified):
+    before = sum(count_vertices(f.get('geometry')) for f in original['features'])
+    after = sum(count_vertices(f.get('geometry')) for f in simplified['features'])
+    size_before = len(json.dumps(original, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    size_after = len(json.dumps(simplified, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    return {'vertices_before': before, 'vertices_after': after, 'bytes_before': size_before, 'bytes_after': size_after}
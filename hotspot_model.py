@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import joblib
+import numpy as np
+
+# 热点模型目录：每次训练保存一个带版本号的模型包 (特征缩放器 + SVR + 输出缩放器)，
+# latest.json 指向当前版本。仓库根目录中旧的 svm_hotspot_model.joblib 等文件使用 17 维特征，
+# 与 [纬度, 经度, 年份] 三维特征不兼容，因此不再读取
+DEFAULT_MODEL_DIR = 'hotspot_model'
+FEATURE_NAMES = ['latitude', 'longitude', 'year']
+MODEL_FORMAT_VERSION = 1
+# 目录中保留的历史版本数量
+KEEP_VERSIONS = 5
+MODEL_FILE_PATTERN = re.compile(r'model_v(\d+)\.joblib')
+
+
+# 训练输入指纹：特征、目标值与模型参数都相同时，重新训练得到的模型完全相同，可以直接复用
+def training_fingerprint(features, targets, params):
+    digest = hashlib.sha256()
+    digest.update(json.dumps({'format': MODEL_FORMAT_VERSION, 'params': params}, sort_keys=True).encode('utf-8'))
+    digest.update(np.ascontiguousarray(features, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(targets, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+# 模型包：feature_scaler 与 svr 为训练得到的对象；target_scaler 把预测值映射到 0~1，
+# 与热力图使用的归一化一致 (所有景点的预测值相同时为 None，此时返回原始预测值)。
+# 训练景点以外的坐标的预测值可能超出训练时的范围，归一化分数会截断到 0~1
+class HotspotModel:
+    def __init__(self, feature_scaler, svr, target_scaler, fingerprint, training_names, version=None,
+                 trained_at=None):
+        self.feature_scaler = feature_scaler
+        self.svr = svr
+        self.target_scaler = target_scaler
+        self.fingerprint = fingerprint
+        self.training_names = list(training_names)
+        self.version = version
+        self.trained_at = trained_at if trained_at is not None else time.time()
+
+    # 向量化预测：features 为 N×3 的 [纬度, 经度, 年份]，返回 (原始预测值, 归一化分数)
+    def predict(self, features):
+        features = np.asarray(features, dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+        if len(features) == 0:
+            return np.empty(0), np.empty(0)
+        raw_scores = self.svr.predict(self.feature_scaler.transform(features))
+        if self.target_scaler is None:
+            return raw_scores, raw_scores
+        scaled = self.target_scaler.transform(raw_scores.reshape(-1, 1))[:, 0]
+        return raw_scores, np.clip(scaled, 0.0, 1.0)
+
+    def info(self):
+        return {
+            'version': self.version,
+            'trained_at': self.trained_at,
+            'fingerprint': self.fingerprint,
+            'features': FEATURE_NAMES,
+            'training_locations': len(self.training_names),
+        }
+
+
+# 带版本的模型存储：模型包写入 model_v000001.joblib 等文件，再原子替换 latest.json
+class HotspotModelStore:
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR):
+        self.model_dir = model_dir
+
+    def _latest_path(self):
+        return os.path.join(self.model_dir, 'latest.json')
+
+    def _model_path(self, version):
+        return os.path.join(self.model_dir, f'model_v{version:06d}.joblib')
+
+    # 目录中已保存的模型版本号 (按文件名)，与 latest.json 是否存在无关
+    def saved_versions(self):
+        try:
+            filenames = os.listdir(self.model_dir)
+        except OSError:
+            return []
+        return sorted(int(match.group(1)) for match in map(MODEL_FILE_PATTERN.fullmatch, filenames) if match)
+
+    def latest_version(self):
+        try:
+            with open(self._latest_path(), 'r', encoding='utf-8') as f:
+                version = json.load(f).get('version')
+        except (OSError, ValueError, AttributeError):
+            return None
+        return version if isinstance(version, int) and not isinstance(version, bool) and version > 0 else None
+
+    # latest.json 的修改时间，用于服务端判断是否有新版本 (一次 stat，无需反序列化模型)
+    def latest_mtime(self):
+        try:
+            return os.stat(self._latest_path()).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self, version=None):
+        version = version if version is not None else self.latest_version()
+        if version is None:
+            return None
+        # 文件截断、sklearn 版本不兼容、内容不是模型包等任何问题都只视为没有可用模型 (分析脚本会重新训练)，
+        # 不能让服务启动或分析流程因此失败
+        try:
+            bundle = joblib.load(self._model_path(version))
+            if not isinstance(bundle, dict) or bundle.get('format') != MODEL_FORMAT_VERSION:
+                print(f"警告: 热点模型 v{version} 的格式不兼容，已忽略。")
+                return None
+            return HotspotModel(bundle['feature_scaler'], bundle['svr'], bundle['target_scaler'],
+                                bundle['fingerprint'], bundle['training_names'], version=version,
+                                trained_at=bundle['trained_at'])
+        except Exception as e:
+            print(f"警告: 无法加载热点模型 v{version}: {e!r}")
+            return None
+
+    def save(self, model):
+        os.makedirs(self.model_dir, exist_ok=True)
+        # 新版本号取磁盘上已有模型文件与 latest.json 中的最大值加一：latest.json 丢失时也不会覆盖已有版本
+        version = max(self.saved_versions() + [self.latest_version() or 0]) + 1
+        bundle = {
+            'format': MODEL_FORMAT_VERSION,
+            'feature_scaler': model.feature_scaler,
+            'svr': model.svr,
+            'target_scaler': model.target_scaler,
+            'fingerprint': model.fingerprint,
+            'training_names': model.training_names,
+            'trained_at': model.trained_at,
+        }
+        model_path = self._model_path(version)
+        joblib.dump(bundle, model_path + '.tmp')
+        os.replace(model_path + '.tmp', model_path)
+
+        latest = {'version': version, 'fingerprint': model.fingerprint, 'trained_at': model.trained_at}
+        with open(self._latest_path() + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(latest, f)
+        os.replace(self._latest_path() + '.tmp', self._latest_path())
+        model.version = version
+        self._prune(version)
+        return version
+
+    def _prune(self, latest_version):
+        for version in self.saved_versions():
+            if version <= latest_version - KEEP_VERSIONS:
+                os.remove(self._model_path(version))
+
+
+# 服务端使用的模型持有者：第一次预测时才加载模型，之后每次只检查 latest.json 是否变化，
+# 分析脚本重新训练后无需重启服务即可切换到新版本
+class HotspotModelService:
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR):
+        self.store = HotspotModelStore(model_dir)
+        self._lock = threading.Lock()
+        self._model = None
+        self._loaded_mtime = None
+
+    def get(self):
+        mtime = self.store.latest_mtime()
+        if self._model is not None and mtime == self._loaded_mtime:
+            return self._model
+        with self._lock:
+            if self._model is None or mtime != self._loaded_mtime:
+                model = self.store.load()
+                if model is not None:
+                    print(f"已加载热点模型 v{model.version}。")
+                    self._model = model
+                self._loaded_mtime = mtime
+            return self._model
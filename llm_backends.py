@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+
+# --- 在这里粘贴您从Google获取的API密钥 (也可通过环境变量 GEMINI_API_KEY 设置) ---
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', "Gemini密钥")
+
+### --- 代理配置 (根据您的Clash配置，也可通过环境变量 GEMINI_PROXY 设置) ---
+GEMINI_PROXY = os.environ.get('GEMINI_PROXY', '自己代理地址')
+### --- 代理配置结束 ---
+
+
+# 模拟模型的返回值，与 Gemini 响应对象一样通过 .text 取文本
+class MockResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+# Gemini 后端：只有选用该后端时才导入 google.generativeai 并设置代理
+class GeminiBackend:
+    def __init__(self, model_name=GEMINI_MODEL_NAME, api_key=GEMINI_API_KEY, proxy=GEMINI_PROXY):
+        import google.generativeai as genai
+
+        if proxy:
+            os.environ['HTTP_PROXY'] = proxy
+            os.environ['HTTPS_PROXY'] = proxy
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, contents, stream=False):
+        return self._model.generate_content(contents, stream=stream)
+
+
+# 本地模拟后端：不访问网络，回复内容由输入决定 (同样的输入得到同样的回复)，
+# 用于压测和离线开发。可配置首字节延迟、生成速度 (token/秒) 和失败注入比例；
+# 失败注入使用固定种子的随机数，同样的调用顺序得到同样的失败序列
+class MockBackend:
+    def __init__(self, latency_s=0.3, tokens_per_s=40.0, reply_tokens=120, failure_rate=0.0, seed=0):
+        self.model_name = 'mock'
+        self.latency_s = latency_s
+        self.tokens_per_s = tokens_per_s
+        self.reply_tokens = reply_tokens
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _reply_tokens(self, contents):
+        digest = hashlib.sha256(json.dumps(contents, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+        return [f'模拟回复{digest[i % 64]}' for i in range(self.reply_tokens)]
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_s if self.tokens_per_s > 0 else 0.0
+
+    def generate_content(self, contents, stream=False):
+        tokens = self._reply_tokens(contents)
+        if stream:
+            return self._stream(tokens)
+        time.sleep(self.latency_s + self._token_delay() * len(tokens))
+        if self._should_fail():
+            raise RuntimeError("模拟后端注入的失败")
+        return MockResponse(''.join(tokens))
+
+    def _stream(self, tokens):
+        time.sleep(self.latency_s)
+        if self._should_fail():
+            raise RuntimeError("模拟后端注入的失败")
+        # 每次产出约 8 个 token，接近真实流式接口的分块粒度
+        for start in range(0, len(tokens), 8):
+            batch = tokens[start:start + 8]
+            time.sleep(self._token_delay() * len(batch))
+            yield MockResponse(''.join(batch))
+
+
+# 根据环境变量创建模型后端：AI_BACKEND=gemini (默认) 或 mock
+# 模拟后端参数: MOCK_LLM_LATENCY_S、MOCK_LLM_TOKENS_PER_S、MOCK_LLM_REPLY_TOKENS、MOCK_LLM_FAILURE_RATE、MOCK_LLM_SEED
+def create_backend_from_env():
+    backend = os.environ.get('AI_BACKEND', 'gemini').lower()
+    if backend == 'mock':
+        return MockBackend(
+            latency_s=float(os.environ.get('MOCK_LLM_LATENCY_S', 0.3)),
+            tokens_per_s=float(os.environ.get('MOCK_LLM_TOKENS_PER_S', 40)),
+            reply_tokens=int(os.environ.get('MOCK_LLM_REPLY_TOKENS', 120)),
+            failure_rate=float(os.environ.get('MOCK_LLM_FAILURE_RATE', 0.0)),
+            seed=int(os.environ.get('MOCK_LLM_SEED', 0)),
+        )
+    if backend == 'gemini':
+        return GeminiBackend()
+    raise ValueError(f"未知的模型后端: {backend} (可选 gemini / mock)")
@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+
+# 并发名额与等待队列都已占满，立即拒绝，避免请求线程在服务端无限堆积
+class GatewayBusyError(Exception):
+    pass
+
+
+# 单次调用超过超时时间 (同步调用仍在工作线程中继续，但名额会在其结束后释放；流式调用会被取消)
+class GatewayTimeoutError(Exception):
+    pass
+
+
+# 大模型调用网关：所有 generate_content 调用都在独立的工作线程池中执行，
+# max_concurrency 限制同时进行的上游调用数，max_queue 限制排队等待的调用数，
+# 超出部分直接拒绝；请求线程只等待结果 (带超时)，光标数据等遥测请求不经过这里，不会被慢调用拖住
+class LLMGateway:
+    def __init__(self, max_concurrency=4, max_queue=16, timeout_s=60.0, on_upstream=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.on_upstream = on_upstream  # 每次上游调用结束后回调 (调用方式 'call'/'stream', 耗时秒数, 是否失败)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='llm-worker')
+        self._admission = threading.BoundedSemaphore(max_concurrency + max_queue)
+        self._stats_lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._stats = {'calls': 0, 'completed': 0, 'errors': 0, 'rejected': 0, 'timeouts': 0,
+                       'upstream_seconds_total': 0.0}
+
+    def _admit(self):
+        if not self._admission.acquire(blocking=False):
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            raise GatewayBusyError("AI服务繁忙，请稍后重试")
+        with self._stats_lock:
+            self._admitted += 1
+            self._stats['calls'] += 1
+
+    def _release(self, start_time, failed, mode):
+        elapsed = time.time() - start_time
+        with self._stats_lock:
+            self._admitted -= 1
+            self._running -= 1
+            self._stats['errors' if failed else 'completed'] += 1
+            self._stats['upstream_seconds_total'] += elapsed
+        self._admission.release()
+        if self.on_upstream is not None:
+            # 指标回调出错不能把已经成功的上游调用变成失败
+            try:
+                self.on_upstream(mode, elapsed, failed)
+            except Exception as e:
+                print(f"AI网关的上游调用回调失败: {e}")
+                traceback.print_exc()
+
+    def _mark_running(self):
+        with self._stats_lock:
+            self._running += 1
+        return time.time()
+
+    def _run(self, fn, args, kwargs):
+        start_time = self._mark_running()
+        failed = True
+        try:
+            result = fn(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._release(start_time, failed, 'call')
+
+    # 同步调用：在工作线程中执行 fn，并在 timeout_s 内等待结果
+    def call(self, fn, *args, timeout_s=None, **kwargs):
+        self._admit()
+        future = self._executor.submit(self._run, fn, args, kwargs)
+        try:
+            return future.result(timeout=timeout_s or self.timeout_s)
+        except FutureTimeoutError:
+            with self._stats_lock:
+                self._stats['timeouts'] += 1
+            # 仍在排队、尚未开始执行的调用可以取消，此时由这里归还名额
+            if future.cancel():
+                with self._stats_lock:
+                    self._admitted -= 1
+                self._admission.release()
+            raise GatewayTimeoutError(f"AI服务响应超时 (超过 {timeout_s or self.timeout_s:.0f} 秒)")
+
+    # 流式调用：工作线程遍历 make_iterator() 产出的数据块并放入队列，请求线程从队列中逐块取出；
+    # 整个流必须在 timeout_s 内结束。准入在调用时立即进行 (名额已满时直接抛出 GatewayBusyError，
+    # 调用方可以在发送响应头之前返回 503)，返回的生成器再逐块产出数据。
+    # 超时或调用方提前关闭生成器 (客户端断开) 时设置取消标志，工作线程停止读取上游并归还名额
+    def stream(self, make_iterator, timeout_s=None):
+        self._admit()
+        chunks = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            start_time = self._mark_running()
+            failed = True
+            try:
+                if cancelled.is_set():
+                    return
+                iterator = make_iterator()
+                try:
+                    for item in iterator:
+                        if cancelled.is_set():
+                            return
+                        chunks.put(('item', item))
+                finally:
+                    close = getattr(iterator, 'close', None)
+                    if cancelled.is_set() and close is not None:
+                        close()
+                chunks.put(('end', None))
+                failed = False
+            except Exception as e:
+                chunks.put(('error', e))
+            finally:
+                self._release(start_time, failed, 'stream')
+
+        self._executor.submit(produce)
+        deadline = time.time() + (timeout_s or self.timeout_s)
+        return self._consume_stream(chunks, cancelled, deadline, timeout_s or self.timeout_s)
+
+    def _consume_stream(self, chunks, cancelled, deadline, timeout_s):
+        try:
+            while True:
+                remaining = deadline - time.time()
+                try:
+                    if remaining <= 0:
+                        raise queue.Empty
+                    kind, value = chunks.get(timeout=remaining)
+                except queue.Empty:
+                    with self._stats_lock:
+                        self._stats['timeouts'] += 1
+                    raise GatewayTimeoutError(f"AI服务响应超时 (超过 {timeout_s:.0f} 秒)")
+                if kind == 'item':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            cancelled.set()
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+            snapshot['in_flight'] = self._running
+            snapshot['queued'] = max(0, self._admitted - self._running)
+        snapshot['max_concurrency'] = self.max_concurrency
+        snapshot['max_queue'] = self.max_queue
+        return snapshot
@@ -0,0 +1,261 @@
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_BASE_URL = 'http://localhost:5000'
+TRACKER_SCRIPT = 'cursor_proximity_tracker.js'
+# 轨迹点围绕地图中心 (长沙) 随机游走
+MAP_CENTER = (28.2, 112.9)
+
+
+# 从光标追踪脚本中读取常量，使压测的上报频率与前端保持一致
+def read_tracker_constant(name, default):
+    try:
+        with open(TRACKER_SCRIPT, 'r', encoding='utf-8') as f:
+            match = re.search(rf'const {name} = (\d+)', f.read())
+    except OSError:
+        match = None
+    return int(match.group(1)) if match else default
+
+
+SAMPLE_INTERVAL_MS = read_tracker_constant('SAMPLE_INTERVAL_MS', 100)
+BATCH_MAX_POINTS = read_tracker_constant('BATCH_MAX_POINTS', 200)
+BATCH_FLUSH_INTERVAL_MS = read_tracker_constant('BATCH_FLUSH_INTERVAL_MS', 5000)
+COORD_SCALE = read_tracker_constant('COORD_SCALE', 1000000)
+
+
+# 最近秩法求百分位数 (values 已排序)
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+# 按接口记录每次请求的耗时与成败
+class LatencyRecorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append((seconds, ok))
+
+    def summary(self, elapsed_s):
+        with self._lock:
+            samples = {endpoint: list(values) for endpoint, values in self._samples.items()}
+        report = {}
+        for endpoint, values in sorted(samples.items()):
+            latencies = sorted(seconds for seconds, ok in values if ok)
+            report[endpoint] = {
+                'requests': len(values),
+                'errors': sum(1 for _, ok in values if not ok),
+                'throughput_rps': len(latencies) / elapsed_s if elapsed_s > 0 else 0.0,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': (latencies[-1] if latencies else 0.0) * 1000,
+            }
+        return report
+
+
+# 通过 HTTP 访问正在运行的 ai.py
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def post(self, path, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        req = urllib.request.Request(self.base_url + path, data=data, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=120) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', errors='replace')
+
+
+# 在本进程内直接调用 Flask 应用 (默认使用模拟模型后端)，不需要单独启动服务
+class InProcessClient:
+    def __init__(self):
+        os.environ.setdefault('AI_BACKEND', 'mock')
+        import ai
+
+        self._app = ai.app
+        self._local = threading.local()
+
+    def post(self, path, body):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self._app.test_client()
+        response = self._local.client.post(path, json=body)
+        return response.status_code, response.get_data(as_text=True)
+
+
+# 解析 SSE 响应体，返回事件列表 [(事件名, 数据)]
+def parse_sse(text):
+    events = []
+    for block in text.split('\n\n'):
+        event_name, data = 'message', None
+        for line in block.split('\n'):
+            if line.startswith('event: '):
+                event_name = line[len('event: '):]
+            elif line.startswith('data: '):
+                data = json.loads(line[len('data: '):])
+        if data is not None:
+            events.append((event_name, data))
+    return events
+
+
+# 与 cursor_proximity_tracker.js 中 encodePointBatch 相同的 delta-int 编码
+def encode_point_batch(session_id, batch_seq, points):
+    timestamps, latitudes, longitudes = [], [], []
+    prev_t = prev_lat = prev_lon = 0
+    for index, (t, lat, lon) in enumerate(points):
+        lat_i, lon_i = round(lat * COORD_SCALE), round(lon * COORD_SCALE)
+        timestamps.append(0 if index == 0 else t - prev_t)
+        latitudes.append(lat_i if index == 0 else lat_i - prev_lat)
+        longitudes.append(lon_i if index == 0 else lon_i - prev_lon)
+        prev_t, prev_lat, prev_lon = t, lat_i, lon_i
+    return {
+        'encoding': 'delta-int',
+        'session_id': session_id,
+        'batch_seq': batch_seq,
+        'scale': COORD_SCALE,
+        't0': points[0][0] if points else 0,
+        'timestamps': timestamps,
+        'latitudes': latitudes,
+        'longitudes': longitudes,
+    }
+
+
+# 单个虚拟用户：光标上报、对话、点击AI讲解三类流量各在独立线程中运行，与浏览器中的行为一致
+class VirtualUser:
+    def __init__(self, user_id, client, recorder, deadline, seed, chat_interval_s, intro_interval_s, num_locations):
+        self.user_id = user_id
+        self.client = client
+        self.recorder = recorder
+        self.deadline = deadline
+        self.seed = seed
+        self.chat_interval_s = chat_interval_s
+        self.intro_interval_s = intro_interval_s
+        self.num_locations = num_locations
+
+    def _timed_post(self, endpoint, body, stream):
+        start_time = time.time()
+        try:
+            status, text = self.client.post(endpoint, body)
+        except Exception:
+            self.recorder.record(endpoint, time.time() - start_time, False)
+            return None
+        elapsed = time.time() - start_time
+        events = parse_sse(text) if stream and status == 200 else None
+        ok = status == 200 and not (events is not None and any(name == 'error' for name, _ in events))
+        self.recorder.record(endpoint, elapsed, ok)
+        return events
+
+    def _sleep_until(self, when):
+        remaining = min(when, self.deadline) - time.time()
+        if remaining > 0:
+            time.sleep(remaining)
+        return time.time() < self.deadline
+
+    # 每隔 BATCH_FLUSH_INTERVAL_MS 上报一批点，每批点数 = 刷新间隔内按 SAMPLE_INTERVAL_MS 采到的点数
+    def run_ingest(self):
+        rng = random.Random(self.seed * 3)
+        points_per_batch = min(BATCH_MAX_POINTS, BATCH_FLUSH_INTERVAL_MS // SAMPLE_INTERVAL_MS)
+        lat, lon = MAP_CENTER[0] + rng.uniform(-0.05, 0.05), MAP_CENTER[1] + rng.uniform(-0.05, 0.05)
+        session_id = f'loadtest-{self.seed}-{self.user_id}'
+        next_time = time.time() + rng.uniform(0, BATCH_FLUSH_INTERVAL_MS / 1000.0)
+        batch_seq = 0
+        while self._sleep_until(next_time):
+            now_ms = int(time.time() * 1000)
+            points = []
+            for index in range(points_per_batch):
+                lat += rng.gauss(0, 0.0002)
+                lon += rng.gauss(0, 0.0002)
+                points.append((now_ms - (points_per_batch - index) * SAMPLE_INTERVAL_MS, lat, lon))
+            self._timed_post('/api/save_session_batch', encode_point_batch(session_id, batch_seq, points), False)
+            batch_seq += 1
+            next_time += BATCH_FLUSH_INTERVAL_MS / 1000.0
+
+    def run_chat(self):
+        rng = random.Random(self.seed * 3 + 1)
+        conversation_id = None
+        turn = 0
+        while self._sleep_until(time.time() + rng.expovariate(1.0 / self.chat_interval_s)):
+            body = {'conversation_id': conversation_id, 'message': f'请介绍一下第{turn}个地点的历史',
+                    'initial_message': '您好！我是您的智能地图助手。'}
+            events = self._timed_post('/api/chat/stream', body, True)
+            for name, data in events or []:
+                if name == 'done':
+                    conversation_id = data.get('conversation_id')
+            turn += 1
+
+    # 地点热度近似 Zipf 分布，热门地点会被多个用户同时点击 (可观察缓存与请求合并的效果)
+    def run_intro(self):
+        rng = random.Random(self.seed * 3 + 2)
+        weights = [1.0 / (rank + 1) for rank in range(self.num_locations)]
+        while self._sleep_until(time.time() + rng.expovariate(1.0 / self.intro_interval_s)):
+            index = rng.choices(range(self.num_locations), weights=weights)[0]
+            self._timed_post('/api/get-ai-description/stream', {'name': f'压测地点{index}', 'year': 1900 + index}, True)
+
+    def threads(self):
+        return [threading.Thread(target=target, daemon=True) for target in (self.run_ingest, self.run_chat, self.run_intro)]
+
+
+def run_load_test(client, users=20, duration_s=30.0, chat_interval_s=20.0, intro_interval_s=15.0,
+                  num_locations=30, seed=1):
+    print(f"--- 开始压测: {users} 个虚拟用户，持续 {duration_s:.0f} 秒 ---")
+    print(f"光标上报: 每 {BATCH_FLUSH_INTERVAL_MS} 毫秒一批，采样间隔 {SAMPLE_INTERVAL_MS} 毫秒；"
+          f"对话平均间隔 {chat_interval_s} 秒，讲解点击平均间隔 {intro_interval_s} 秒")
+    recorder = LatencyRecorder()
+    start_time = time.time()
+    deadline = start_time + duration_s
+    threads = []
+    for user_id in range(users):
+        user = VirtualUser(user_id, client, recorder, deadline, seed * 100003 + user_id,
+                           chat_interval_s, intro_interval_s, num_locations)
+        threads.extend(user.threads())
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start_time
+    report = recorder.summary(elapsed)
+
+    print(f"{'接口':<36}{'请求数':>8}{'失败':>6}{'吞吐(次/秒)':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for endpoint, row in report.items():
+        print(f"{endpoint:<36}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>12.2f}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    print(f"--- 压测结束，实际耗时 {elapsed:.1f} 秒 ---")
+    return {'users': users, 'duration_s': elapsed, 'seed': seed, 'endpoints': report}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按真实流量组合 (光标上报、对话、AI讲解点击) 压测 ai.py")
+    parser.add_argument('--url', default=DEFAULT_BASE_URL, help="ai.py 服务地址 (可先用 AI_BACKEND=mock python ai.py 启动)")
+    parser.add_argument('--in-process', action='store_true',
+                        help="在本进程内直接调用 Flask 应用 (默认使用模拟模型后端，存储文件写入当前目录)")
+    parser.add_argument('--users', type=int, default=20, help="虚拟用户数")
+    parser.add_argument('--duration', type=float, default=30.0, help="压测时长 (秒)")
+    parser.add_argument('--chat-interval', type=float, default=20.0, help="每个用户发送对话消息的平均间隔 (秒)")
+    parser.add_argument('--intro-interval', type=float, default=15.0, help="每个用户点击AI讲解的平均间隔 (秒)")
+    parser.add_argument('--locations', type=int, default=30, help="可点击的地点数量")
+    parser.add_argument('--seed', type=int, default=1, help="随机种子")
+    parser.add_argument('--json', help="把结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    client = InProcessClient() if args.in_process else HttpClient(args.url)
+    result = run_load_test(client, users=args.users, duration_s=args.duration, chat_interval_s=args.chat_interval,
+                           intro_interval_s=args.intro_interval, num_locations=args.locations, seed=args.seed)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.json}")
@@ -7,21 +7,26 @@ import json
 from coord_convert.transform import wgs2gcj
 import re
 from urllib.parse import quote
-import http.server
-import socketserver
 import webbrowser
 import time
+from map_build_cache import MarkerBuildCache, content_hash
+from static_server import create_static_server
+from static_assets import DEFAULT_ASSET_DIR, hash_static_file, prune_assets, write_hashed_asset
+from geo_simplify import (DEFAULT_PIXEL_TOLERANCE, simplify_feature_collection, summarize_simplification,
+                          tolerance_for_zoom, write_lod_variants)
 
-# 地点数据
-all_markers_data = [
-    {'name': '点名称', 'location': [0,0 ], 'year': '年份',#填写经纬度
-     'description': '介绍'},
-
-]
+# 地点数据 (在 map_markers.py 中填写，ai.py 预热AI讲解缓存时读取同一份数据)
+from map_markers import all_markers_data
 
 # --- 以下为地图生成逻辑 ---
 
 changsha_core_bounds = [28.0, 112.8, 28.3, 113.1]
+
+# 外部资源模式：标记数据只写一次，放到以内容哈希命名的脚本文件中 (可永久缓存，附带 .gz/.br 预压缩版本)，
+# 弹窗由 marker_popups.js 在打开时生成，不再逐个内联；各 JS 文件也改为哈希命名，替代 ?v=时间戳。
+# 设为 False 则按原方式把数据和弹窗内联到页面中
+EXTERNAL_MARKER_ASSETS = True
+ASSET_DIR = DEFAULT_ASSET_DIR
 clustered_markers_data = [
     marker for marker in all_markers_data
     if changsha_core_bounds[0] <= marker['location'][0] <= changsha_core_bounds[2] and
@@ -73,7 +78,8 @@ m.get_root().html.add_child(folium.Element("""
 """))
 m.get_root().html.add_child(folium.Element('<link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css">'))
 
-m.get_root().html.add_child(folium.Element(f'<div id="custom-select" class="custom-select-container"><div class="select-header"><span id="selected-value">足迹</span><div class="arrow down"></div></div><div id="select-options" class="select-options"></div></div><script>var allMarkersData = {json.dumps(all_markers_data, ensure_ascii=False)};</script>'))
+inline_markers_script = '' if EXTERNAL_MARKER_ASSETS else f'<script>var allMarkersData = {json.dumps(all_markers_data, ensure_ascii=False)};</script>'
+m.get_root().html.add_child(folium.Element(f'<div id="custom-select" class="custom-select-container"><div class="select-header"><span id="selected-value">足迹</span><div class="arrow down"></div></div><div id="select-options" class="select-options"></div></div>{inline_markers_script}'))
 m.get_root().html.add_child(folium.Element('<div id="dynamic-legend"><h4>图例</h4><div><i class="fa fa-map-marker" style="color: #0078A8;"></i> 景点</div><div id="legend-item-geojson"><i style="background: red; width: 20px; height: 2px; display: inline-block;"></i> 长沙市行政区划边界</div></div>'))
 m.get_root().html.add_child(folium.Element('<button class="guide-button" style="position: absolute; top: 10px; right: 305px; background: rgba(0,0,0,0.5); color: white; padding: 8px; border: none; border-radius: 5px; cursor: pointer; z-index: 1000;">使用说明</button>'))
 m.get_root().html.add_child(folium.Element('<button class="global-view-button" style="position: absolute; top: 10px; right: 210px; background: rgba(0,0,0,0.5); color: white; padding: 8px; border: none; border-radius: 5px; cursor: pointer; z-index: 1000;">全局显示</button>'))
@@ -101,8 +107,12 @@ popup_html = """
 </div>
 """
 
-marker_cluster = MarkerCluster(name='景点').add_to(m)
-for i, marker_data in enumerate(all_markers_data):
+# 构建缓存：坐标转换结果与渲染好的弹窗按 (弹窗模板, 序号, 标记数据) 的内容哈希缓存，重新构建时只计算变化的标记
+build_cache = MarkerBuildCache()
+popup_template_hash = content_hash(popup_html)
+
+
+def build_marker_artifacts(i, marker_data):
     wgs84_lat, wgs84_lon = marker_data['location']
     gcj02_lon, gcj02_lat = wgs2gcj(wgs84_lon, wgs84_lat)
     name_encoded = quote(marker_data['name'])
@@ -110,10 +120,24 @@ for i, marker_data in enumerate(all_markers_data):
         name=marker_data['name'], i=i, description=re.sub(r'\[Image \d+\]', '', marker_data.get('description', '')),
         gcj02_location=[gcj02_lat, gcj02_lon], name_encoded=name_encoded,year=marker_data['year']
     )
+    return {'gcj02_location': [gcj02_lat, gcj02_lon], 'popup': popup_content}
+
+
+marker_artifacts = [
+    build_cache.get_or_build(('marker', popup_template_hash, i, marker_data),
+                             lambda: build_marker_artifacts(i, marker_data))
+    for i, marker_data in enumerate(all_markers_data)
+]
+# 一次性列出图标目录，代替逐个标记调用 os.path.exists
+icon_files = set(os.listdir('icon'))
+
+marker_cluster = MarkerCluster(name='景点').add_to(m)
+for i, marker_data in enumerate(all_markers_data):
+    popup_content = marker_artifacts[i]['popup']
     icon_path = f'icon/{i}.png'
-    icon = folium.CustomIcon(icon_path, icon_size=(48, 48)) if os.path.exists(icon_path) else None
+    icon = folium.CustomIcon(icon_path, icon_size=(48, 48)) if f'{i}.png' in icon_files else None
     marker = folium.Marker(
-        location=marker_data['location'], popup=folium.Popup(popup_content, max_width=300),
+        location=marker_data['location'], popup=None if EXTERNAL_MARKER_ASSETS else folium.Popup(popup_content, max_width=300),
         icon=icon, tooltip=marker_data['name']
     )
     folium.Tooltip(
@@ -132,34 +156,104 @@ if not os.path.exists(geojson_file):
     geojson_data = response.json()
     with open(geojson_file, 'w', encoding='utf-8') as f:
         json.dump(geojson_data, f, ensure_ascii=False)
+
+
+# 只保留长沙市的要素；结果按源文件内容哈希缓存，源文件不变时无需重新解析
+def filter_changsha_features(data):
+    data['features'] = [f for f in data['features'] if f['properties'].get('name') == '长沙市']
+    return data
+
+
+# 边界只是 3 像素的描边：按缩放级别简化 (Douglas–Peucker，偏差不超过半个像素) 并量化坐标，
+# 嵌入页面的版本按 BOUNDARY_DETAIL_ZOOM 简化；设置 BOUNDARY_LOD_ZOOMS (如 [10, 13, 16]) 时
+# 另外输出多级简化文件，页面先嵌入最粗的一级，缩放时再加载对应级别
+BOUNDARY_DETAIL_ZOOM = 16
+BOUNDARY_LOD_ZOOMS = []
+BOUNDARY_LOD_DIR = 'boundary_lod'
+boundary_reference_lat = (changsha_core_bounds[0] + changsha_core_bounds[2]) / 2
+
+
+def load_changsha_boundary(zoom):
+    tolerance_m = tolerance_for_zoom(zoom, boundary_reference_lat)
+    return build_cache.load_geojson(
+        geojson_file, lambda data: simplify_feature_collection(filter_changsha_features(data), tolerance_m),
+        variant=['长沙市', zoom, DEFAULT_PIXEL_TOLERANCE]
+    )
+
+
+full_boundary = build_cache.load_geojson(geojson_file, filter_changsha_features, variant='长沙市')
+embedded_zoom = min(BOUNDARY_LOD_ZOOMS) if BOUNDARY_LOD_ZOOMS else BOUNDARY_DETAIL_ZOOM
+geojson_data = load_changsha_boundary(embedded_zoom)
+boundary_summary = summarize_simplification(full_boundary, geojson_data)
+print(f"长沙市边界 (按 {embedded_zoom} 级简化): 顶点 {boundary_summary['vertices_before']} → {boundary_summary['vertices_after']}，"
+      f"{boundary_summary['bytes_before']} → {boundary_summary['bytes_after']} 字节")
+lod_paths = write_lod_variants({zoom: load_changsha_boundary(zoom) for zoom in BOUNDARY_LOD_ZOOMS},
+                               BOUNDARY_LOD_DIR, 'changsha') if BOUNDARY_LOD_ZOOMS else {}
+build_cache.save()
+if geojson_data['features']:
+    boundary_layer = folium.GeoJson(geojson_data, name='长沙市行政区划边界', style_function=lambda x: {'fillColor': 'none', 'color': 'red', 'weight': 3, 'fillOpacity': 0}, tooltip=folium.features.GeoJsonTooltip(fields=['name'], aliases=['城市名称'])).add_to(m)
+    if lod_paths:
+        # 缩放结束后换用不超过当前缩放级别的最大 LOD 版本
+        m.get_root().html.add_child(folium.Element(f"""<script>
+document.addEventListener('DOMContentLoaded', function() {{
+    var lodUrls = {json.dumps({str(zoom): path.replace(os.sep, '/') for zoom, path in lod_paths.items()})};
+    var lodZooms = Object.keys(lodUrls).map(Number).sort(function(a, b) {{ return a - b; }});
+    var boundaryMap = {m.get_name()};
+    var boundaryLayer = {boundary_layer.get_name()};
+    var currentLod = {embedded_zoom};
+    boundaryMap.on('zoomend', function() {{
+        var lod = lodZooms[0];
+        lodZooms.forEach(function(zoom) {{ if (zoom <= boundaryMap.getZoom()) lod = zoom; }});
+        if (lod === currentLod) return;
+        currentLod = lod;
+        fetch(lodUrls[lod]).then(function(response) {{ return response.json(); }}).then(function(data) {{
+            if (currentLod !== lod) return;
+            boundaryLayer.clearLayers();
+            boundaryLayer.addData(data);
+        }});
+    }});
+}});
+</script>"""))
+
+clustered_locations = [marker["location"] for marker in clustered_markers_data]
+page_scripts = ['map_logic.js', 'ai_logic.js', 'chat_logic.js', 'cursor_proximity_tracker.js', 'density_tile_layer.js']
+if EXTERNAL_MARKER_ASSETS:
+    markers_with_gcj02 = [dict(marker, gcj02_location=artifacts['gcj02_location'])
+                          for marker, artifacts in zip(all_markers_data, marker_artifacts)]
+    markers_asset_url = write_hashed_asset(
+        f'var allMarkersData = {json.dumps(markers_with_gcj02, ensure_ascii=False)};\n'
+        f'var allMarkersWithYear = allMarkersData;\n'
+        f'var clusteredLocations = {json.dumps(clustered_locations, ensure_ascii=False)};\n',
+        'markers', 'js', ASSET_DIR
+    )
+    script_urls = {name: hash_static_file(name, ASSET_DIR) for name in page_scripts + ['marker_popups.js']}
+    prune_assets([markers_asset_url] + list(script_urls.values()), ASSET_DIR)
+    m.get_root().html.add_child(folium.Element(f'<script src="{markers_asset_url}"></script>'))
+    m.get_root().html.add_child(folium.Element(f'<script src="{script_urls["marker_popups.js"]}"></script>'))
+    print(f"标记数据已写入 {markers_asset_url}")
 else:
-    with open(geojson_file, 'r', encoding='utf-8') as f:
-        geojson_data = json.load(f)
-filtered_features = [f for f in geojson_data['features'] if f['properties'].get('name') == '长沙市']
-if filtered_features:
-    geojson_data['features'] = filtered_features
-    folium.GeoJson(geojson_data, name='长沙市行政区划边界', style_function=lambda x: {'fillColor': 'none', 'color': 'red', 'weight': 3, 'fillOpacity': 0}, tooltip=folium.features.GeoJsonTooltip(fields=['name'], aliases=['城市名称'])).add_to(m)
-
-m.get_root().html.add_child(folium.Element(f'<script>var allMarkersWithYear = {json.dumps(all_markers_data, ensure_ascii=False)};</script>'))
-m.get_root().html.add_child(folium.Element(f'<script>var clusteredLocations = {json.dumps([marker["location"] for marker in clustered_markers_data], ensure_ascii=False)};</script>'))
-m.get_root().html.add_child(folium.Element('<script src="map_logic.js"></script>'))
-m.get_root().html.add_child(folium.Element(f'<script src="ai_logic.js?v={int(time.time())}"></script>'))
-m.get_root().html.add_child(folium.Element(f'<script src="chat_logic.js?v={int(time.time())}"></script>'))
+    script_urls = {name: f'{name}?v={int(time.time())}' for name in page_scripts}
+    script_urls['map_logic.js'] = 'map_logic.js'
+    m.get_root().html.add_child(folium.Element(f'<script>var allMarkersWithYear = {json.dumps(all_markers_data, ensure_ascii=False)};</script>'))
+    m.get_root().html.add_child(folium.Element(f'<script>var clusteredLocations = {json.dumps(clustered_locations, ensure_ascii=False)};</script>'))
+m.get_root().html.add_child(folium.Element(f'<script src="{script_urls["map_logic.js"]}"></script>'))
+m.get_root().html.add_child(folium.Element(f'<script src="{script_urls["ai_logic.js"]}"></script>'))
+m.get_root().html.add_child(folium.Element(f'<script src="{script_urls["chat_logic.js"]}"></script>'))
 
 folium.Map.add_child(m, folium.LatLngPopup())
-m.get_root().html.add_child(folium.Element(f'<script src="cursor_proximity_tracker.js?v={int(time.time())}"></script>'))
+m.get_root().html.add_child(folium.Element(f'<script src="{script_urls["cursor_proximity_tracker.js"]}"></script>'))
+m.get_root().html.add_child(folium.Element(f'<script src="{script_urls["density_tile_layer.js"]}"></script>'))
 
 m.save('yuelu_academy_map.html')
 print("成功生成 yuelu_academy_map.html 文件。")
 
 
 # --- 为小地图准备一份所有坐标都转换好的数据 ---
+# 直接复用构建缓存中的坐标转换结果
 all_markers_data_gcj02 = []
-for marker in all_markers_data:
+for marker, artifacts in zip(all_markers_data, marker_artifacts):
     new_marker = marker.copy()
-    wgs_lat, wgs_lon = new_marker['location']
-    gcj_lon, gcj_lat = wgs2gcj(wgs_lon, wgs_lat)
-    new_marker['location'] = [gcj_lat, gcj_lon]
+    new_marker['location'] = artifacts['gcj02_location']
     all_markers_data_gcj02.append(new_marker)
 
 
@@ -236,12 +330,12 @@ try:
 except Exception as e:
     print(f"添加HTML标题时出错: {e}")
 # --- 新增：服务器启动代码 ---
+# 多线程静态文件服务器：支持预压缩文件与 gzip、ETag、哈希资源的长期缓存头以及图片的 Range 请求
 PORT = 8000
-Handler = http.server.SimpleHTTPRequestHandler
 
 print("\n--- 启动本地HTTP服务器 ---")
 try:
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    with create_static_server(PORT) as httpd:
         url_to_open = f"http://localhost:{PORT}/yuelu_academy_map.html"
 
         print(f"服务器已在 http://localhost:{PORT} 启动")
@@ -253,4 +347,4 @@ try:
 except KeyboardInterrupt:
     print("\n服务器已关闭。")
 except Exception as e:
-    print(f"启动服务器时出错: {e}")
\ No newline at end of file
+    print(f"启动服务器时出错: {e}")
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+
+DEFAULT_BUILD_CACHE_DIR = 'map_build_cache'
+MARKER_CACHE_FILENAME = 'markers.json'
+
+
+# 由任意可 JSON 序列化的输入计算内容哈希，作为缓存键
+def content_hash(*parts):
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+# map.py 的构建缓存：按每个标记的输入数据 (及弹窗模板) 的内容哈希缓存坐标转换结果和渲染好的弹窗，
+# 按源文件内容哈希缓存筛选后的 GeoJSON；重新构建时只重新计算发生变化的标记。
+# save() 只保留本次构建用到的条目，删除或修改过的标记对应的旧条目会被清理
+class MarkerBuildCache:
+    def __init__(self, cache_dir=DEFAULT_BUILD_CACHE_DIR):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._marker_path = os.path.join(cache_dir, MARKER_CACHE_FILENAME)
+        self._entries = {}
+        if os.path.exists(self._marker_path):
+            try:
+                with open(self._marker_path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"构建缓存读取失败，将全部重新计算: {e}")
+        self._used = {}
+        self._used_files = set()
+        self.hits = 0
+        self.misses = 0
+
+    # 缓存命中时直接返回，否则调用 build_fn() 计算 (返回值需可 JSON 序列化)
+    def get_or_build(self, key_parts, build_fn):
+        key = content_hash(*key_parts)
+        if key in self._entries:
+            value = self._entries[key]
+            self.hits += 1
+        else:
+            value = build_fn()
+            self.misses += 1
+        self._used[key] = value
+        return value
+
+    def save(self):
+        if self._used != self._entries:
+            _write_json_atomic(self._marker_path, self._used)
+        for name in os.listdir(self.cache_dir):
+            if name.startswith('geojson_') and name.endswith('.json') and name not in self._used_files:
+                os.remove(os.path.join(self.cache_dir, name))
+        print(f"构建缓存: 命中 {self.hits} 个标记，重新计算 {self.misses} 个标记。")
+
+    # 读取 GeoJSON 源文件并按 filter_fn 处理 (如筛选要素)，结果按 (源文件内容, variant) 缓存；
+    # variant 描述处理参数，参数变化时自动重新计算
+    def load_geojson(self, source_path, filter_fn, variant=''):
+        with open(source_path, 'rb') as f:
+            raw = f.read()
+        key = content_hash('geojson', hashlib.sha256(raw).hexdigest(), variant)
+        cached_path = os.path.join(self.cache_dir, f'geojson_{key[:16]}.json')
+        self._used_files.add(os.path.basename(cached_path))
+        if os.path.exists(cached_path):
+            with open(cached_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        result = filter_fn(json.loads(raw.decode('utf-8')))
+        _write_json_atomic(cached_path, result)
+        return result
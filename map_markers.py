@@ -0,0 +1,8 @@
+# 地图标记的地点数据：map.py 据此生成标记与弹窗，弹窗中“AI讲解”按钮发送的 name / year 即来自这里；
+# ai.py 预热AI讲解缓存时也读取这份数据，保证预热的缓存键与弹窗请求一致。
+# 本模块只包含数据，导入时不会触发地图构建
+all_markers_data = [
+    {'name': '点名称', 'location': [0,0 ], 'year': '年份',#填写经纬度
+     'description': '介绍'},
+
+]
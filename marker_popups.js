@@ -0,0 +1,77 @@
+// marker_popups.js
+
+// --- 标记弹窗按需渲染 ---
+// map.py 以外部资源模式构建时，弹窗 HTML 不再逐个内联到页面中，
+// 而是在弹窗第一次打开时根据 allMarkersData (由哈希命名的标记数据文件提供) 生成。
+// 生成的内容与 map.py 中的 popup_html 模板保持一致。
+
+function escapePopupHtml(text) {
+    return String(text)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+function renderMarkerPopup(i) {
+    const marker = allMarkersData[i];
+    const name = escapePopupHtml(marker.name);
+    const nameEncoded = encodeURIComponent(marker.name);
+    const description = (marker.description || '').replace(/\[Image \d+\]/g, '');
+    const gcj02 = marker.gcj02_location;
+    // onclick 属性中的 JS 字符串参数：先 JSON 编码再做 HTML 转义
+    const nameArg = escapePopupHtml(JSON.stringify(String(marker.name)));
+    const yearArg = escapePopupHtml(JSON.stringify(String(marker.year)));
+    return `
+<div style="text-align: center; max-width: 300px;">
+    <h4>${name}</h4>
+    <img src="pic/${i}.jpg" alt="${name}" style="max-width:250px; height:auto; border-radius:8px; margin-bottom:10px;" onerror="this.style.display='none'">
+    <p style="font-size:14px; color:#555; text-align: left;">${description}</p>
+
+    <div id="ai-content-${i}" style="text-align: left; margin-top: 10px; padding: 8px; background: #f0f8ff; border-radius: 5px; display: none; border: 1px solid #e0e8ef;">
+        <p>AI导游正在思考中，请稍候...</p>
+    </div>
+
+    <div class="popup-button-container">
+        <a href="https://uri.amap.com/marker?position=${gcj02[1]},${gcj02[0]}&name=${nameEncoded}&pano=1&src=yuelu_map" target="_blank" class="popup-button">官方实景</a>
+        <a href="amap.html?lng=${gcj02[1]}&lat=${gcj02[0]}&name=${nameEncoded}&index=${i}" target="_blank" class="popup-button secondary">3D模型</a>
+        <button class="popup-button" onclick="getAiIntro(${i}, ${nameArg}, ${yearArg})" style="background: #28a745;">AI讲解</button>
+    </div>
+</div>
+`;
+}
+
+// 按坐标查找标记数据的下标 (与 map_logic.js 中 findMarkerByLatLon 使用相同的匹配方式)
+const markerIndexByLocation = new Map();
+if (typeof allMarkersData !== 'undefined') {
+    allMarkersData.forEach((marker, i) => {
+        const key = `${marker.location[0].toFixed(6)},${marker.location[1].toFixed(6)}`;
+        if (!markerIndexByLocation.has(key)) {
+            markerIndexByLocation.set(key, i);
+        }
+    });
+}
+
+// 为尚未绑定弹窗的标记绑定按需渲染的弹窗；聚合图层中的标记在展开后才加入地图，因此监听 layeradd
+function bindLazyPopup(layer) {
+    if (!(layer instanceof L.Marker) || layer.getPopup()) {
+        return;
+    }
+    const latLng = layer.getLatLng();
+    const index = markerIndexByLocation.get(`${latLng.lat.toFixed(6)},${latLng.lng.toFixed(6)}`);
+    if (index !== undefined) {
+        layer.bindPopup(() => renderMarkerPopup(index), { maxWidth: 300 });
+    }
+}
+
+document.addEventListener('DOMContentLoaded', function() {
+    const mapContainer = document.querySelector('.folium-map');
+    if (!mapContainer || !window[mapContainer.id]) {
+        console.warn("marker_popups: 未找到地图实例，标记弹窗未绑定。");
+        return;
+    }
+    const popupMap = window[mapContainer.id];
+    popupMap.eachLayer(bindLazyPopup);
+    popupMap.on('layeradd', e => bindLazyPopup(e.layer));
+});
@@ -0,0 +1,209 @@
+import math
+import threading
+import time
+
+from flask import g, request
+
+# 延迟直方图的桶上界 (秒)，覆盖从毫秒级的文件写入到数十秒的大模型调用
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 请求/响应体大小直方图的桶上界 (字节)
+DEFAULT_SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + '}'
+
+
+# 单调递增计数器
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+# 累积桶直方图 (与 Prometheus histogram 相同：_bucket{le=...}、_sum、_count)
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._lock = threading.Lock()
+        self._values = {}  # 标签值 -> [各桶计数 (非累积), 总和, 总数]
+
+    # NaN 不落在任何桶中，inf 会使总和失去意义：非有限值直接忽略
+    def observe(self, value, **labels):
+        if not math.isfinite(value):
+            return
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append((self.name + '_bucket', _format_labels(self.labelnames, key, ('le', _format_value(float(bound)))),
+                              cumulative))
+            lines.append((self.name + '_sum', _format_labels(self.labelnames, key), total))
+            lines.append((self.name + '_count', _format_labels(self.labelnames, key), count))
+        return lines
+
+
+# 抓取时才读取数值的指标 (仪表或已由其他组件累计好的计数器)：
+# callback 返回单个数值，或 {标签值元组: 数值} 字典
+class CallbackMetric:
+    def __init__(self, name, help_text, callback, labelnames=(), kind='gauge'):
+        self.kind = kind
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"指标 {self.name} 读取失败: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(values.items())]
+
+
+# 指标注册表，render() 输出 Prometheus 文本格式
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def _register(self, metric):
+        with self._lock:
+            if any(existing.name == metric.name for existing in self._metrics):
+                raise ValueError(f"指标名称重复: {metric.name}")
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge_callback(self, name, help_text, callback, labelnames=()):
+        return self._register(CallbackMetric(name, help_text, callback, labelnames, kind='gauge'))
+
+    def counter_callback(self, name, help_text, callback, labelnames=()):
+        return self._register(CallbackMetric(name, help_text, callback, labelnames, kind='counter'))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, labels, value in metric.samples():
+                lines.append(f'{sample_name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+# 为 Flask 应用记录每个路由的请求数、延迟、请求体与响应体大小。
+# 延迟在响应真正发送完毕 (call_on_close) 时记录，流式 (SSE) 接口统计的是整个流的耗时；
+# 流式响应的大小通过包装响应迭代器累计实际发送的字节数
+class FlaskMetrics:
+    def __init__(self, app, registry):
+        self.requests_total = registry.counter(
+            'http_requests_total', 'HTTP requests by route, method and status.', ('route', 'method', 'status'))
+        self.request_seconds = registry.histogram(
+            'http_request_duration_seconds', 'Time from request start until the response body is fully sent.',
+            ('route', 'method'))
+        self.request_bytes = registry.histogram(
+            'http_request_size_bytes', 'Request body size.', ('route', 'method'), buckets=DEFAULT_SIZE_BUCKETS)
+        self.response_bytes = registry.histogram(
+            'http_response_size_bytes', 'Response body size.', ('route', 'method'), buckets=DEFAULT_SIZE_BUCKETS)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    def _before_request(self):
+        g.metrics_start_time = time.time()
+
+    def _after_request(self, response):
+        start_time = getattr(g, 'metrics_start_time', None)
+        if start_time is None:
+            return response
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        method = request.method
+        self.requests_total.inc(route=route, method=method, status=response.status_code)
+        if request.content_length is not None:
+            self.request_bytes.observe(request.content_length, route=route, method=method)
+
+        sent = {'bytes': 0}
+        if response.is_streamed:
+            body = response.response
+
+            def counting_iterator():
+                try:
+                    for chunk in body:
+                        sent['bytes'] += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                        yield chunk
+                finally:
+                    # 确保 stream_with_context 等包装的生成器被关闭，释放请求上下文
+                    if hasattr(body, 'close'):
+                        body.close()
+
+            response.response = counting_iterator()
+        else:
+            sent['bytes'] = response.calculate_content_length() or 0
+
+        def on_close():
+            self.request_seconds.observe(time.time() - start_time, route=route, method=method)
+            self.response_bytes.observe(sent['bytes'], route=route, method=method)
+
+        response.call_on_close(on_close)
+        return response
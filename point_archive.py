@@ -0,0 +1,263 @@
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+
+from session_store import DEFAULT_SESSION_STORE_PATH, open_session_store
+from trajectory_simplify import point_weight
+
+# 列式点归档的默认目录 (由会话存储压实生成，分析脚本以内存映射方式读取)
+DEFAULT_POINT_ARCHIVE_PATH = 'point_archive'
+ARCHIVE_FORMAT_VERSION = 1
+# 每个分片最多容纳的点数；压实时内存中只缓存一个分片 (约 32 字节/点)
+PART_MAX_POINTS = 4 * 1024 * 1024
+# 会话缺少时间戳的点在 ts 列中记为该值
+MISSING_TIMESTAMP = -1
+
+# 分片目录中的列文件：
+#   lat.npy / lon.npy    : float64 经纬度 (与会话存储中的数值完全一致，计分结果不变)
+#   ts.npy               : int64 时间戳 (毫秒)
+#   weight.npy           : int64 每个点代表的原始采样数 (入库简化后的轨迹)，整个分片都为 1 时不生成
+#   session_offsets.npy  : int64，第 i 个会话的点位于 [offsets[i], offsets[i+1])
+#   sessions.json        : 各会话的 session_id
+COLUMN_FILES = ('lat', 'lon', 'ts')
+# 归档目录中由压实写入的条目，清空归档时只删除这些条目
+ARCHIVE_ENTRY_PATTERN = re.compile(r'^(manifest\.json(\.tmp)?|part_\d{6}(\.tmp)?)$')
+
+
+def _timestamp_value(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return MISSING_TIMESTAMP
+    return int(value)
+
+
+# 压实时的内存缓冲区：累积一个分片的列数据，写满后整体落盘
+class _PartBuffer:
+    def __init__(self):
+        self.lats = []
+        self.lons = []
+        self.timestamps = []
+        self.weights = []
+        self.session_offsets = [0]
+        self.session_ids = []
+        self.start_position = None
+
+    def add_session(self, session):
+        for data_point in session.get('location_history', []):
+            user_lat = data_point.get('latitude')
+            user_lon = data_point.get('longitude')
+            if user_lat is None or user_lon is None:
+                continue
+            self.lats.append(user_lat)
+            self.lons.append(user_lon)
+            self.timestamps.append(_timestamp_value(data_point.get('timestamp')))
+            self.weights.append(point_weight(data_point.get('weight', 1)))
+        self.session_offsets.append(len(self.lats))
+        self.session_ids.append(session.get('session_id'))
+
+    def write(self, part_dir):
+        tmp_dir = part_dir + '.tmp'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, 'lat.npy'), np.array(self.lats, dtype=np.float64))
+        np.save(os.path.join(tmp_dir, 'lon.npy'), np.array(self.lons, dtype=np.float64))
+        np.save(os.path.join(tmp_dir, 'ts.npy'), np.array(self.timestamps, dtype=np.int64))
+        weighted = any(weight != 1 for weight in self.weights)
+        if weighted:
+            np.save(os.path.join(tmp_dir, 'weight.npy'), np.array(self.weights, dtype=np.int64))
+        np.save(os.path.join(tmp_dir, 'session_offsets.npy'), np.array(self.session_offsets, dtype=np.int64))
+        with open(os.path.join(tmp_dir, 'sessions.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.session_ids, f, ensure_ascii=False)
+        os.replace(tmp_dir, part_dir)
+        return {
+            'name': os.path.basename(part_dir),
+            'points': len(self.lats),
+            'sessions': len(self.session_ids),
+            'weighted': weighted,
+            'total_weight': int(sum(self.weights)),
+            'start_position': self.start_position,
+        }
+
+
+# 列式点归档：目录下的 manifest.json 记录各分片及已压实到的会话存储高水位标记，
+# 每个分片的列均为 .npy 文件，读取时 np.load(mmap_mode='r') 内存映射，不经过 Python 对象
+class PointArchive:
+    def __init__(self, directory=DEFAULT_POINT_ARCHIVE_PATH):
+        self.directory = directory
+        self.manifest = self._load_manifest()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, 'manifest.json')
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if manifest.get('version') != ARCHIVE_FORMAT_VERSION:
+            return None
+        return manifest
+
+    def _save_manifest(self, manifest):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+        self.manifest = manifest
+
+    def exists(self):
+        return self.manifest is not None
+
+    # 归档是否由该会话存储压实而来
+    def matches_source(self, session_file):
+        return self.exists() and self.manifest.get('source') == os.path.abspath(session_file)
+
+    @property
+    def parts(self):
+        return self.manifest['parts'] if self.manifest else []
+
+    @property
+    def high_water_mark(self):
+        return self.manifest.get('high_water_mark') if self.manifest else None
+
+    @property
+    def total_points(self):
+        return sum(part['points'] for part in self.parts)
+
+    @property
+    def total_sessions(self):
+        return sum(part['sessions'] for part in self.parts)
+
+    # 从某个会话存储位置开始的分片下标：位置恰好是某分片的起点或归档末尾时返回下标，否则返回 None
+    def part_index_at(self, position):
+        if position is None:
+            return 0
+        for index, part in enumerate(self.parts):
+            if part['start_position'] == position:
+                return index
+        if position == self.high_water_mark:
+            return len(self.parts)
+        return None
+
+    # 以内存映射方式打开分片的某一列
+    def load_column(self, part, column):
+        return np.load(os.path.join(self.directory, part['name'], f'{column}.npy'), mmap_mode='r')
+
+    def load_part(self, part):
+        columns = {column: self.load_column(part, column) for column in COLUMN_FILES + ('session_offsets',)}
+        columns['weight'] = self.load_column(part, 'weight') if part['weighted'] else None
+        return columns
+
+    # 按块产出 (lats, lons) 或 (lats, lons, weights)，各数组均为内存映射的切片视图 (零拷贝)；
+    # 与 SessionPointChunkReader 相同，未简化的分片权重为 None
+    def iter_chunks(self, chunk_size, with_weights=False, first_part=0):
+        for part in self.parts[first_part:]:
+            if part['points'] == 0:
+                continue
+            lats = self.load_column(part, 'lat')
+            lons = self.load_column(part, 'lon')
+            weights = self.load_column(part, 'weight') if part['weighted'] else None
+            for start in range(0, len(lats), chunk_size):
+                end = start + chunk_size
+                if with_weights:
+                    yield lats[start:end], lons[start:end], weights[start:end] if weights is not None else None
+                else:
+                    yield lats[start:end], lons[start:end]
+
+    # 目录中是否有归档清单 (任意格式版本)；只有这样的目录才允许被清空
+    def _has_archive_manifest(self):
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return isinstance(manifest, dict) and 'version' in manifest and 'parts' in manifest
+
+    # 清空归档：只删除清单和分片目录；目录中没有归档清单且不为空时拒绝，避免 --archive 指向其他目录时误删文件
+    def _clear(self):
+        if os.path.isdir(self.directory) and os.listdir(self.directory):
+            if not self._has_archive_manifest():
+                raise ValueError(f"目录 '{self.directory}' 不是点归档 (缺少 manifest.json) 且不为空，拒绝清空")
+            for name in os.listdir(self.directory):
+                if not ARCHIVE_ENTRY_PATTERN.match(name):
+                    continue
+                path = os.path.join(self.directory, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+        elif os.path.exists(self.directory) and not os.path.isdir(self.directory):
+            raise ValueError(f"'{self.directory}' 不是目录，无法作为点归档")
+        self.manifest = None
+
+    # 把会话存储中归档高水位之后的会话压实为新的分片 (rebuild=True 时清空后全量重建)，返回新增点数
+    def compact(self, store, session_file, part_max_points=PART_MAX_POINTS, rebuild=False):
+        if rebuild or not self.matches_source(session_file):
+            self._clear()
+        manifest = self.manifest or {
+            'version': ARCHIVE_FORMAT_VERSION,
+            'source': os.path.abspath(session_file),
+            'high_water_mark': None,
+            'parts': [],
+        }
+        start_time = time.time()
+        new_points = 0
+        buffer = _PartBuffer()
+        buffer.start_position = manifest['high_water_mark']
+
+        def flush(end_position):
+            nonlocal buffer, new_points
+            part_dir = os.path.join(self.directory, f"part_{len(manifest['parts']):06d}")
+            part = buffer.write(part_dir)
+            manifest['parts'].append(part)
+            manifest['high_water_mark'] = end_position
+            manifest['updated_at'] = time.time()
+            # 每写完一个分片就更新清单，中途中断时已写入的分片仍然有效
+            self._save_manifest(manifest)
+            new_points += part['points']
+            buffer = _PartBuffer()
+            buffer.start_position = end_position
+
+        os.makedirs(self.directory, exist_ok=True)
+        position = manifest['high_water_mark']
+        for position, session in store.iter_sessions_with_position(since=manifest['high_water_mark']):
+            buffer.add_session(session)
+            if len(buffer.lats) >= part_max_points:
+                flush(position)
+        if buffer.session_ids:
+            flush(position)
+        elif not self.exists():
+            self._save_manifest(manifest)
+
+        print(f"点归档压实完成: 新增 {new_points} 个点，共 {len(manifest['parts'])} 个分片、"
+              f"{self.total_points} 个点，耗时 {time.time() - start_time:.2f} 秒，目录 '{self.directory}'。")
+        return new_points
+
+
+def compact_session_store(session_file=DEFAULT_SESSION_STORE_PATH, archive_dir=DEFAULT_POINT_ARCHIVE_PATH,
+                          rebuild=False, part_max_points=PART_MAX_POINTS):
+    store = open_session_store(session_file)
+    archive = PointArchive(archive_dir)
+    return archive.compact(store, session_file, part_max_points=part_max_points, rebuild=rebuild)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='把会话存储压实为列式 .npy 点归档，供 session_analyzer.py 内存映射读取')
+    parser.add_argument('--store', default=DEFAULT_SESSION_STORE_PATH, help='会话存储路径')
+    parser.add_argument('--archive', default=DEFAULT_POINT_ARCHIVE_PATH, help='点归档目录')
+    parser.add_argument('--rebuild', action='store_true', help='清空归档后全量重建')
+    args = parser.parse_args()
+
+    try:
+        compact_session_store(args.store, args.archive, rebuild=args.rebuild)
+    except ValueError as e:
+        print(f"错误: {e}")
+        raise SystemExit(1)
@@ -1,7 +1,9 @@
+import hashlib
 import json
 import os
 import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.svm import SVR
@@ -14,6 +16,11 @@ import math
 import requests
 import re
 from branca.colormap import LinearColormap
+from session_store import DEFAULT_SESSION_STORE_PATH, open_session_store
+from density_tiles import DEFAULT_TILE_DIR, build_density_tile_pyramid
+from point_archive import DEFAULT_POINT_ARCHIVE_PATH, PointArchive, compact_session_store
+from trajectory_simplify import point_weight
+from hotspot_model import DEFAULT_MODEL_DIR, HotspotModel, HotspotModelStore, training_fingerprint
 
 
 # Haversine 公式计算两点间距离（米）
@@ -47,6 +54,229 @@ def get_proximity_level_score(distance_m):
     return 1  # 默认最低等级 (理论上不会执行到这里，因为有 float('inf'))
 
 
+# 向量化版本所需的等级边界数组 (与 PROXIMITY_LEVELS 保持一致，按 min 升序)
+_LEVEL_MINS = np.array([level["min"] for level in PROXIMITY_LEVELS], dtype=np.float64)
+_LEVEL_MAXS = np.array([level["max"] for level in PROXIMITY_LEVELS], dtype=np.float64)
+_LEVEL_SCORES = np.array([level["score"] for level in PROXIMITY_LEVELS], dtype=np.int64)
+# 向量化计算时每块距离矩阵的元素上限 (points×attractions)，约 16MB 的 float64，控制内存占用
+PROXIMITY_CHUNK_ELEMENTS = 1 << 21
+
+
+# 向量化 Haversine：计算 points × attractions 的距离矩阵（米），运算顺序与 haversine_distance 一致
+def haversine_distance_matrix(lats, lons, attraction_lats, attraction_lons):
+    R = 6371000  # 地球半径（米）
+    lats = np.asarray(lats, dtype=np.float64)[:, None]
+    lons = np.asarray(lons, dtype=np.float64)[:, None]
+    attraction_lats = np.asarray(attraction_lats, dtype=np.float64)[None, :]
+    attraction_lons = np.asarray(attraction_lons, dtype=np.float64)[None, :]
+
+    phi1 = np.radians(lats)
+    phi2 = np.radians(attraction_lats)
+    delta_phi = np.radians(attraction_lats - lats)
+    delta_lambda = np.radians(attraction_lons - lons)
+
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return R * c
+
+
+# 向量化版 get_proximity_level_score：用 searchsorted 找到 min 不超过距离的最高等级，
+# 再检查是否落在该等级的 [min, max] 闭区间内；等级之间的缝隙 (如 200~201 米) 与原函数一样取默认值 1
+def proximity_scores_from_distances(distances):
+    distances = np.asarray(distances, dtype=np.float64)
+    level_idx = np.searchsorted(_LEVEL_MINS, distances, side='right') - 1
+    safe_idx = np.clip(level_idx, 0, len(_LEVEL_MINS) - 1)
+    in_level = (level_idx >= 0) & (distances <= _LEVEL_MAXS[safe_idx])
+    return np.where(in_level, _LEVEL_SCORES[safe_idx], 1)
+
+
+# 分块累加每个景点的亲近度分数 (整数求和，结果与逐点循环完全一致)；
+# weights 为每个点代表的原始采样数 (入库简化后的轨迹点)，为 None 时每点计 1 次
+def accumulate_proximity_scores(lats, lons, attraction_lats, attraction_lons, chunk_size=None, weights=None):
+    score_sums = np.zeros(len(attraction_lats), dtype=np.int64)
+    if chunk_size is None:
+        chunk_size = max(1, PROXIMITY_CHUNK_ELEMENTS // max(1, len(attraction_lats)))
+    for start in range(0, len(lats), chunk_size):
+        distances = haversine_distance_matrix(lats[start:start + chunk_size], lons[start:start + chunk_size],
+                                              attraction_lats, attraction_lons)
+        scores = proximity_scores_from_distances(distances)
+        if weights is not None:
+            scores = scores * weights[start:start + chunk_size, None]
+        score_sums += scores.sum(axis=0)
+    return score_sums
+
+
+# 近场半径：超过最后一个有限等级上限 (1500 米) 的距离一律得 1 分
+NEAR_FIELD_RADIUS_M = float(max(level["max"] for level in PROXIMITY_LEVELS if level["max"] != float('inf')))
+METERS_PER_DEGREE_LAT = 6371000 * math.pi / 180
+
+
+# 把网格行列号编码为单个 int64 (各加 2^30 偏移以支持负坐标)，便于 np.unique 分组
+def encode_cell_keys(rows, cols):
+    return (rows + (1 << 30)) * (1 << 31) + (cols + (1 << 30))
+
+
+def decode_cell_keys(keys):
+    return keys // (1 << 31) - (1 << 30), keys % (1 << 31) - (1 << 30)
+
+
+# 景点网格索引：把景点按经纬度网格分桶，网格边长不小于近场半径，
+# 因此与某点距离在近场半径内的景点一定落在该点所在格子及其相邻 8 个格子中
+class AttractionGridIndex:
+    def __init__(self, attraction_lats, attraction_lons, radius_m=NEAR_FIELD_RADIUS_M, safety_factor=1.1):
+        self.attraction_lats = np.asarray(attraction_lats, dtype=np.float64)
+        self.attraction_lons = np.asarray(attraction_lons, dtype=np.float64)
+        self.radius_m = radius_m
+        self.cell_lat_deg = radius_m * safety_factor / METERS_PER_DEGREE_LAT
+        # 经度方向按景点集合中最高纬度 (再加 1 度余量) 计算，保证所有纬度上格子宽度都不小于半径
+        reference_lat = min(89.0, float(np.max(np.abs(self.attraction_lats))) + 1.0) if len(self.attraction_lats) else 0.0
+        self.cell_lon_deg = self.cell_lat_deg / math.cos(math.radians(reference_lat))
+
+        self._buckets = defaultdict(list)
+        cell_rows, cell_cols = self.cell_of(self.attraction_lats, self.attraction_lons)
+        for attraction_idx, (row, col) in enumerate(zip(cell_rows.tolist(), cell_cols.tolist())):
+            self._buckets[(row, col)].append(attraction_idx)
+        self._neighbor_cache = {}
+
+    def cell_of(self, lats, lons):
+        rows = np.floor(np.asarray(lats, dtype=np.float64) / self.cell_lat_deg).astype(np.int64)
+        cols = np.floor(np.asarray(lons, dtype=np.float64) / self.cell_lon_deg).astype(np.int64)
+        return rows, cols
+
+    # 返回某格子 3×3 邻域内的所有景点下标
+    def candidates(self, row, col):
+        key = (row, col)
+        if key not in self._neighbor_cache:
+            indices = []
+            for d_row in (-1, 0, 1):
+                for d_col in (-1, 0, 1):
+                    indices.extend(self._buckets.get((row + d_row, col + d_col), ()))
+            self._neighbor_cache[key] = np.array(sorted(indices), dtype=np.int64)
+        return self._neighbor_cache[key]
+
+
+# 基于网格索引的累加：每个点先对所有景点计远场常数 1 分，
+# 再只对近场候选景点计算精确距离并补上 (等级分数 - 1)，结果与全量计算完全一致
+def accumulate_proximity_scores_indexed(lats, lons, grid_index, weights=None):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    num_attractions = len(grid_index.attraction_lats)
+    total_weight = len(lats) if weights is None else int(weights.sum())
+    score_sums = np.full(num_attractions, total_weight, dtype=np.int64)
+    if len(lats) == 0 or num_attractions == 0:
+        return score_sums
+
+    rows, cols = grid_index.cell_of(lats, lons)
+    unique_keys, inverse = np.unique(encode_cell_keys(rows, cols), return_inverse=True)
+    order = np.argsort(inverse, kind='stable')
+    cell_ends = np.cumsum(np.bincount(inverse, minlength=len(unique_keys)))
+
+    start = 0
+    for cell_idx, end in enumerate(cell_ends.tolist()):
+        point_idx = order[start:end]
+        start = end
+        first = point_idx[0]
+        candidate_idx = grid_index.candidates(int(rows[first]), int(cols[first]))
+        if len(candidate_idx) == 0:
+            continue
+        cell_weights = weights[point_idx] if weights is not None else None
+        near_sums = accumulate_proximity_scores(lats[point_idx], lons[point_idx],
+                                                grid_index.attraction_lats[candidate_idx],
+                                                grid_index.attraction_lons[candidate_idx], weights=cell_weights)
+        score_sums[candidate_idx] += near_sums - (len(point_idx) if cell_weights is None else int(cell_weights.sum()))
+    return score_sums
+
+
+# 会话存储中每块读取的点数，决定流式处理时的内存上限
+POINT_CHUNK_SIZE = 262144
+
+
+# 流式读取会话存储中的位置点，按固定大小产出 (lats, lons) float64 数组块，不会一次性载入全部会话；
+# 遍历过程中 high_water_mark 记录已完整读取的最后一个会话的位置，可用于增量检查点。
+# with_weights=True 时产出 (lats, lons, weights)：weights 为入库简化时记录的 weight (int64)，
+# 整块都是未简化的原始点时为 None
+class SessionPointChunkReader:
+    def __init__(self, store, since=None, chunk_size=POINT_CHUNK_SIZE, with_weights=False, until=None):
+        self.store = store
+        self.since = since
+        self.until = until
+        self.chunk_size = chunk_size
+        self.with_weights = with_weights
+        self.high_water_mark = since
+        self.sessions_read = 0
+
+    def _make_chunk(self, user_lats, user_lons, user_weights, weighted):
+        lats = np.array(user_lats, dtype=np.float64)
+        lons = np.array(user_lons, dtype=np.float64)
+        if not self.with_weights:
+            return lats, lons
+        return lats, lons, np.array(user_weights, dtype=np.int64) if weighted else None
+
+    def __iter__(self):
+        user_lats = []
+        user_lons = []
+        user_weights = []
+        weighted = False
+        for position, session in self.store.iter_sessions_with_position(since=self.since, until=self.until):
+            for data_point in session.get('location_history', []):
+                user_lat = data_point.get('latitude')
+                user_lon = data_point.get('longitude')
+                if user_lat is None or user_lon is None:
+                    continue
+                user_lats.append(user_lat)
+                user_lons.append(user_lon)
+                if self.with_weights:
+                    weight = point_weight(data_point.get('weight', 1))
+                    weighted = weighted or weight != 1
+                    user_weights.append(weight)
+                if len(user_lats) >= self.chunk_size:
+                    yield self._make_chunk(user_lats, user_lons, user_weights, weighted)
+                    user_lats = []
+                    user_lons = []
+                    user_weights = []
+                    weighted = False
+            self.sessions_read += 1
+            self.high_water_mark = position
+        if user_lats:
+            yield self._make_chunk(user_lats, user_lons, user_weights, weighted)
+
+
+# 先以内存映射方式扫描列式点归档 (point_archive.py 压实生成)，再流式读取归档之后新写入会话存储的会话；
+# 接口与 SessionPointChunkReader 相同，high_water_mark 同样是会话存储中的位置
+class ArchivePointChunkReader:
+    def __init__(self, archive, store, first_part=0, chunk_size=POINT_CHUNK_SIZE, with_weights=False):
+        self.archive = archive
+        self.first_part = first_part
+        self.chunk_size = chunk_size
+        self.with_weights = with_weights
+        self.tail_reader = SessionPointChunkReader(store, since=archive.high_water_mark, chunk_size=chunk_size,
+                                                   with_weights=with_weights)
+        self.archive_sessions = sum(part['sessions'] for part in archive.parts[first_part:])
+
+    @property
+    def high_water_mark(self):
+        return self.tail_reader.high_water_mark
+
+    @property
+    def sessions_read(self):
+        return self.archive_sessions + self.tail_reader.sessions_read
+
+    def __iter__(self):
+        yield from self.archive.iter_chunks(self.chunk_size, self.with_weights, first_part=self.first_part)
+        yield from self.tail_reader
+
+
+# 选择位置点的读取方式：存在由该会话存储压实的点归档、且读取起点落在分片边界上时使用归档，否则逐条解析会话存储
+def open_point_reader(store, session_file, since=None, archive_dir=DEFAULT_POINT_ARCHIVE_PATH, with_weights=False):
+    archive = PointArchive(archive_dir) if archive_dir else None
+    if archive is not None and archive.matches_source(session_file):
+        first_part = archive.part_index_at(since)
+        if first_part is not None:
+            print(f"使用列式点归档 '{archive_dir}' ({archive.total_points} 个点)，并读取归档之后的新会话。")
+            return ArchivePointChunkReader(archive, store, first_part=first_part, with_weights=with_weights)
+    return SessionPointChunkReader(store, since=since, with_weights=with_weights)
+
+
 # 获取地图地点数据 (保持原样，未做任何修改)
 def get_all_locations_data_from_source():
     all_markers_data = [
@@ -71,53 +301,36 @@ def get_all_locations_data_from_source():
     return all_markers_data
 
 
-# 计算用户对每个地点的实际兴趣分数（作为SVM的训练目标）
-def calculate_actual_interest_scores(session_file='user_sessions_data.json'):
-    print(f"--- 开始计算实际兴趣分数 ---")
-    all_locations = get_all_locations_data_from_source()
-    attraction_coords_map = {loc['name']: loc['location'] for loc in all_locations}
-
-    # 初始化每个地点的总兴趣分数
-    interest_scores = defaultdict(float)
-
-    if not os.path.exists(session_file) or os.path.getsize(session_file) == 0:
-        print(f"警告: 会话文件 '{session_file}' 不存在或为空，无法计算兴趣分数。")
-        print(f"--- 实际兴趣分数计算结束 (无数据) ---")
-        return {}
-
-    try:
-        with open(session_file, 'r', encoding='utf-8') as f:
-            sessions = json.load(f)
-        print(f"成功加载 {len(sessions)} 个用户会话。")
-    except json.JSONDecodeError:
-        print(f"错误: 解析会话文件 '{session_file}' 失败，请检查JSON格式。")
-        print(f"--- 实际兴趣分数计算结束 (解析失败) ---")
-        return {}
+# 计算原始 (未归一化) 兴趣分数，point_chunks 为 (lats, lons) 或 (lats, lons, weights) 数组块的可迭代对象，
+# 返回 (分数字典, 有效点数)；带权重时有效点数为权重之和，即简化前的原始采样数
+# engine: 'indexed' (默认，网格索引只计算近场景点) / 'vectorized' (全量距离矩阵)
+def compute_raw_interest_scores(point_chunks, attraction_coords_map, engine='indexed'):
+    attraction_names = list(attraction_coords_map.keys())
+    attraction_lats = np.array([attraction_coords_map[name][0] for name in attraction_names], dtype=np.float64)
+    attraction_lons = np.array([attraction_coords_map[name][1] for name in attraction_names], dtype=np.float64)
+    grid_index = AttractionGridIndex(attraction_lats, attraction_lons) if engine == 'indexed' else None
 
+    score_sums = np.zeros(len(attraction_names), dtype=np.int64)
     total_points_processed = 0
-    for session_idx, session in enumerate(sessions):
-        location_history = session.get('location_history', [])
-
-        for data_point_idx, data_point in enumerate(location_history):
-            user_lat = data_point.get('latitude')
-            user_lon = data_point.get('longitude')
-
-            if user_lat is None or user_lon is None:
-                continue
-
-            total_points_processed += 1
+    for chunk in point_chunks:
+        user_lats, user_lons = chunk[0], chunk[1]
+        weights = chunk[2] if len(chunk) > 2 else None
+        total_points_processed += len(user_lats) if weights is None else int(weights.sum())
+        if engine == 'indexed':
+            score_sums += accumulate_proximity_scores_indexed(user_lats, user_lons, grid_index, weights)
+        else:
+            score_sums += accumulate_proximity_scores(user_lats, user_lons, attraction_lats, attraction_lons,
+                                                      weights=weights)
 
-            # 对于每个用户位置点，计算其与所有景点的亲近度分数并累加
-            for attraction_name, attraction_loc in attraction_coords_map.items():
-                attraction_lat, attraction_lon = attraction_loc
-                distance = haversine_distance(user_lat, user_lon, attraction_lat, attraction_lon)
-                score = get_proximity_level_score(distance)
-                interest_scores[attraction_name] += score
+    if total_points_processed == 0:
+        return {}, 0
+    interest_scores = {name: float(score_sum) for name, score_sum in zip(attraction_names, score_sums)}
+    return interest_scores, total_points_processed
 
-    print(f"总共处理了 {total_points_processed} 个有效用户位置点。")
-    print(f"计算出 {len(interest_scores)} 个地点的原始兴趣分数。")
 
-    # 对兴趣分数进行归一化处理，以便作为SVM的训练目标
+# 对兴趣分数进行归一化处理，以便作为SVM的训练目标
+def normalize_interest_scores(raw_scores):
+    interest_scores = dict(raw_scores)
     if interest_scores:
         scores_array = np.array(list(interest_scores.values())).reshape(-1, 1)
         if scores_array.shape[0] > 0 and np.max(scores_array) > np.min(scores_array):
@@ -133,13 +346,119 @@ def calculate_actual_interest_scores(session_file='user_sessions_data.json'):
                 interest_scores[loc_name] = float(interest_scores[loc_name])
     else:
         print("警告: 没有计算出任何原始兴趣分数。")
+    return interest_scores
+
+
+# 增量计算的检查点文件：保存各地点的原始分数累计值和会话存储的高水位标记
+INTEREST_CHECKPOINT_FILE = 'interest_score_checkpoint.json'
+
+
+# 检查点签名：景点集合或亲近等级变化后，旧的累计分数不再有效，需要全量重算
+def _interest_checkpoint_signature(session_file, attraction_coords_map):
+    signature_source = json.dumps({
+        'session_file': os.path.abspath(session_file),
+        'attractions': attraction_coords_map,
+        'levels': PROXIMITY_LEVELS,
+    }, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(signature_source.encode('utf-8')).hexdigest()
+
+
+def load_interest_checkpoint(checkpoint_file, session_file, attraction_coords_map):
+    if not os.path.exists(checkpoint_file):
+        print(f"未找到检查点文件 '{checkpoint_file}'，将进行全量计算。")
+        return None
+    try:
+        with open(checkpoint_file, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except json.JSONDecodeError:
+        print(f"警告: 检查点文件 '{checkpoint_file}' 格式错误，将进行全量计算。")
+        return None
+    if checkpoint.get('signature') != _interest_checkpoint_signature(session_file, attraction_coords_map):
+        print("警告: 会话存储、景点集合或亲近等级已变化，检查点失效，将进行全量计算。")
+        return None
+    return checkpoint
+
+
+# 先写临时文件再原子替换，避免中途崩溃留下半个检查点
+def save_interest_checkpoint(checkpoint_file, session_file, attraction_coords_map, raw_scores, total_points,
+                             high_water_mark):
+    checkpoint = {
+        'signature': _interest_checkpoint_signature(session_file, attraction_coords_map),
+        'high_water_mark': high_water_mark,
+        'raw_scores': dict(raw_scores),
+        'total_points': total_points,
+        'updated_at': time.time(),
+    }
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(tmp_file, checkpoint_file)
+    print(f"检查点已保存到 '{checkpoint_file}'，高水位标记: {high_water_mark}")
+
+
+# 计算用户对每个地点的实际兴趣分数（作为SVM的训练目标）
+# incremental=True 时从检查点继续：只处理高水位标记之后的新会话，再与累计的原始分数合并后重新归一化
+# executor 为进程池 (workers 个进程) 时按分片并行计分 (见 scan_interest_scores_parallel)，结果与串行完全一致
+def calculate_actual_interest_scores(session_file=DEFAULT_SESSION_STORE_PATH, engine='indexed', incremental=False,
+                                     checkpoint_file=INTEREST_CHECKPOINT_FILE, archive_dir=DEFAULT_POINT_ARCHIVE_PATH,
+                                     executor=None, workers=os.cpu_count() or 1):
+    print(f"--- 开始计算实际兴趣分数 ---")
+    all_locations = get_all_locations_data_from_source()
+    attraction_coords_map = {loc['name']: loc['location'] for loc in all_locations}
+
+    store = open_session_store(session_file)
+    if store.is_empty():
+        print(f"警告: 会话存储 '{session_file}' 不存在或为空，无法计算兴趣分数。")
+        print(f"--- 实际兴趣分数计算结束 (无数据) ---")
+        return {}
+
+    # 初始化每个地点的总兴趣分数 (增量模式下从检查点恢复)
+    interest_scores = defaultdict(float)
+    total_points_processed = 0
+    high_water_mark = None
+    checkpoint = load_interest_checkpoint(checkpoint_file, session_file, attraction_coords_map) if incremental else None
+    if checkpoint:
+        interest_scores.update(checkpoint['raw_scores'])
+        total_points_processed = checkpoint['total_points']
+        high_water_mark = checkpoint['high_water_mark']
+        print(f"从检查点恢复: 已累计 {total_points_processed} 个点，高水位标记: {high_water_mark}")
+
+    # 流式读取新会话，内存占用与会话总量无关
+    if executor is not None:
+        new_scores, new_points, sessions_read, high_water_mark = scan_interest_scores_parallel(
+            executor, session_file, attraction_coords_map, since=high_water_mark, archive_dir=archive_dir, engine=engine,
+            workers=workers)
+    else:
+        reader = open_point_reader(store, session_file, since=high_water_mark, archive_dir=archive_dir,
+                                   with_weights=True)
+        new_scores, new_points = compute_raw_interest_scores(reader, attraction_coords_map, engine=engine)
+        high_water_mark = reader.high_water_mark
+        sessions_read = reader.sessions_read
+    print(f"成功读取 {sessions_read} 个{'新' if checkpoint else ''}用户会话。")
+    for loc_name, score in new_scores.items():
+        interest_scores[loc_name] += score
+    total_points_processed += new_points
+
+    print(f"本次处理了 {new_points} 个有效用户位置点，累计 {total_points_processed} 个。")
+    print(f"计算出 {len(interest_scores)} 个地点的原始兴趣分数。")
+
+    if incremental:
+        save_interest_checkpoint(checkpoint_file, session_file, attraction_coords_map, interest_scores,
+                                 total_points_processed, high_water_mark)
+
+    interest_scores = normalize_interest_scores(interest_scores)
 
     print(f"--- 实际兴趣分数计算结束 ---")
-    return dict(interest_scores)
+    return interest_scores
+
+
+# SVR 超参数 (同时写入训练指纹，修改后会重新训练)
+SVR_PARAMS = {'kernel': 'rbf', 'C': 1.0, 'gamma': 'scale'}
 
 
 # 使用SVM训练模型并预测兴趣分数
-def train_and_predict_interest_with_svm(actual_interest_scores):
+# 训练得到的缩放器和模型按版本保存到 model_dir；输入分数与上次训练相同时直接加载已保存的模型，不再重新训练
+def train_and_predict_interest_with_svm(actual_interest_scores, model_dir=DEFAULT_MODEL_DIR):
     print(f"--- 开始训练SVM模型并预测兴趣分数 ---")
     all_locations = get_all_locations_data_from_source()
 
@@ -172,13 +491,22 @@ def train_and_predict_interest_with_svm(actual_interest_scores):
     X = np.array(X)
     y = np.array(y)
 
-    feature_scaler = MinMaxScaler()
-    X_scaled = feature_scaler.fit_transform(X)
-    print(f"训练特征已缩放。X_scaled 形状: {X_scaled.shape}")
+    model_store = HotspotModelStore(model_dir) if model_dir else None
+    fingerprint = training_fingerprint(X, y, SVR_PARAMS)
+    saved_model = model_store.load() if model_store else None
+    if saved_model is not None and saved_model.fingerprint == fingerprint:
+        print(f"输入分数与已保存的模型 v{saved_model.version} 相同，跳过训练。")
+        feature_scaler = saved_model.feature_scaler
+        svm_model = saved_model.svr
+    else:
+        feature_scaler = MinMaxScaler()
+        X_scaled = feature_scaler.fit_transform(X)
+        print(f"训练特征已缩放。X_scaled 形状: {X_scaled.shape}")
 
-    svm_model = SVR(kernel='rbf', C=1.0, gamma='scale')
-    svm_model.fit(X_scaled, y)
-    print(f"SVM模型训练完成。")
+        svm_model = SVR(**SVR_PARAMS)
+        svm_model.fit(X_scaled, y)
+        print(f"SVM模型训练完成。")
+        saved_model = None
 
     all_locations_features = []
     all_locations_names = []
@@ -206,6 +534,7 @@ def train_and_predict_interest_with_svm(actual_interest_scores):
     for i, loc_name in enumerate(all_locations_names):
         predicted_interest_scores[loc_name] = predicted_scores_array[i]
 
+    scaler_final = None
     if predicted_interest_scores:
         scores_array_final = np.array(list(predicted_interest_scores.values())).reshape(-1, 1)
         if scores_array_final.shape[0] > 0 and np.max(scores_array_final) > np.min(scores_array_final):
@@ -222,6 +551,12 @@ def train_and_predict_interest_with_svm(actual_interest_scores):
     else:
         print("警告: 没有计算出任何预测兴趣分数。")
 
+    # 保存新训练的模型包；输出缩放器与上面的归一化相同，服务端对任意坐标的预测与热力图使用同一刻度
+    if model_store is not None and saved_model is None:
+        version = model_store.save(HotspotModel(feature_scaler, svm_model, scaler_final, fingerprint,
+                                                location_names_for_training))
+        print(f"热点模型已保存为 v{version} (目录 '{model_dir}')。")
+
     print(f"--- SVM模型训练和预测结束 ---")
     return predicted_interest_scores
 
@@ -265,50 +600,106 @@ def generate_attraction_interest_heatmap_html(interest_scores, output_filename='
     return map_html
 
 
-# 生成基于用户活动密度的热力图
-def generate_user_activity_density_heatmap_html(session_file='user_sessions_data.json',
-                                                output_filename='user_activity_density_heatmap.html'):
+# 密度热力图的默认网格边长（米）
+DENSITY_CELL_SIZE_M = 25.0
+# 经度方向网格宽度按该纬度换算 (长沙市中心附近)
+DENSITY_REFERENCE_LAT = 28.2
+
+
+# 稀疏经纬度网格计数器：把位置点按规则网格分箱并累加权重，只保存非空格子，
+# 输出大小只与覆盖面积和分辨率相关，与原始点数无关
+class DensityGrid:
+    def __init__(self, cell_size_m=DENSITY_CELL_SIZE_M, reference_lat=DENSITY_REFERENCE_LAT):
+        self.cell_size_m = cell_size_m
+        self.reference_lat = reference_lat
+        self.cell_lat_deg = cell_size_m / METERS_PER_DEGREE_LAT
+        self.cell_lon_deg = self.cell_lat_deg / math.cos(math.radians(reference_lat))
+        self.total_points = 0
+        self._keys = np.empty(0, dtype=np.int64)
+        self._weights = np.empty(0, dtype=np.float64)
+
+    def _merge(self, keys, weights):
+        all_keys = np.concatenate([self._keys, keys])
+        all_weights = np.concatenate([self._weights, weights])
+        self._keys, inverse = np.unique(all_keys, return_inverse=True)
+        self._weights = np.bincount(inverse, weights=all_weights, minlength=len(self._keys))
+
+    # 向量化分箱：先在当前块内按格子求和，再与已有的稀疏计数合并
+    def add(self, lats, lons, weights=None):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        if len(lats) == 0:
+            return
+        rows = np.floor(lats / self.cell_lat_deg).astype(np.int64)
+        cols = np.floor(lons / self.cell_lon_deg).astype(np.int64)
+        chunk_keys, inverse = np.unique(encode_cell_keys(rows, cols), return_inverse=True)
+        chunk_weights = np.bincount(inverse, weights=weights, minlength=len(chunk_keys)).astype(np.float64)
+        self.total_points += len(lats) if weights is None else int(np.sum(weights))
+        self._merge(chunk_keys, chunk_weights)
+
+    # 合并另一个同分辨率网格 (用于分片并行计算后的归约)
+    def merge(self, other):
+        if (other.cell_size_m, other.reference_lat) != (self.cell_size_m, self.reference_lat):
+            raise ValueError("只能合并相同分辨率的密度网格")
+        self.total_points += other.total_points
+        self._merge(other._keys, other._weights)
+
+    # 返回非空格子的中心坐标与权重
+    def cells(self):
+        rows, cols = decode_cell_keys(self._keys)
+        cell_lats = (rows + 0.5) * self.cell_lat_deg
+        cell_lons = (cols + 0.5) * self.cell_lon_deg
+        return cell_lats, cell_lons, self._weights.copy()
+
+    # 转为 HeatMap 数据，权重为格子内的原始点数 (整数)，不做归一化和舍入，
+    # 点数很少的格子也不会因为与最热格子相差悬殊而变成 0；强度上限由 HeatMap 的 max 参数给出
+    def to_heatmap_data(self):
+        cell_lats, cell_lons, weights = self.cells()
+        # 6 位小数 (约 0.1 米) 的坐标已足够，避免 HTML 中出现冗长的浮点数
+        return [[round(float(lat), 6), round(float(lon), 6), int(round(float(weight)))]
+                for lat, lon, weight in zip(cell_lats, cell_lons, weights)]
+
+
+# 生成基于用户活动密度的热力图，返回嵌入页面的热力图数据 (非空格子及其点数)
+def generate_user_activity_density_heatmap_html(session_file=DEFAULT_SESSION_STORE_PATH,
+                                                output_filename='user_activity_density_heatmap.html',
+                                                cell_size_m=DENSITY_CELL_SIZE_M, archive_dir=DEFAULT_POINT_ARCHIVE_PATH,
+                                                executor=None, workers=os.cpu_count() or 1):
     print(f"--- 开始生成用户活动密度热力图HTML ({output_filename}) ---")
-    heatmap_data = []
 
-    if not os.path.exists(session_file) or os.path.getsize(session_file) == 0:
-        print(f"警告: 会话文件 '{session_file}' 不存在或为空，无法生成用户活动密度热力图。")
+    store = open_session_store(session_file)
+    if store.is_empty():
+        print(f"警告: 会话存储 '{session_file}' 不存在或为空，无法生成用户活动密度热力图。")
         m = folium.Map(location=[28.2282, 112.9389], zoom_start=13, tiles='CartoDB Voyager')
         map_html = m._repr_html_()
         with open(output_filename, 'w', encoding='utf-8') as f:
             f.write(map_html)
-        return map_html
+        return []
 
-    try:
-        with open(session_file, 'r', encoding='utf-8') as f:
-            sessions = json.load(f)
-        print(f"成功加载 {len(sessions)} 个用户会话用于密度热力图。")
-    except json.JSONDecodeError:
-        print(f"错误: 解析会话文件 '{session_file}' 失败，请检查JSON格式。无法生成用户活动密度热力图。")
-        m = folium.Map(location=[28.2282, 112.9389], zoom_start=13, tiles='CartoDB Voyager')
-        map_html = m._repr_html_()
-        with open(output_filename, 'w', encoding='utf-8') as f:
-            f.write(map_html)
-        return map_html
-
-    total_density_points = 0
-    for session in sessions:
-        location_history = session.get('location_history', [])
-        for data_point in location_history:
-            user_lat = data_point.get('latitude')
-            user_lon = data_point.get('longitude')
-            if user_lat is not None and user_lon is not None:
-                heatmap_data.append([user_lat, user_lon, 1])  # 每个点权重为1
-                total_density_points += 1
+    # 流式读取位置点并在服务端分箱，HTML 中只嵌入非空的加权网格，而不是全部原始点
+    if executor is not None:
+        density_grid, sessions_read = scan_density_grid_parallel(executor, session_file, cell_size_m,
+                                                                 archive_dir=archive_dir, workers=workers)
+    else:
+        reader = open_point_reader(store, session_file, archive_dir=archive_dir, with_weights=True)
+        density_grid = DensityGrid(cell_size_m=cell_size_m)
+        for user_lats, user_lons, weights in reader:
+            density_grid.add(user_lats, user_lons, weights)
+        sessions_read = reader.sessions_read
+    heatmap_data = density_grid.to_heatmap_data()
+    total_density_points = density_grid.total_points
+    print(f"成功读取 {sessions_read} 个用户会话用于密度热力图，聚合为 {len(heatmap_data)} 个 "
+          f"{cell_size_m:g} 米网格。")
 
     print(f"准备了 {total_density_points} 个点用于用户活动密度热力图。")
 
     map_center = [28.2282, 112.9389]  # 长沙市中心大致坐标
     m = folium.Map(location=map_center, zoom_start=14, tiles='CartoDB Voyager')
 
+    max_cell_points = max((cell[2] for cell in heatmap_data), default=1)
     if heatmap_data:
         # 调整radius和blur以更好地显示密度，可以根据实际数据和效果进行微调
-        HeatMap(heatmap_data, radius=25, blur=15, max_zoom=18).add_to(m)
+        HeatMap(heatmap_data, radius=25, blur=15, max_zoom=18, max=max_cell_points).add_to(m)
         print("用户活动密度热力图层已添加到地图。")
     else:
         print("没有用户活动密度热力图数据可供添加。热力图将为空。")
@@ -316,9 +707,9 @@ def generate_user_activity_density_heatmap_html(session_file='user_sessions_data
     # 添加色带图例
     colormap = LinearColormap(
         colors=['#0000FF', '#00FFFF', '#00FF00', '#FFFF00', '#FF8C00', '#FF4500', '#8B0000'],
-        vmin=0.0,  # 假设最低密度
-        vmax=1.0,  # 假设最高密度，HeatMap会自动根据数据范围调整颜色，这里只是给图例一个参考范围
-        caption='用户活动密度'
+        vmin=0,
+        vmax=max_cell_points,  # 与 HeatMap 的强度上限一致：最热格子的点数
+        caption='用户活动密度 (每格点数)'
     )
     m.add_child(colormap)
     print("色带图例已添加到地图。")
@@ -327,16 +718,146 @@ def generate_user_activity_density_heatmap_html(session_file='user_sessions_data
     with open(output_filename, 'w', encoding='utf-8') as f:
         f.write(map_html)
     print(f"--- 用户活动密度热力图HTML生成完成并保存到 '{output_filename}' ---")
-    return map_html
-
-
-# 主函数，用于分析会话数据并生成两种热力图
-def analyze_and_generate_heatmaps():
-    print("--- 主函数开始 ---")
-
-    # 1. 生成景点兴趣热力图 (基于SVM预测)
+    return heatmap_data
+
+
+# 生成多级密度瓦片金字塔，由 ai.py 的 /api/density_tiles/<z>/<x>/<y> 接口按视口分块提供给地图
+def generate_density_tile_pyramid(session_file=DEFAULT_SESSION_STORE_PATH, output_dir=DEFAULT_TILE_DIR,
+                                  archive_dir=DEFAULT_POINT_ARCHIVE_PATH):
+    store = open_session_store(session_file)
+    if store.is_empty():
+        print(f"警告: 会话存储 '{session_file}' 不存在或为空，密度瓦片将为空。")
+    reader = open_point_reader(store, session_file, archive_dir=archive_dir, with_weights=True)
+    return build_density_tile_pyramid(reader, output_dir=output_dir)
+
+
+# --- 多进程分片执行 ---
+# 分片数约为进程数的 4 倍，使各进程负载大致均衡
+SHARDS_PER_WORKER = 4
+
+
+# 会话存储中 since 之后的部分按存储位置切分为至多 num_shards 个分片 ('store', 会话存储路径, 起始位置, 结束位置)
+def _plan_store_shards(session_file, since, num_shards):
+    positions = open_session_store(session_file).split_positions(since, num_shards)
+    ends = positions[1:] + [None]
+    return [('store', session_file, start, end) for start, end in zip(positions, ends)]
+
+
+# 并行扫描的分片计划 (分片数为 SHARDS_PER_WORKER * workers)：可用的点归档按会话边界切分为点数大致相等的区间，
+# 归档之后新写入的会话 (无法使用归档时为 since 之后的全部会话) 按存储位置 (JSONL 分段的字节区间 / SQLite rowid) 切分。
+# 分片为元组，便于传给子进程: ('archive', 归档目录, 分片下标, 起始点, 结束点, 会话数) / ('store', 会话存储路径, 起始位置, 结束位置)
+def plan_point_shards(session_file, since=None, archive_dir=DEFAULT_POINT_ARCHIVE_PATH, workers=os.cpu_count() or 1):
+    num_shards = SHARDS_PER_WORKER * max(1, workers)
+    archive = PointArchive(archive_dir) if archive_dir else None
+    first_part = archive.part_index_at(since) if archive is not None and archive.matches_source(session_file) else None
+    if first_part is None:
+        shards = _plan_store_shards(session_file, since, num_shards)
+        if workers > 1 and len(shards) == 1:
+            print(f"警告: 会话存储 '{session_file}' 无法切分 (旧版 JSON 文件或数据量过小)，"
+                  f"将由单个进程读取，--workers {workers} 不会带来加速；先运行 --compact 可以按会话分片并行。")
+        return shards
+
+    parts = archive.parts[first_part:]
+    target_points = max(1, sum(part['points'] for part in parts) // max(1, num_shards))
+    shards = []
+    for part_index, part in enumerate(parts, start=first_part):
+        offsets = np.asarray(archive.load_column(part, 'session_offsets'))
+        if part['points'] == 0:
+            continue
+        # 在不超过目标点数的会话边界处切分 (单个会话不会被拆到两个分片中)
+        cut_targets = np.arange(target_points, part['points'], target_points)
+        cut_sessions = np.unique(np.searchsorted(offsets, cut_targets, side='right') - 1)
+        boundaries = [0] + [int(index) for index in cut_sessions if 0 < index < len(offsets) - 1] + [len(offsets) - 1]
+        for start_session, end_session in zip(boundaries[:-1], boundaries[1:]):
+            if end_session > start_session:
+                shards.append(('archive', archive_dir, part_index, int(offsets[start_session]),
+                               int(offsets[end_session]), end_session - start_session))
+    return shards + _plan_store_shards(session_file, archive.high_water_mark, num_shards)
+
+
+# 在子进程中打开分片，返回可迭代的 (lats, lons, weights) 块与读取器 (会话存储分片) 或 None
+def _open_shard_chunks(shard):
+    if shard[0] == 'archive':
+        _, archive_dir, part_index, start, end, _ = shard
+        archive = PointArchive(archive_dir)
+        part = archive.parts[part_index]
+        lats = archive.load_column(part, 'lat')[start:end]
+        lons = archive.load_column(part, 'lon')[start:end]
+        weights = archive.load_column(part, 'weight')[start:end] if part['weighted'] else None
+        chunks = [(lats[i:i + POINT_CHUNK_SIZE], lons[i:i + POINT_CHUNK_SIZE],
+                   weights[i:i + POINT_CHUNK_SIZE] if weights is not None else None)
+                  for i in range(0, end - start, POINT_CHUNK_SIZE)]
+        return chunks, None
+    _, session_file, since, until = shard
+    reader = SessionPointChunkReader(open_session_store(session_file), since=since, with_weights=True, until=until)
+    return reader, reader
+
+
+def _shard_sessions(shard, reader):
+    return shard[5] if shard[0] == 'archive' else reader.sessions_read
+
+
+# 子进程任务：计算一个分片的原始兴趣分数，返回 (分数字典, 有效点数, 会话数, 高水位标记)
+def _score_shard(shard, attraction_coords_map, engine):
+    chunks, reader = _open_shard_chunks(shard)
+    scores, points = compute_raw_interest_scores(chunks, attraction_coords_map, engine=engine)
+    return scores, points, _shard_sessions(shard, reader), reader.high_water_mark if reader else None
+
+
+# 子进程任务：对一个分片分箱，返回 (密度网格, 会话数)
+def _bin_shard(shard, cell_size_m):
+    chunks, reader = _open_shard_chunks(shard)
+    density_grid = DensityGrid(cell_size_m=cell_size_m)
+    for user_lats, user_lons, weights in chunks:
+        density_grid.add(user_lats, user_lons, weights)
+    return density_grid, _shard_sessions(shard, reader)
+
+
+# 分片并行计分并归约：各分片的分数都是整数求和，按分片顺序相加后与串行结果逐位一致。
+# 返回值与串行路径相同: (分数字典, 有效点数, 会话数, 高水位标记)
+def scan_interest_scores_parallel(executor, session_file, attraction_coords_map, since=None,
+                                  archive_dir=DEFAULT_POINT_ARCHIVE_PATH, engine='indexed', workers=os.cpu_count() or 1):
+    shards = plan_point_shards(session_file, since, archive_dir, workers)
+    futures = [executor.submit(_score_shard, shard, attraction_coords_map, engine) for shard in shards]
+    score_sums = {name: 0 for name in attraction_coords_map}
+    total_points = 0
+    sessions_read = 0
+    high_water_mark = since
+    for future in futures:
+        scores, points, sessions, shard_high_water_mark = future.result()
+        for name, score in scores.items():
+            score_sums[name] += int(score)
+        total_points += points
+        sessions_read += sessions
+        if shard_high_water_mark is not None:
+            high_water_mark = shard_high_water_mark
+    print(f"兴趣分数按 {len(shards)} 个分片并行计算完成。")
+    if total_points == 0:
+        return {}, 0, sessions_read, high_water_mark
+    return {name: float(score) for name, score in score_sums.items()}, total_points, sessions_read, high_water_mark
+
+
+# 分片并行分箱并合并密度网格 (格子权重为整数计数，合并顺序不影响结果)
+def scan_density_grid_parallel(executor, session_file, cell_size_m, archive_dir=DEFAULT_POINT_ARCHIVE_PATH,
+                               workers=os.cpu_count() or 1):
+    shards = plan_point_shards(session_file, None, archive_dir, workers)
+    futures = [executor.submit(_bin_shard, shard, cell_size_m) for shard in shards]
+    density_grid = DensityGrid(cell_size_m=cell_size_m)
+    sessions_read = 0
+    for future in futures:
+        shard_grid, sessions = future.result()
+        density_grid.merge(shard_grid)
+        sessions_read += sessions
+    print(f"密度网格按 {len(shards)} 个分片并行聚合完成。")
+    return density_grid, sessions_read
+
+
+# 景点兴趣热力图流程：计算实际兴趣分数 → SVM 训练与预测 → 生成热力图；返回 (实际分数, 预测分数)
+def run_interest_heatmap_pipeline(incremental=False, executor=None, workers=1):
     print("\n--- 开始生成景点兴趣热力图 (基于SVM预测) ---")
-    actual_interest_scores = calculate_actual_interest_scores()
+    actual_interest_scores = calculate_actual_interest_scores(incremental=incremental, executor=executor,
+                                                              workers=workers)
+    predicted_interest_scores = {}
 
     if not actual_interest_scores:
         print("没有计算出实际兴趣分数，景点兴趣热力图将为空。")
@@ -349,17 +870,72 @@ def analyze_and_generate_heatmaps():
         else:
             generate_attraction_interest_heatmap_html(predicted_interest_scores, 'attraction_interest_heatmap.html')
     print("--- 景点兴趣热力图生成流程结束 ---")
+    return actual_interest_scores, predicted_interest_scores
 
-    # 2. 生成用户活动密度热力图 (基于原始用户轨迹)
+
+# 用户活动密度热力图流程，返回热力图数据 (归一化后的非空格子)
+def run_density_heatmap_pipeline(executor=None, workers=1):
     print("\n--- 开始生成用户活动密度热力图 (基于原始用户轨迹) ---")
-    generate_user_activity_density_heatmap_html(output_filename='user_activity_density_heatmap.html')
+    heatmap_data = generate_user_activity_density_heatmap_html(output_filename='user_activity_density_heatmap.html',
+                                                               executor=executor, workers=workers)
     print("--- 用户活动密度热力图生成流程结束 ---")
+    return heatmap_data
+
+
+# 主函数，用于分析会话数据并生成两种热力图
+# workers > 1 时使用多进程分片执行：两条热力图流程在两个线程中同时进行，各自把分片扫描提交到共享的进程池
+def analyze_and_generate_heatmaps(incremental=False, build_tiles=False, compact=False, workers=1):
+    print("--- 主函数开始 ---")
+
+    # 0. 把会话存储中的新会话压实到列式点归档 (可选)，之后的各步扫描归档而不是逐条解析 JSON
+    if compact:
+        print("\n--- 开始压实列式点归档 ---")
+        try:
+            compact_session_store()
+        except ValueError as e:
+            # 归档目录不可用时仍可直接扫描会话存储
+            print(f"警告: 列式点归档压实失败，将直接读取会话存储: {e}")
+        print("--- 列式点归档压实结束 ---")
+
+    # 1. 景点兴趣热力图 (基于SVM预测)  2. 用户活动密度热力图 (基于原始用户轨迹)
+    if workers > 1:
+        print(f"\n使用 {workers} 个进程分片执行，两种热力图同时生成。")
+        with ProcessPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=2) as pipelines:
+            interest_future = pipelines.submit(run_interest_heatmap_pipeline, incremental, executor, workers)
+            density_future = pipelines.submit(run_density_heatmap_pipeline, executor, workers)
+            actual_interest_scores, predicted_interest_scores = interest_future.result()
+            density_heatmap_data = density_future.result()
+    else:
+        actual_interest_scores, predicted_interest_scores = run_interest_heatmap_pipeline(incremental)
+        density_heatmap_data = run_density_heatmap_pipeline()
+
+    # 3. 生成多缩放级别的密度瓦片 (可选)
+    if build_tiles:
+        print("\n--- 开始生成用户活动密度瓦片 ---")
+        generate_density_tile_pyramid()
+        print("--- 用户活动密度瓦片生成流程结束 ---")
 
     print("\n--- 主函数结束 ---")
+    return {
+        'actual_interest_scores': actual_interest_scores,
+        'predicted_interest_scores': predicted_interest_scores,
+        'density_heatmap_data': density_heatmap_data,
+    }
 
 
 # 如果需要，可以在这里调用主函数来测试或生成HTML
 if __name__ == '__main__':
-    analyze_and_generate_heatmaps()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='分析光标会话数据并生成景点兴趣热力图与用户活动密度热力图')
+    parser.add_argument('--incremental', action='store_true', help='从检查点继续，只处理新增会话')
+    parser.add_argument('--tiles', action='store_true', help='同时生成 10-18 级的密度瓦片金字塔')
+    parser.add_argument('--compact', action='store_true', help='分析前先把新会话压实到列式点归档 (point_archive/)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行进程数 (默认 1 为串行；0 表示使用全部 CPU 核心)')
+    args = parser.parse_args()
+
+    analyze_and_generate_heatmaps(incremental=args.incremental, build_tiles=args.tiles, compact=args.compact,
+                                  workers=args.workers or os.cpu_count() or 1)
     print(
         "\n两种热力图已生成：'attraction_interest_heatmap.html' (景点兴趣) 和 'user_activity_density_heatmap.html' (用户活动密度)。")
@@ -0,0 +1,415 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 会话存储的默认位置：一个存放分段 JSON Lines 文件的目录
+DEFAULT_SESSION_STORE_PATH = 'user_sessions_store'
+# 旧版存储：整个文件是一个 JSON 数组，每次写入都需要整体重写
+LEGACY_SESSION_FILE = 'user_sessions_data.json'
+
+# 分段轮转阈值：单个分段超过 64MB 或打开超过 1 小时后切换到新分段
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_MAX_AGE_S = 3600
+# 并行读取时每个区间的最小字节数，避免把少量数据切成过多的小分片
+MIN_SPLIT_RANGE_BYTES = 1024 * 1024
+
+
+def _encode_session(session):
+    # 每个会话占一行，使用紧凑分隔符，避免 indent 带来的体积膨胀
+    return json.dumps(session, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+# 分段 JSON Lines 会话存储：追加写入为 O(1)，分段按大小/时间轮转
+class JsonLinesSessionStore:
+    SEGMENT_PREFIX = 'segment_'
+    SEGMENT_SUFFIX = '.jsonl'
+
+    def __init__(self, directory=DEFAULT_SESSION_STORE_PATH, segment_max_bytes=DEFAULT_SEGMENT_MAX_BYTES,
+                 segment_max_age_s=DEFAULT_SEGMENT_MAX_AGE_S):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age_s = segment_max_age_s
+        self._lock = threading.Lock()
+        self._active_file = None
+        self._active_index = None
+        self._active_opened_at = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f'{self.SEGMENT_PREFIX}{index:06d}{self.SEGMENT_SUFFIX}')
+
+    def list_segments(self):
+        indices = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith(self.SEGMENT_PREFIX) and filename.endswith(self.SEGMENT_SUFFIX):
+                try:
+                    indices.append(int(filename[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(indices)
+
+    # 打开（或续写）当前活动分段，必要时先轮转
+    def _ensure_active_segment(self):
+        if self._active_file is not None:
+            too_big = self._active_file.tell() >= self.segment_max_bytes
+            too_old = time.time() - self._active_opened_at >= self.segment_max_age_s
+            if too_big or too_old:
+                self._rotate_locked()
+
+        if self._active_file is None:
+            segments = self.list_segments()
+            index = segments[-1] if segments else 0
+            path = self._segment_path(index)
+            if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+                index += 1
+                path = self._segment_path(index)
+            self._active_file = open(path, 'ab')
+            self._active_index = index
+            self._active_opened_at = time.time()
+        return self._active_file
+
+    def _rotate_locked(self):
+        if self._active_file is None:
+            return
+        self._active_file.close()
+        next_index = self._active_index + 1
+        self._active_file = open(self._segment_path(next_index), 'ab')
+        self._active_index = next_index
+        self._active_opened_at = time.time()
+        print(f"会话存储已轮转到新分段: {self._segment_path(next_index)}")
+
+    # 手动轮转当前分段（例如每日定时任务）
+    def rotate(self):
+        with self._lock:
+            self._rotate_locked()
+
+    def append(self, session, fsync=False):
+        self.append_many([session], fsync=fsync)
+
+    # 批量追加：一次 write 调用写入多行，只在需要时 fsync
+    def append_many(self, sessions, fsync=False):
+        if not sessions:
+            return
+        payload = ''.join(_encode_session(session) for session in sessions).encode('utf-8')
+        with self._lock:
+            f = self._ensure_active_segment()
+            f.write(payload)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+
+    def sync(self):
+        with self._lock:
+            if self._active_file is not None:
+                self._active_file.flush()
+                os.fsync(self._active_file.fileno())
+
+    # 按写入顺序遍历会话，同时返回每条记录之后的位置 [分段号, 字节偏移]
+    # 位置可以作为高水位标记保存，下次从该位置继续读取；给出 until 时只读到该位置为止 (不含之后的记录)
+    def iter_sessions_with_position(self, since=None, until=None):
+        start_segment, start_offset = since if since else (None, 0)
+        for index in self.list_segments():
+            if start_segment is not None and index < start_segment:
+                continue
+            if until is not None and index > until[0]:
+                return
+            offset = start_offset if index == start_segment else 0
+            with open(self._segment_path(index), 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if until is not None and index == until[0] and offset >= until[1]:
+                        return
+                    if not line.endswith(b'\n'):
+                        # 写入方尚未写完的最后一行，留到下次读取
+                        break
+                    offset += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        session = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"警告: 分段 {index} 偏移 {offset - len(line)} 处的记录无法解析，已跳过。")
+                        continue
+                    yield [index, offset], session
+
+    def iter_sessions(self, since=None):
+        for _, session in self.iter_sessions_with_position(since):
+            yield session
+
+    # 把 since 之后的数据按字节数切分为至多 num_ranges 个区间，供多个进程并行读取。
+    # 返回各区间的起点 (第一个为 since)，每个区间读到下一个起点为止 (作为 until)，最后一个读到末尾；
+    # 切点对齐到行首，单条会话不会被拆开
+    def split_positions(self, since=None, num_ranges=1, min_range_bytes=MIN_SPLIT_RANGE_BYTES):
+        spans = []
+        for index in self.list_segments():
+            if since is not None and index < since[0]:
+                continue
+            start = since[1] if since is not None and index == since[0] else 0
+            spans.append((index, start, os.path.getsize(self._segment_path(index))))
+        total_bytes = sum(end - start for _, start, end in spans)
+        if num_ranges <= 1 or total_bytes <= min_range_bytes:
+            return [since]
+        target = max(min_range_bytes, total_bytes // num_ranges)
+        positions = [since]
+        carried = 0  # 上一个切点之后已累计的字节数
+        for index, start, end in spans:
+            if carried >= target and start < end:
+                positions.append([index, start])
+                carried = 0
+            offset = start
+            with open(self._segment_path(index), 'rb') as f:
+                while offset + target - carried < end:
+                    # 从目标位置读完所在的行，下一行的行首即为切点
+                    f.seek(offset + target - carried)
+                    if not f.readline().endswith(b'\n') or f.tell() >= end:
+                        break
+                    offset = f.tell()
+                    positions.append([index, offset])
+                    carried = 0
+            carried += end - offset
+        return positions
+
+    def load_sessions(self):
+        return list(self.iter_sessions())
+
+    def high_water_mark(self):
+        segments = self.list_segments()
+        if not segments:
+            return None
+        return [segments[-1], os.path.getsize(self._segment_path(segments[-1]))]
+
+    def is_empty(self):
+        return all(os.path.getsize(self._segment_path(index)) == 0 for index in self.list_segments())
+
+    def close(self):
+        with self._lock:
+            if self._active_file is not None:
+                self._active_file.close()
+                self._active_file = None
+
+
+# SQLite (WAL 模式) 会话存储：单条 INSERT 即可完成追加，读取者不会阻塞写入者
+class SqliteSessionStore:
+    def __init__(self, db_path, synchronous='NORMAL'):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'PRAGMA synchronous={synchronous}')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, created_at REAL, payload TEXT NOT NULL)'
+        )
+        self._conn.commit()
+
+    def append(self, session, fsync=False):
+        self.append_many([session], fsync=fsync)
+
+    def append_many(self, sessions, fsync=False):
+        if not sessions:
+            return
+        now = time.time()
+        rows = [(str(session.get('session_id')), now, json.dumps(session, ensure_ascii=False, separators=(',', ':')))
+                for session in sessions]
+        with self._lock:
+            self._conn.executemany('INSERT INTO sessions (session_id, created_at, payload) VALUES (?, ?, ?)', rows)
+            self._conn.commit()
+            if fsync:
+                self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def sync(self):
+        with self._lock:
+            self._conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    # SQLite 没有分段文件，“轮转”对应一次 WAL 检查点，防止 WAL 文件无限增长
+    def rotate(self):
+        with self._lock:
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    # 位置为 rowid，读取使用独立连接，不占用写入锁；给出 until 时只读到该 rowid 为止
+    def iter_sessions_with_position(self, since=None, until=None):
+        reader = sqlite3.connect(self.db_path)
+        try:
+            query, params = 'SELECT id, payload FROM sessions WHERE id > ?', [since or 0]
+            if until is not None:
+                query, params = query + ' AND id <= ?', params + [until]
+            cursor = reader.execute(query + ' ORDER BY id', params)
+            for row_id, payload in cursor:
+                yield row_id, json.loads(payload)
+        finally:
+            reader.close()
+
+    def iter_sessions(self, since=None):
+        for _, session in self.iter_sessions_with_position(since):
+            yield session
+
+    # 按 rowid 把 since 之后的记录均分为至多 num_ranges 个区间，返回值含义同 JsonLinesSessionStore.split_positions
+    def split_positions(self, since=None, num_ranges=1):
+        high_water_mark = self.high_water_mark()
+        if num_ranges <= 1 or high_water_mark is None or high_water_mark <= (since or 0):
+            return [since]
+        step = max(1, -(-(high_water_mark - (since or 0)) // num_ranges))
+        return [since] + list(range((since or 0) + step, high_water_mark, step))
+
+    def load_sessions(self):
+        return list(self.iter_sessions())
+
+    def high_water_mark(self):
+        with self._lock:
+            row = self._conn.execute('SELECT MAX(id) FROM sessions').fetchone()
+        return row[0]
+
+    def is_empty(self):
+        return self.high_water_mark() is None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# 增量解析顶层 JSON 数组，逐个产出数组元素，内存占用只与单个元素大小相关。
+# 元素之间必须恰好有一个逗号：缺少逗号、多余的逗号 (包括开头和结尾) 都抛出 JSONDecodeError
+def iter_json_array(f, chunk_size=1 << 20):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    index = 0
+    eof = False
+
+    def read_more():
+        nonlocal buffer, index, eof
+        # 单个元素大于当前缓冲区时按缓冲区大小倍增读取量，避免反复重新解析
+        chunk = f.read(max(chunk_size, len(buffer) - index))
+        buffer = buffer[index:] + chunk
+        index = 0
+        eof = not chunk
+
+    # 跳过空白，返回下一个字符 (到达文件末尾时返回 None)
+    def next_char():
+        nonlocal index
+        while True:
+            while index < len(buffer) and buffer[index] in ' \t\r\n':
+                index += 1
+            if index < len(buffer):
+                return buffer[index]
+            if eof:
+                return None
+            read_more()
+
+    char = next_char()
+    if char is None:
+        return
+    if char != '[':
+        raise json.JSONDecodeError("顶层结构不是 JSON 数组", buffer, index)
+    index += 1
+    if next_char() == ']':
+        return
+
+    while True:
+        char = next_char()
+        if char is None:
+            raise json.JSONDecodeError("数组缺少结尾的 ']'", buffer, index)
+        if char in ',]':
+            raise json.JSONDecodeError("数组中有多余的逗号", buffer, index)
+        try:
+            item, end = decoder.raw_decode(buffer, index)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            read_more()
+            continue
+        if end == len(buffer) and not eof:
+            # 元素恰好结束在缓冲区末尾时可能被截断 (例如数字)，读取更多数据后重新解析
+            read_more()
+            continue
+        yield item
+        index = end
+
+        char = next_char()
+        if char == ']':
+            return
+        if char is None:
+            raise json.JSONDecodeError("数组缺少结尾的 ']'", buffer, index)
+        if char != ',':
+            raise json.JSONDecodeError("数组元素之间缺少逗号", buffer, index)
+        index += 1
+
+
+# 旧版单文件 JSON 数组的只读适配器，便于分析脚本读取历史数据和迁移 (没有写入方法)
+class LegacyJsonSessionStore:
+    def __init__(self, file_path=LEGACY_SESSION_FILE):
+        self.file_path = file_path
+
+    # 位置为数组下标；文件按块增量解析，不会一次性把整个数组载入内存
+    def iter_sessions_with_position(self, since=None, until=None):
+        if self.is_empty():
+            return
+        start = since or 0
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            try:
+                for index, session in enumerate(iter_json_array(f)):
+                    if until is not None and index >= until:
+                        return
+                    if index >= start:
+                        yield index + 1, session
+            except json.JSONDecodeError as e:
+                print(f"错误: 解析会话文件 '{self.file_path}' 失败，请检查JSON格式: {e}")
+
+    def iter_sessions(self, since=None):
+        for _, session in self.iter_sessions_with_position(since):
+            yield session
+
+    # 整个文件只能从头顺序解析，切分后每个进程仍要解析前面的全部内容，因此不切分
+    def split_positions(self, since=None, num_ranges=1):
+        return [since]
+
+    def load_sessions(self):
+        return list(self.iter_sessions())
+
+    def high_water_mark(self):
+        return None
+
+    def is_empty(self):
+        return not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0
+
+    def close(self):
+        pass
+
+
+# 根据路径选择存储实现：*.json 为旧版文件，*.db/*.sqlite/*.sqlite3 为 SQLite，其余视为 JSONL 分段目录。
+# 需要写入时传 writable=True：旧版 JSON 文件只能读取，此时直接拒绝
+def open_session_store(path=DEFAULT_SESSION_STORE_PATH, writable=False, **kwargs):
+    lower_path = path.lower()
+    if lower_path.endswith('.json'):
+        if writable:
+            raise ValueError(f"旧版 JSON 会话文件 '{path}' 只读，不能作为写入目标；"
+                             f"请使用 JSON Lines 目录或 *.sqlite3 路径 (可用 python session_store.py migrate 迁移)")
+        return LegacyJsonSessionStore(path)
+    if lower_path.endswith(('.db', '.sqlite', '.sqlite3')):
+        return SqliteSessionStore(path, **kwargs)
+    return JsonLinesSessionStore(path, **kwargs)
+
+
+# 把旧版 user_sessions_data.json 中的会话一次性导入到新存储
+def migrate_legacy_sessions(legacy_file=LEGACY_SESSION_FILE, store=None):
+    store = store or open_session_store(writable=True)
+    legacy_store = LegacyJsonSessionStore(legacy_file)
+    sessions = legacy_store.load_sessions()
+    if not sessions:
+        print(f"旧版会话文件 '{legacy_file}' 中没有可迁移的会话。")
+        return 0
+    store.append_many(sessions, fsync=True)
+    print(f"已从 '{legacy_file}' 迁移 {len(sessions)} 个会话。")
+    return len(sessions)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) >= 2 and sys.argv[1] == 'migrate':
+        source = sys.argv[2] if len(sys.argv) >= 3 else LEGACY_SESSION_FILE
+        target = sys.argv[3] if len(sys.argv) >= 4 else DEFAULT_SESSION_STORE_PATH
+        migrate_legacy_sessions(source, open_session_store(target, writable=True))
+    else:
+        print("用法: python session_store.py migrate [旧版JSON文件] [目标存储路径]")
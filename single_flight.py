@@ -0,0 +1,73 @@
+import threading
+
+
+# 同一个键只有一次正在进行的上游调用，结果 (或异常) 由等待它的所有请求共享
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+# 单飞 (single-flight) 请求合并：同一时刻键相同的请求只执行一次上游调用，
+# 第一个到达的请求 (leader) 负责执行，其余请求 (follower) 挂在它上面等待结果；
+# 调用结束后键立即移除，之后的请求会重新执行 (结果的长期复用交给 ResponseCache)
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'calls': 0, 'leaders': 0, 'shared': 0, 'errors': 0}
+
+    # 登记一次调用，返回 (flight, 是否为 leader)；leader 必须在结束后调用 finish()
+    def begin(self, key):
+        with self._lock:
+            self._stats['calls'] += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.waiters += 1
+                self._stats['shared'] += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self._stats['leaders'] += 1
+            return flight, True
+
+    def finish(self, key, flight, result=None, error=None):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is not None:
+                self._stats['errors'] += 1
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    # follower 等待 leader 的结果；leader 失败时抛出同一个异常
+    def wait(self, flight, timeout_s=None):
+        if not flight.done.wait(timeout_s):
+            raise TimeoutError("等待相同请求的结果超时")
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    # 执行 fn() 并返回 (结果, 是否共享了其他请求的调用)
+    def do(self, key, fn, timeout_s=None):
+        flight, is_leader = self.begin(key)
+        if not is_leader:
+            return self.wait(flight, timeout_s), True
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(key, flight, error=e)
+            raise
+        self.finish(key, flight, result=result)
+        return result, False
+
+    # collapse_ratio: 被合并掉的请求占全部请求的比例，即节省的上游调用比例
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['in_flight_keys'] = len(self._flights)
+        snapshot['collapse_ratio'] = snapshot['shared'] / snapshot['calls'] if snapshot['calls'] else 0.0
+        return snapshot
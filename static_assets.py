@@ -0,0 +1,60 @@
+import gzip
+import hashlib
+import os
+
+try:
+    import brotli  # 可选依赖：安装后额外生成 .br 预压缩文件
+except ImportError:
+    brotli = None
+
+DEFAULT_ASSET_DIR = 'assets'
+# 小于该大小的文件压缩收益很小，不生成预压缩版本
+MIN_PRECOMPRESS_BYTES = 1024
+
+
+def _write_bytes_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# 写入以内容哈希命名的静态资源 (name.<哈希>.ext)，并按需生成 .gz / .br 预压缩版本；
+# 文件名随内容变化，浏览器可以永久缓存。返回相对于页面的 URL 路径
+def write_hashed_asset(content, name, ext, output_dir=DEFAULT_ASSET_DIR, precompress=True):
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    os.makedirs(output_dir, exist_ok=True)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    filename = f'{name}.{digest}.{ext}'
+    path = os.path.join(output_dir, filename)
+    if not os.path.exists(path):
+        _write_bytes_atomic(path, content)
+    if precompress and len(content) >= MIN_PRECOMPRESS_BYTES:
+        if not os.path.exists(path + '.gz'):
+            _write_bytes_atomic(path + '.gz', gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None and not os.path.exists(path + '.br'):
+            _write_bytes_atomic(path + '.br', brotli.compress(content, quality=11))
+    return f'{output_dir}/{filename}'
+
+
+# 把现有的静态文件 (如 map_logic.js) 复制为哈希命名的版本
+def hash_static_file(source_path, output_dir=DEFAULT_ASSET_DIR, precompress=True):
+    with open(source_path, 'rb') as f:
+        content = f.read()
+    name, ext = os.path.splitext(os.path.basename(source_path))
+    return write_hashed_asset(content, name, ext.lstrip('.'), output_dir, precompress)
+
+
+# 删除本次构建未引用的旧哈希资源 (包括其预压缩版本)
+def prune_assets(keep_urls, output_dir=DEFAULT_ASSET_DIR):
+    keep = {os.path.basename(url) for url in keep_urls}
+    removed = 0
+    for filename in os.listdir(output_dir):
+        base, suffix = os.path.splitext(filename)
+        if suffix not in ('.gz', '.br'):
+            base = filename
+        if base not in keep:
+            os.remove(os.path.join(output_dir, filename))
+            removed += 1
+    return removed
@@ -0,0 +1,247 @@
+import argparse
+import email.utils
+import gzip
+import http.server
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import partial
+
+DEFAULT_PORT = 8000
+# 文件名中带 12 位内容哈希的资源 (static_assets.write_hashed_asset 生成) 内容永不变化，可永久缓存
+HASHED_ASSET_PATTERN = re.compile(r'\.[0-9a-f]{12}\.[A-Za-z0-9]+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 页面本身每次都要向服务器确认 (配合 ETag，未变化时只返回 304)
+HTML_CACHE_CONTROL = 'no-cache'
+DEFAULT_CACHE_CONTROL = 'public, max-age=3600'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MIN_COMPRESS_BYTES = 1024
+# 没有预压缩文件时，动态 gzip 的结果缓存在内存中 (按路径、修改时间、大小区分)
+GZIP_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# 只对外提供页面需要的文件：根目录下的页面与脚本，以及下列目录中的静态资源；
+# 其余文件 (源码、.git 等点文件、会话存储、AI 缓存数据库、模型、根目录下的 JSON 数据) 一律 404
+PUBLIC_TOP_LEVEL_EXTENSIONS = ('.html', '.htm', '.js', '.css', '.ico')
+PUBLIC_DIRECTORIES = ('assets', 'boundary_lod', 'icon', 'pic')
+PUBLIC_ASSET_EXTENSIONS = ('.html', '.htm', '.js', '.css', '.json', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp',
+                           '.ico', '.woff', '.woff2')
+
+
+class _GzipCache:
+    def __init__(self, max_bytes=GZIP_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def get(self, path, stat):
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        with open(path, 'rb') as f:
+            data = gzip.compress(f.read(), compresslevel=6, mtime=0)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._bytes += len(data)
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return data
+
+
+_gzip_cache = _GzipCache()
+
+
+# 解析单个字节范围 (bytes=a-b / bytes=a- / bytes=-n)，返回 (start, end) 闭区间；
+# 不支持的格式返回 None (按完整内容响应)，范围无法满足时返回 'unsatisfiable'
+def parse_range_header(value, size):
+    match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', value or '')
+    if not match or (match.group(1) == '' and match.group(2) == ''):
+        return None
+    start, end = match.group(1), match.group(2)
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        return 'unsatisfiable'
+    return start, min(end, size - 1)
+
+
+# 静态文件处理器：在 SimpleHTTPRequestHandler 基础上增加
+# 预压缩文件 (.br / .gz) 与动态 gzip、ETag / If-None-Match、按资源类型的缓存头、单段 Range 请求
+class StaticFileHandler(http.server.SimpleHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _cache_control(self, path):
+        if HASHED_ASSET_PATTERN.search(os.path.basename(path)):
+            return IMMUTABLE_CACHE_CONTROL
+        if path.endswith(('.html', '.htm')):
+            return HTML_CACHE_CONTROL
+        return DEFAULT_CACHE_CONTROL
+
+    # 判断解析后的文件路径是否允许访问 (路径必须位于服务目录内，且符合上面的白名单)
+    def _is_public(self, path):
+        root = os.path.realpath(self.directory)
+        real_path = os.path.realpath(path)
+        if os.path.commonpath([root, real_path]) != root or real_path == root:
+            return False
+        parts = os.path.relpath(real_path, root).split(os.sep)
+        if any(part.startswith('.') for part in parts):
+            return False
+        extension = os.path.splitext(parts[-1])[1].lower()
+        if len(parts) == 1:
+            return extension in PUBLIC_TOP_LEVEL_EXTENSIONS
+        return parts[0] in PUBLIC_DIRECTORIES and extension in PUBLIC_ASSET_EXTENSIONS
+
+    def _accepted_encodings(self):
+        header = self.headers.get('Accept-Encoding', '')
+        return {part.split(';')[0].strip().lower() for part in header.split(',') if part.strip()}
+
+    # 选择响应体：返回 (文件路径或 None, 内存数据或 None, Content-Encoding 或 None)
+    def _select_variant(self, path, stat, content_type):
+        if not content_type.startswith(COMPRESSIBLE_TYPES) or stat.st_size < MIN_COMPRESS_BYTES:
+            return path, None, None
+        accepted = self._accepted_encodings()
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if encoding in accepted:
+                try:
+                    variant_stat = os.stat(path + suffix)
+                except OSError:
+                    continue
+                if variant_stat.st_mtime_ns >= stat.st_mtime_ns:
+                    return path + suffix, None, encoding
+        if 'gzip' in accepted:
+            return None, _gzip_cache.get(path, stat), 'gzip'
+        return path, None, None
+
+    def _serve(self, send_body):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            if not self._is_public(os.path.join(path, 'index.html')):
+                self.send_error(404, "File not found")
+                return
+            if not self.path.split('?', 1)[0].endswith('/'):
+                # 与 SimpleHTTPRequestHandler 一致：目录地址补上结尾的斜杠，保证页面中的相对路径正确
+                self.send_response(301)
+                self.send_header('Location', self.path.split('?', 1)[0] + '/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            index = os.path.join(path, 'index.html')
+            if not os.path.exists(index):
+                self.send_error(404, "File not found")
+                return
+            path = index
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        if not os.path.isfile(path) or not self._is_public(path):
+            self.send_error(404, "File not found")
+            return
+
+        content_type = self.guess_type(path)
+        file_path, data, encoding = self._select_variant(path, stat, content_type)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}{"-" + encoding if encoding else ""}"'
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', self._cache_control(path))
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        body_size = len(data) if data is not None else os.path.getsize(file_path)
+        start, end = 0, body_size - 1
+        status = 200
+        # Range 只对未压缩的原始内容生效 (主要用于图片等大文件的断点续传和分段加载)
+        if encoding is None and 'Range' in self.headers:
+            if_range = self.headers.get('If-Range')
+            if if_range is None or if_range.strip() == etag:
+                byte_range = parse_range_header(self.headers['Range'], body_size)
+                if byte_range == 'unsatisfiable':
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{body_size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if byte_range is not None:
+                    start, end = byte_range
+                    status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(max(0, end - start + 1)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', email.utils.formatdate(stat.st_mtime, usegmt=True))
+        self.send_header('Cache-Control', self._cache_control(path))
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Accept-Ranges', 'bytes')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{body_size}')
+        self.end_headers()
+        if not send_body or end < start:
+            return
+
+        if data is not None:
+            self.wfile.write(data[start:end + 1])
+            return
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+
+# 多线程静态文件服务器：每个连接一个线程，多位访客同时加载页面、GeoJSON 和图片时互不排队
+class StaticHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的监听队列只有 5，并发连接稍多就会被丢弃并等待 TCP 重传 (约 1 秒)
+    request_queue_size = 128
+
+
+def create_static_server(port=DEFAULT_PORT, directory='.', host=''):
+    handler = partial(StaticFileHandler, directory=directory)
+    return StaticHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="带压缩、缓存头和 Range 支持的多线程静态文件服务器")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--directory', default='.')
+    args = parser.parse_args()
+
+    httpd = create_static_server(args.port, args.directory)
+    print(f"静态文件服务器已在 http://localhost:{args.port} 启动 (目录: {os.path.abspath(args.directory)})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务器已关闭。")
+    finally:
+        httpd.server_close()
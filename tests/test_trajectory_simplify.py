@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from benchmark_trajectory_simplification import (generate_cursor_sessions, max_kernel_deviation,
+                                                 proximity_error_bound, scoring_displacement_m)
+from session_analyzer import (compute_raw_interest_scores, get_all_locations_data_from_source,
+                              haversine_distance_matrix, proximity_scores_from_distances)
+from trajectory_simplify import MAX_POINT_WEIGHT, point_weight, simplify_location_history, strip_client_weights
+
+
+def _columns(points):
+    lats = np.array([p['latitude'] for p in points], dtype=np.float64)
+    lons = np.array([p['longitude'] for p in points], dtype=np.float64)
+    weights = np.array([point_weight(p.get('weight', 1)) for p in points], dtype=np.int64)
+    return lats, lons, weights
+
+
+@pytest.mark.parametrize('seed', [1, 42])
+def test_every_raw_sample_stays_within_the_displacement_bound(seed):
+    displacement_m = scoring_displacement_m()
+    for session in generate_cursor_sessions(3, points_per_session=1500, seed=seed):
+        raw = session['location_history']
+        simplified, stats = simplify_location_history(raw)
+        assert stats['raw_points'] == len(raw)
+        raw_lats, raw_lons, _ = _columns(raw)
+        lats, lons, weights = _columns(simplified)
+        assert weights.sum() == len(raw)
+        # 每个原始采样附近 (不超过最大位移) 必须有保留点
+        nearest = haversine_distance_matrix(raw_lats, raw_lons, lats, lons).min(axis=1)
+        assert nearest.max() <= displacement_m
+
+
+@pytest.mark.parametrize('num_sessions,seed', [(5, 42), (10, 7), (20, 42)])
+def test_score_error_stays_within_the_derived_bound(num_sessions, seed):
+    sessions = generate_cursor_sessions(num_sessions, points_per_session=1000, seed=seed)
+    locations = get_all_locations_data_from_source()
+    coords_map = {loc['name']: loc['location'] for loc in locations}
+    coords = np.array([loc['location'] for loc in locations], dtype=np.float64)
+
+    raw_points = [p for s in sessions for p in s['location_history']]
+    stored_points = [p for s in sessions for p in simplify_location_history(s['location_history'])[0]]
+    raw_lats, raw_lons, _ = _columns(raw_points)
+    raw_scores, raw_total = compute_raw_interest_scores([(raw_lats, raw_lons)], coords_map)
+    simplified_scores, simplified_total = compute_raw_interest_scores([_columns(stored_points)], coords_map)
+    assert simplified_total == raw_total
+
+    bound = proximity_error_bound(raw_lats, raw_lons, coords[:, 0], coords[:, 1], scoring_displacement_m())
+    for index, loc in enumerate(locations):
+        assert abs(simplified_scores[loc['name']] - raw_scores[loc['name']]) <= bound[index]
+
+
+def test_kernel_deviation_matches_dense_sampling():
+    distances = np.array([0.0, 100.0, 190.0, 200.5, 590.0, 1000.0, 1490.0, 5000.0])
+    deviation = max_kernel_deviation(distances, 15.0)
+    for distance, dev in zip(distances, deviation):
+        probes = np.linspace(max(0.0, distance - 15.0), distance + 15.0, 3001)
+        expected = np.abs(proximity_scores_from_distances(probes) - proximity_scores_from_distances(distance)).max()
+        assert dev == expected
+
+
+def test_client_weights_are_stripped_and_stored_weights_validated():
+    history = [{'latitude': 28.2, 'longitude': 112.9, 'weight': 10 ** 12, 'dwell_ms': 5}, 'bad']
+    strip_client_weights(history)
+    assert history[0] == {'latitude': 28.2, 'longitude': 112.9}
+    assert [point_weight(v) for v in (3, 0, -1, 'x', True, 1.5, MAX_POINT_WEIGHT + 1)] == [3, 1, 1, 1, 1, 1, 1]
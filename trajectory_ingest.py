@@ -0,0 +1,105 @@
+import math
+import time
+
+# 批量上传的坐标缩放系数：经纬度乘以 1e6 后取整 (约 0.1 米精度)，便于差分编码成小整数
+COORD_SCALE = 1000000
+# 单个批次允许的最大点数，防止异常客户端一次性发送过大请求
+# (cursor_proximity_tracker.js 每个请求最多发送 MAX_POINTS_PER_REQUEST = 5000 个点，重试缓冲区上限 10000)
+MAX_POINTS_PER_BATCH = 20000
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+# 取出一个数值数组：缺失时为空数组，不是数组或含有非数值元素时抛出 ValueError
+def _number_array(payload, field):
+    values = payload.get(field)
+    if values is None:
+        return []
+    if not isinstance(values, list):
+        raise ValueError(f"{field} 应为数组")
+    if not all(_is_number(value) for value in values):
+        raise ValueError(f"{field} 中含有非数值元素")
+    return values
+
+
+# 校验 /api/save_session_data 上传的整条会话：location_history 中每个点都必须是带有效经纬度的对象，
+# 否则抛出 ValueError (不再静默丢弃缺少坐标的点)
+def validate_session_data(session_data):
+    if not isinstance(session_data, dict):
+        raise ValueError("会话数据格式错误，应为 JSON 对象")
+    location_history = session_data.get('location_history', [])
+    if not isinstance(location_history, list):
+        raise ValueError("location_history 应为数组")
+    for index, point in enumerate(location_history):
+        if not isinstance(point, dict):
+            raise ValueError(f"location_history[{index}] 应为对象")
+        lat, lon = point.get('latitude'), point.get('longitude')
+        if not _is_number(lat) or not _is_number(lon):
+            raise ValueError(f"location_history[{index}] 缺少有效的经纬度")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError(f"location_history[{index}] 经纬度超出有效范围")
+        if point.get('timestamp') is not None and not _is_number(point['timestamp']):
+            raise ValueError(f"location_history[{index}] 的 timestamp 应为数值")
+
+
+# 差分解码：第一个值为绝对值，后续为与前一个值的差
+def _delta_decode(values):
+    decoded = []
+    running = 0
+    for index, value in enumerate(values):
+        running = value if index == 0 else running + value
+        decoded.append(running)
+    return decoded
+
+
+# 把批量上传的列式数据解码为与 /api/save_session_data 相同结构的会话记录
+# 支持两种编码:
+#   'columnar'  : timestamps / latitudes / longitudes 为原始数值数组
+#   'delta-int' : t0 为基准时间戳(毫秒)，timestamps 为相邻差值；
+#                 latitudes / longitudes 为乘以 scale 后取整再差分的整数
+def decode_point_batch(payload):
+    if not isinstance(payload, dict):
+        raise ValueError("批量数据格式错误，应为 JSON 对象")
+
+    encoding = payload.get('encoding', 'columnar')
+    timestamps = _number_array(payload, 'timestamps')
+    latitudes = _number_array(payload, 'latitudes')
+    longitudes = _number_array(payload, 'longitudes')
+
+    if not (len(timestamps) == len(latitudes) == len(longitudes)):
+        raise ValueError("timestamps、latitudes、longitudes 三个数组长度不一致")
+    if len(timestamps) > MAX_POINTS_PER_BATCH:
+        raise ValueError(f"单个批次点数超过上限 {MAX_POINTS_PER_BATCH}")
+
+    if encoding == 'delta-int':
+        scale = payload.get('scale', COORD_SCALE)
+        t0 = payload.get('t0', 0)
+        if not _is_number(scale) or scale == 0:
+            raise ValueError("scale 应为非零数值")
+        if not _is_number(t0):
+            raise ValueError("t0 应为数值")
+        timestamps = [t0 + t for t in _delta_decode(timestamps)]
+        latitudes = [v / scale for v in _delta_decode(latitudes)]
+        longitudes = [v / scale for v in _delta_decode(longitudes)]
+    elif encoding != 'columnar':
+        raise ValueError(f"不支持的批量编码方式: {encoding}")
+
+    if not all(-90 <= lat <= 90 for lat in latitudes) or not all(-180 <= lon <= 180 for lon in longitudes):
+        raise ValueError("经纬度超出有效范围")
+
+    location_history = [
+        {'timestamp': t, 'latitude': lat, 'longitude': lon}
+        for t, lat, lon in zip(timestamps, latitudes, longitudes)
+    ]
+
+    session_data = {
+        'session_id': payload.get('session_id') or str(time.time()),
+        'start_time': payload.get('start_time'),
+        'location_history': location_history,
+        'batch_seq': payload.get('batch_seq'),
+    }
+    if payload.get('end_time'):
+        session_data['end_time'] = payload['end_time']
+    return session_data
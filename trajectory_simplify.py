@@ -0,0 +1,162 @@
+import math
+
+import numpy as np
+
+METERS_PER_DEGREE = 111320.0
+# 光标悬停时的抖动半径：连续落在首点该半径内的采样合并为一个驻留点
+STATIONARY_RADIUS_M = 5.0
+# 路径简化容差：被删除的点到保留线段的距离不超过该值
+PATH_TOLERANCE_M = 10.0
+# 被删除点的权重转移到最近的保留点，两者距离不超过该值；
+# 加上驻留半径，即为每个原始采样在计分时的最大位移 (决定亲近度分数的误差上限)
+MAX_DISPLACEMENT_M = 30.0
+
+
+# 按首点纬度做等距投影，把经纬度换算为米
+def _project_meters(lats, lons):
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    lat0 = lats[0] if len(lats) else 0.0
+    return np.column_stack([
+        (lons - (lons[0] if len(lons) else 0.0)) * METERS_PER_DEGREE * math.cos(math.radians(lat0)),
+        (lats - lat0) * METERS_PER_DEGREE,
+    ])
+
+
+# 单个点权重的上限 (约 29 小时的 100 毫秒采样)，防止异常数值在计分时溢出 int64
+MAX_POINT_WEIGHT = 1 << 20
+# 只能由服务端在简化时写入的字段，客户端上传的同名字段在入库前删除
+SERVER_ASSIGNED_FIELDS = ('weight', 'dwell_ms')
+
+
+# 校验权重：只接受 1 ~ MAX_POINT_WEIGHT 的整数，其余 (缺失、非整数、越界) 按 1 计
+def point_weight(value):
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value <= MAX_POINT_WEIGHT:
+        return 1
+    return value
+
+
+def _point_weight(point):
+    return point_weight(point.get('weight', 1))
+
+
+# 删除客户端上传的 weight / dwell_ms，入库的权重只能来自服务端的简化
+def strip_client_weights(location_history):
+    if not isinstance(location_history, list):
+        return
+    for point in location_history:
+        if isinstance(point, dict):
+            for field in SERVER_ASSIGNED_FIELDS:
+                point.pop(field, None)
+
+
+# 合并驻留点：连续落在首点 radius_m 半径内的采样合并为一个点，
+# 位置取首点，weight 为代表的原始采样数，dwell_ms 为驻留时长 (末点与首点的时间差)
+def collapse_stationary_points(points, radius_m=STATIONARY_RADIUS_M):
+    if not points:
+        return []
+    xy = _project_meters([p['latitude'] for p in points], [p['longitude'] for p in points])
+    collapsed = []
+    anchor = 0
+    for index in range(1, len(points) + 1):
+        if index < len(points) and math.hypot(*(xy[index] - xy[anchor])) <= radius_m:
+            continue
+        run = points[anchor:index]
+        merged = dict(run[0])
+        merged.pop('weight', None)
+        weight = min(MAX_POINT_WEIGHT, sum(_point_weight(p) for p in run))
+        if weight != 1:
+            merged['weight'] = weight
+        if len(run) > 1:
+            first_ts, last_ts = run[0].get('timestamp'), run[-1].get('timestamp')
+            if isinstance(first_ts, (int, float)) and isinstance(last_ts, (int, float)):
+                merged['dwell_ms'] = last_ts + (run[-1].get('dwell_ms') or 0) - first_ts
+        collapsed.append(merged)
+        anchor = index
+    return collapsed
+
+
+# Douglas–Peucker 路径简化，返回保留点的布尔掩码 (首尾两点始终保留)。
+# 与 geo_simplify.douglas_peucker_mask 不同，这里使用到线段 (而非直线) 的距离，
+# 并且当区间内某点到两端较近一端的距离超过 max_displacement_m 时也继续拆分，
+# 保证被删除的点都能就近并入距离不超过 max_displacement_m 的保留点
+def path_simplify_mask(xy, tolerance_m=PATH_TOLERANCE_M, max_displacement_m=MAX_DISPLACEMENT_M):
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = xy[end] - xy[start]
+        offsets = xy[start + 1:end] - xy[start]
+        length_sq = float(segment @ segment)
+        if length_sq == 0.0:
+            t = np.zeros(len(offsets))
+        else:
+            t = np.clip(offsets @ segment / length_sq, 0.0, 1.0)
+        deviation = np.hypot(*(offsets - t[:, None] * segment).T)
+        index = int(np.argmax(deviation))
+        if deviation[index] <= tolerance_m:
+            to_start = np.hypot(*offsets.T)
+            to_end = np.hypot(*(xy[start + 1:end] - xy[end]).T)
+            displacement = np.minimum(to_start, to_end)
+            index = int(np.argmax(displacement))
+            if displacement[index] <= max_displacement_m:
+                continue
+        split = start + 1 + index
+        keep[split] = True
+        stack.append((start, split))
+        stack.append((split, end))
+    return keep
+
+
+# 简化一段轨迹：先合并驻留点，再做路径简化；被删除点的权重 (及驻留时长) 并入距离最近的保留点，
+# 因此简化前后总权重不变。返回 (简化后的点列表, 统计信息)
+def simplify_location_history(location_history, stationary_radius_m=STATIONARY_RADIUS_M,
+                              tolerance_m=PATH_TOLERANCE_M, max_displacement_m=MAX_DISPLACEMENT_M):
+    valid = [p for p in location_history
+             if isinstance(p, dict) and p.get('latitude') is not None and p.get('longitude') is not None]
+    if any(isinstance(p.get('timestamp'), (int, float)) for p in valid):
+        valid.sort(key=lambda p: p.get('timestamp') if isinstance(p.get('timestamp'), (int, float)) else 0)
+    raw_points = sum(_point_weight(p) for p in valid)
+
+    collapsed = collapse_stationary_points(valid, stationary_radius_m)
+    simplified = collapsed
+    if len(collapsed) > 2:
+        xy = _project_meters([p['latitude'] for p in collapsed], [p['longitude'] for p in collapsed])
+        keep = path_simplify_mask(xy, tolerance_m, max_displacement_m)
+        kept_idx = np.flatnonzero(keep)
+        simplified = [dict(collapsed[i]) for i in kept_idx.tolist()]
+        # 每个被删除的点并入所在区间两端中较近的保留点
+        segment = np.searchsorted(kept_idx, np.arange(len(collapsed)), side='right') - 1
+        for index in np.flatnonzero(~keep).tolist():
+            left = int(segment[index])
+            right = left + 1
+            d_left = math.hypot(*(xy[index] - xy[kept_idx[left]]))
+            d_right = math.hypot(*(xy[index] - xy[kept_idx[right]]))
+            target = simplified[left if d_left <= d_right else right]
+            target['weight'] = min(MAX_POINT_WEIGHT, _point_weight(target) + _point_weight(collapsed[index]))
+            if collapsed[index].get('dwell_ms'):
+                target['dwell_ms'] = target.get('dwell_ms', 0) + collapsed[index]['dwell_ms']
+
+    stats = {
+        'raw_points': raw_points,
+        'collapsed_points': len(collapsed),
+        'stored_points': len(simplified),
+        'compression_ratio': raw_points / len(simplified) if simplified else 1.0,
+    }
+    return simplified, stats
+
+
+# 对一条会话记录做入库前的轨迹简化 (原地替换 location_history)，并记录原始点数
+def simplify_session(session_data, stationary_radius_m=STATIONARY_RADIUS_M, tolerance_m=PATH_TOLERANCE_M,
+                     max_displacement_m=MAX_DISPLACEMENT_M):
+    simplified, stats = simplify_location_history(session_data.get('location_history') or [],
+                                                  stationary_radius_m, tolerance_m, max_displacement_m)
+    session_data['location_history'] = simplified
+    session_data['raw_point_count'] = stats['raw_points']
+    return stats
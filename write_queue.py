@@ -0,0 +1,173 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+
+# fsync 策略:
+#   'always'   : 每次组提交后都 fsync，最安全，吞吐最低
+#   'interval' : 距上次 fsync 超过 fsync_interval_s 才 fsync，崩溃时最多丢失该时间窗口内的数据
+#   'never'    : 只 flush 到操作系统缓存，由操作系统决定落盘时机
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+_STOP = object()
+
+
+# 后台单写线程队列：请求处理函数只负责入队并立即返回，
+# 由唯一的写线程把队列中的记录按类型分组，批量(组提交)写入对应的存储
+class WriteBehindQueue:
+    def __init__(self, sinks, maxsize=10000, batch_max_records=500, batch_wait_s=0.05,
+                 fsync_policy='interval', fsync_interval_s=1.0, on_commit=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"未知的 fsync 策略: {fsync_policy}，可选值: {FSYNC_POLICIES}")
+        self.sinks = sinks  # {记录类型: 具有 append_many(records, fsync) 与 sync() 方法的存储}
+        self.maxsize = maxsize
+        self.batch_max_records = batch_max_records
+        self.batch_wait_s = batch_wait_s
+        self.fsync_policy = fsync_policy
+        self.fsync_interval_s = fsync_interval_s
+        self.on_commit = on_commit  # 每次组提交后回调 (批次记录数, 耗时秒数, 是否 fsync)，用于指标统计
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stats_lock = threading.Lock()
+        self._last_fsync = time.time()
+        self._closed = False
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'written': 0,
+            'write_errors': 0,
+            'batches': 0,
+            'fsyncs': 0,
+            'max_queue_depth': 0,
+            'last_batch_size': 0,
+            'last_commit_seconds': 0.0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name='write-behind-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # 非阻塞入队。队列已满时返回 False，由调用方向客户端返回 503 (背压)
+    def submit(self, kind, record):
+        if self._closed:
+            return False
+        if kind not in self.sinks:
+            raise KeyError(f"未注册的记录类型: {kind}")
+        try:
+            self._queue.put_nowait((kind, record))
+        except queue.Full:
+            with self._stats_lock:
+                self._stats['rejected'] += 1
+            return False
+        with self._stats_lock:
+            self._stats['enqueued'] += 1
+            depth = self._queue.qsize()
+            if depth > self._stats['max_queue_depth']:
+                self._stats['max_queue_depth'] = depth
+        return True
+
+    def stats(self):
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot['queue_depth'] = self._queue.qsize()
+        snapshot['queue_capacity'] = self.maxsize
+        snapshot['fsync_policy'] = self.fsync_policy
+        return snapshot
+
+    # 收集一批记录：阻塞等待第一条，之后在 batch_wait_s 内尽量多取，最多 batch_max_records 条
+    def _collect_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        if first is _STOP:
+            return batch
+        deadline = time.time() + self.batch_wait_s
+        while len(batch) < self.batch_max_records:
+            remaining = deadline - time.time()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is _STOP:
+                break
+        return batch
+
+    def _should_fsync(self):
+        if self.fsync_policy == 'always':
+            return True
+        if self.fsync_policy == 'interval':
+            return time.time() - self._last_fsync >= self.fsync_interval_s
+        return False
+
+    def _commit(self, items):
+        grouped = {}
+        for kind, record in items:
+            grouped.setdefault(kind, []).append(record)
+
+        start_time = time.time()
+        fsync = self._should_fsync()
+        written = 0
+        for kind, records in grouped.items():
+            try:
+                self.sinks[kind].append_many(records, fsync=fsync)
+                written += len(records)
+            except Exception as e:
+                print(f"后台写入 '{kind}' 记录失败 ({len(records)} 条): {e}")
+                traceback.print_exc()
+                with self._stats_lock:
+                    self._stats['write_errors'] += len(records)
+        if fsync:
+            self._last_fsync = time.time()
+
+        commit_seconds = time.time() - start_time
+        with self._stats_lock:
+            self._stats['written'] += written
+            self._stats['batches'] += 1
+            self._stats['last_batch_size'] = len(items)
+            self._stats['last_commit_seconds'] = commit_seconds
+            if fsync:
+                self._stats['fsyncs'] += 1
+        if self.on_commit is not None:
+            # 指标回调出错不能影响写入线程，否则之后提交的记录只会堆积在队列中
+            try:
+                self.on_commit(len(items), commit_seconds, fsync)
+            except Exception as e:
+                print(f"写入队列的提交回调失败: {e}")
+                traceback.print_exc()
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            stop = batch[-1] is _STOP
+            items = [item for item in batch if item is not _STOP]
+            if items:
+                self._commit(items)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    # 阻塞直到当前队列中的记录全部写完
+    def flush(self):
+        self._queue.join()
+
+    # 停机时调用：停止接收新记录，写完剩余记录并强制落盘
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        for sink in self.sinks.values():
+            try:
+                sink.sync()
+            except Exception as e:
+                print(f"停机时同步存储失败: {e}")
+        print(f"后台写入队列已关闭，共写入 {self.stats()['written']} 条记录。")
+
+
+def fsync_policy_from_env(default='interval'):
+    policy = os.environ.get('WRITE_FSYNC_POLICY', default)
+    return policy if policy in FSYNC_POLICIES else default